@@ -7,11 +7,20 @@ from src.apps.accounts.serializers import UserAccountOutputSerializer
 
 class UserAccountViewSet(viewsets.ReadOnlyModelViewSet):
 
-    queryset = UserAccount.objects.all()
+    queryset = UserAccount.objects.select_related("user").only(
+        "id",
+        "membership_type",
+        "created_at",
+        "updated_at",
+        "user__username",
+        "user__first_name",
+        "user__last_name",
+        "user__email",
+    )
     serializer_class = UserAccountOutputSerializer
 
     def get_queryset(self):
-        qs = self.queryset
+        qs = self.queryset.all()
         user = self.request.user
         if user.is_superuser:
             return qs
@@ -1,9 +1,20 @@
 from django.contrib import admin
 
-from src.apps.images.models import Image, ImageAccessToken, Thumbnail, ThumbnailSize
+from src.apps.images.models import (
+    Image,
+    ImageAccessToken,
+    RevokedAccessToken,
+    Thumbnail,
+    ThumbnailJob,
+    ThumbnailSize,
+    UploadSession,
+)
 
 
 admin.site.register(Image)
 admin.site.register(ThumbnailSize)
 admin.site.register(Thumbnail)
 admin.site.register(ImageAccessToken)
+admin.site.register(ThumbnailJob)
+admin.site.register(RevokedAccessToken)
+admin.site.register(UploadSession)
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class ImagesConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "src.apps.images"
+
+    def ready(self):
+        from src.apps.images import signals  # noqa: F401
@@ -0,0 +1,280 @@
+import resource
+import statistics
+import time
+from typing import Callable, NamedTuple, Optional
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from PIL import Image
+from rest_framework.test import APIClient
+
+from src.apps.accounts.models import UserAccount
+from src.apps.images.models import Image as ImageModel, Thumbnail, ThumbnailSize
+from src.apps.images.services import ImageService, TemporaryLinkService
+from src.apps.memberships.models import MembershipType
+
+User = get_user_model()
+
+RESOLUTIONS = ((640, 480), (1920, 1080), (4000, 3000))
+FORMATS = ("JPEG", "PNG")
+PAGE_SIZES = (10, 50, 100)
+# differences smaller than this are noise, whatever the tolerance
+TIME_NOISE_FLOOR = 0.0005  # seconds
+RSS_NOISE_FLOOR = 1024  # KiB
+
+
+class BenchmarkCase(NamedTuple):
+    name: str
+    run: Callable[[], None]
+    # called before every repeat, not timed
+    setup: Optional[Callable[[], None]] = None
+    # calls per repeat, for operations too fast to time one by one
+    iterations: int = 1
+
+
+class BenchmarkResult(NamedTuple):
+    wall: float
+    cpu: float
+    # peak RSS over the RSS at the start of one run
+    rss_growth_kb: int
+    queries: int
+
+
+def generate_image(format: str, size: tuple[int]) -> ContentFile:
+    """
+    Noise over gradients, compressed about as well as a photo. Every call
+    returns different content, so uploads are never deduplicated.
+    """
+    noise = Image.effect_noise(size, 32)
+    gradient = Image.linear_gradient("L").resize(size)
+    image = Image.merge(
+        "RGB",
+        (
+            noise,
+            gradient,
+            gradient.transpose(Image.Transpose.FLIP_LEFT_RIGHT),
+        ),
+    )
+    content = ContentFile(b"", name=f"benchmark.{format.lower()}")
+    image.save(content, format)
+    content.seek(0)
+    return content
+
+
+def reset_peak_rss() -> None:
+    # Linux only, the peak becomes the current RSS
+    try:
+        with open("/proc/self/clear_refs", "w") as file:
+            file.write("5")
+    except OSError:
+        pass
+
+
+def get_rss_kb() -> tuple[int, int]:
+    """
+    Current and peak RSS of the process. Without ``/proc`` both are the
+    peak, which cannot be reset, so only growth past the peak of earlier
+    cases shows up.
+    """
+    try:
+        with open("/proc/self/status") as file:
+            status = dict(line.split(":", 1) for line in file)
+        return int(status["VmRSS"].split()[0]), int(status["VmHWM"].split()[0])
+    except OSError:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak, peak
+
+
+def measure(case: BenchmarkCase, repeat: int) -> BenchmarkResult:
+    """
+    Median wall time, CPU time and RSS growth of one run over ``repeat``
+    runs, and the queries made by one call. The peak RSS is reset before
+    every run, so a case's memory does not depend on the cases before it.
+    """
+    walls, cpus, rss_growths = [], [], []
+    queries = 0
+    for _ in range(repeat):
+        if case.setup is not None:
+            case.setup()
+        reset_peak_rss()
+        start_rss, _ = get_rss_kb()
+        with CaptureQueriesContext(connection) as context:
+            wall, cpu = time.perf_counter(), time.process_time()
+            for _ in range(case.iterations):
+                case.run()
+            walls.append((time.perf_counter() - wall) / case.iterations)
+            cpus.append((time.process_time() - cpu) / case.iterations)
+        _, peak_rss = get_rss_kb()
+        rss_growths.append(max(peak_rss - start_rss, 0))
+        queries = len(context.captured_queries) // case.iterations
+    return BenchmarkResult(
+        wall=statistics.median(walls),
+        cpu=statistics.median(cpus),
+        rss_growth_kb=statistics.median(rss_growths),
+        queries=queries,
+    )
+
+
+def get_thumbnail_cases(user_account: UserAccount) -> list[BenchmarkCase]:
+    sizes = list(user_account.membership_type.thumbnail_sizes.all())
+    cases = []
+    for format in FORMATS:
+        for width, height in RESOLUTIONS:
+            label = f"{format.lower()}-{width}x{height}"
+            image_model = ImageModel.objects.create(
+                title=label,
+                uploaded_by=user_account,
+                image=generate_image(format, (width, height)),
+            )
+            cases.append(
+                BenchmarkCase(
+                    name=f"create_thumbnails[{label}]",
+                    setup=lambda image_model=image_model: Thumbnail.objects.filter(
+                        image=image_model
+                    ).delete(),
+                    run=lambda image_model=image_model: ImageService.create_thumbnails(
+                        image_model=image_model, thumbnail_sizes=sizes
+                    ),
+                )
+            )
+
+            upload = {}
+            cases.append(
+                BenchmarkCase(
+                    name=f"upload_image[{label}]",
+                    setup=lambda upload=upload, size=(width, height), format=format: (
+                        upload.update(image=generate_image(format, size))
+                    ),
+                    run=lambda upload=upload, label=label: ImageService.upload_image(
+                        data={"title": label, "image": upload["image"]},
+                        user_account=user_account,
+                    ),
+                )
+            )
+    return cases
+
+
+def get_list_cases(user_account: UserAccount) -> list[BenchmarkCase]:
+    heights = user_account.membership_type.thumbnail_sizes.values_list(
+        "height", flat=True
+    )
+    for index in range(max(PAGE_SIZES)):
+        image_model = ImageModel.objects.create(
+            title=f"list {index}",
+            uploaded_by=user_account,
+            image=f"images/list-{index}.jpeg",
+            width=1920,
+            height=1080,
+        )
+        Thumbnail.objects.bulk_create(
+            Thumbnail(
+                image=image_model,
+                thumbnail=f"thumbnails/list-{index}-{height}.jpeg",
+                width=height * 16 // 9,
+                height=height,
+            )
+            for height in heights
+        )
+
+    client = APIClient()
+    client.force_login(user_account.user)
+    url = reverse("images:image-list")
+    return [
+        BenchmarkCase(
+            name=f"list_images[page_size={page_size}]",
+            # measure serialization, not the response cache
+            setup=cache.clear,
+            run=lambda page_size=page_size: client.get(url, {"page_size": page_size}),
+        )
+        for page_size in PAGE_SIZES
+    ]
+
+
+def get_temporary_link_cases(user_account: UserAccount) -> list[BenchmarkCase]:
+    image_model = ImageModel.objects.filter(uploaded_by=user_account).first()
+    data = {"seconds": 300}
+    token = TemporaryLinkService.create_access_token(image_id=image_model.id, data=data)
+    signed_token = TemporaryLinkService.create_access_token(
+        image_id=image_model.id, data={**data, "signed": True}
+    )
+    return [
+        BenchmarkCase(
+            name="resolve_temporary_link",
+            run=lambda: TemporaryLinkService.get_image_from_token(
+                access_token_id=token.id
+            ),
+            iterations=100,
+        ),
+        BenchmarkCase(
+            name="resolve_signed_temporary_link",
+            run=lambda: TemporaryLinkService.get_image_name_from_signed_token(
+                token=signed_token.token
+            ),
+            iterations=1000,
+        ),
+    ]
+
+
+def create_user_account(username: str) -> UserAccount:
+    membership_type = MembershipType.objects.create(
+        name=username, contains_original_link=True, generates_expiring_link=True
+    )
+    membership_type.thumbnail_sizes.add(
+        ThumbnailSize.objects.get_or_create(height=200)[0],
+        ThumbnailSize.objects.get_or_create(height=400)[0],
+    )
+    return UserAccount.objects.create(
+        user=User.objects.create(username=username), membership_type=membership_type
+    )
+
+
+def get_benchmark_cases() -> list[BenchmarkCase]:
+    """
+    Creates the benchmark data, uploads and lists use separate users so the
+    listed page does not depend on how many uploads ran before it.
+    """
+    upload_account = create_user_account("benchmark-upload")
+    list_account = create_user_account("benchmark-list")
+    return [
+        *get_thumbnail_cases(upload_account),
+        *get_list_cases(list_account),
+        *get_temporary_link_cases(list_account),
+    ]
+
+
+def compare_results(
+    results: dict[str, dict], baseline: dict[str, dict], tolerance: float
+) -> list[str]:
+    """
+    Describes every metric worse than in ``baseline`` by more than
+    ``tolerance`` (a fraction). Any additional query is a regression.
+    Metrics missing from ``baseline`` are not compared.
+    """
+    regressions = []
+    for name, result in results.items():
+        previous = baseline.get(name)
+        if previous is None:
+            continue
+        for metric, noise_floor in (
+            ("wall", TIME_NOISE_FLOOR),
+            ("cpu", TIME_NOISE_FLOOR),
+            ("rss_growth_kb", RSS_NOISE_FLOOR),
+        ):
+            if metric not in previous:
+                continue
+            limit = max(
+                previous[metric] * (1 + tolerance), previous[metric] + noise_floor
+            )
+            if result[metric] > limit:
+                regressions.append(
+                    f"{name}: {metric} {previous[metric]:g} -> {result[metric]:g}"
+                )
+        if result["queries"] > previous["queries"]:
+            regressions.append(
+                f"{name}: queries {previous['queries']} -> {result['queries']}"
+            )
+    return regressions
@@ -0,0 +1,152 @@
+import fcntl
+import os
+import threading
+import time
+from contextlib import contextmanager
+from tempfile import NamedTemporaryFile
+from typing import BinaryIO, Callable, Iterator, Optional
+
+from django.conf import settings
+
+
+class DerivativeCache:
+    """
+    Disk cache of derivatives rendered on demand, bounded by total size.
+
+    Reading an entry refreshes its modification time, at most once per
+    ``touch_interval``, eviction removes the least recently used entries first.
+    Rendering a missing entry holds an exclusive ``flock`` on a per-entry lock
+    file, so concurrent requests for the same derivative, from any worker
+    process on the host, render it once.
+
+    The directory is only scanned when the running size total, taken by the
+    previous scan plus what this process wrote since, goes over ``max_size``
+    or is older than ``scan_interval``, which accounts for the writes of
+    other processes. Eviction then goes down to ``low_water`` of the limit.
+    """
+
+    lock_suffix = ".lock"
+    touch_interval = 60  # seconds
+    scan_interval = 300  # seconds
+    low_water = 0.9
+
+    def __init__(self, directory: str, max_size: int) -> None:
+        self.directory = directory
+        self.max_size = max_size
+        self._size = None
+        self._scanned_at = 0.0
+        self._size_lock = threading.Lock()
+
+    @classmethod
+    def from_settings(cls) -> "DerivativeCache":
+        key = (settings.DERIVATIVE_CACHE_DIR, settings.DERIVATIVE_CACHE_MAX_SIZE)
+        # one instance per process, it holds the running size total
+        with _caches_lock:
+            if key not in _caches:
+                _caches[key] = cls(directory=key[0], max_size=key[1])
+            return _caches[key]
+
+    def get_path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], key)
+
+    def _open(self, path: str) -> BinaryIO:
+        file = open(path, "rb")
+        if os.fstat(file.fileno()).st_mtime < time.time() - self.touch_interval:
+            os.utime(path)
+        return file
+
+    @contextmanager
+    def _lock(self, path: str) -> Iterator[None]:
+        with open(path + self.lock_suffix, "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _write(self, path: str, content: bytes) -> None:
+        with NamedTemporaryFile(
+            dir=os.path.dirname(path), prefix=".", delete=False
+        ) as file:
+            file.write(content)
+        os.replace(file.name, path)
+
+    def get(self, key: str) -> Optional[BinaryIO]:
+        try:
+            return self._open(self.get_path(key))
+        except FileNotFoundError:
+            return None
+
+    def open(self, key: str, render: Callable[[], bytes]) -> BinaryIO:
+        path = self.get_path(key)
+        try:
+            return self._open(path)
+        except FileNotFoundError:
+            pass
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self._lock(path):
+            # another process might have rendered it while we were waiting
+            try:
+                return self._open(path)
+            except FileNotFoundError:
+                content = render()
+                self._write(path, content)
+                file = self._open(path)
+        if self._add_size(len(content)):
+            self.evict()
+        return file
+
+    def _add_size(self, size: int) -> bool:
+        """
+        Adds a written entry to the running total, returns whether the
+        directory needs to be scanned.
+        """
+        with self._size_lock:
+            if self._size is None or (
+                self._scanned_at < time.monotonic() - self.scan_interval
+            ):
+                return True
+            self._size += size
+            return self._size > self.max_size
+
+    def evict(self) -> int:
+        entries = []
+        total_size = 0
+        for shard in os.scandir(self.directory):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                if (
+                    entry.name.startswith(".")
+                    or entry.name.endswith(self.lock_suffix)
+                    or not entry.is_file()
+                ):
+                    continue
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                total_size += stat.st_size
+
+        removed = 0
+        target_size = self.max_size
+        if total_size > self.max_size:
+            target_size = self.max_size * self.low_water
+        for _, size, path in sorted(entries):
+            if total_size <= target_size:
+                break
+            for filepath in (path, path + self.lock_suffix):
+                try:
+                    os.remove(filepath)
+                except FileNotFoundError:
+                    pass
+            total_size -= size
+            removed += 1
+
+        with self._size_lock:
+            self._size = total_size
+            self._scanned_at = time.monotonic()
+        return removed
+
+
+_caches: dict[tuple[str, int], DerivativeCache] = {}
+_caches_lock = threading.Lock()
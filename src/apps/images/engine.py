@@ -0,0 +1,267 @@
+import os
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from typing import Iterable, Iterator, NamedTuple, Optional
+from uuid import UUID
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.utils import timezone
+
+from src.apps.images.models import Image as ImageModel, Thumbnail, ThumbnailSize
+from src.apps.images.rendering import (
+    RenderedThumbnail,
+    RenderProfile,
+    RenderResult,
+    ImageSummary,
+    RenderTask,
+    get_cascade_summary,
+    render_task,
+)
+from src.apps.images.response_cache import bump_image_owner_versions
+from src.apps.images.similarity import DHASH_FIELDS, store_image_hashes
+from src.apps.images.utils import get_thumbnail_dimensions, get_thumbnail_filename
+
+
+def get_render_profiles() -> dict[int, RenderProfile]:
+    """
+    Render profiles of all thumbnail sizes by height, a tiny table.
+    """
+    return {
+        size.height: size.get_render_profile() for size in ThumbnailSize.objects.all()
+    }
+
+
+def build_thumbnail(
+    image_id: UUID, name: str, extension: str, rendered: RenderedThumbnail
+) -> Thumbnail:
+    """
+    Stores the files of a rendered thumbnail, variants included, and returns
+    the unsaved ``Thumbnail``. Inserting the row does not write any file.
+    """
+    variants = {}
+    for format, content in rendered.variants:
+        variant_extension = format.lower()
+        variant_name = default_storage.save(
+            os.path.join(
+                "thumbnails",
+                get_thumbnail_filename(
+                    name=name, extension=variant_extension, size=rendered.size
+                ),
+            ),
+            ContentFile(content),
+        )
+        variants[variant_extension] = {"name": variant_name, "size": len(content)}
+
+    thumbnail_name = default_storage.save(
+        os.path.join(
+            "thumbnails",
+            get_thumbnail_filename(name=name, extension=extension, size=rendered.size),
+        ),
+        ContentFile(rendered.content),
+    )
+    return Thumbnail(
+        image_id=image_id,
+        thumbnail=thumbnail_name,
+        width=rendered.width,
+        height=rendered.height,
+        variants=variants,
+    )
+
+
+def delete_thumbnail_files(thumbnails: Iterable[Thumbnail]) -> None:
+    """
+    Deletes the files stored by ``build_thumbnail`` for thumbnails whose
+    rows could not be inserted.
+    """
+    for thumbnail in thumbnails:
+        default_storage.delete(thumbnail.thumbnail.name)
+        for variant in thumbnail.variants.values():
+            default_storage.delete(variant["name"])
+
+
+def store_image_summaries(summaries: dict[UUID, Optional[ImageSummary]]) -> None:
+    summaries = {
+        image_id: summary
+        for image_id, summary in summaries.items()
+        if summary is not None
+    }
+    ImageModel.objects.bulk_update(
+        [
+            ImageModel(
+                id=image_id,
+                placeholder=summary.placeholder,
+                dominant_color=summary.dominant_color,
+            )
+            for image_id, summary in summaries.items()
+        ],
+        fields=["placeholder", "dominant_color"],
+    )
+    store_image_hashes(
+        {image_id: summary.dhash for image_id, summary in summaries.items()}
+    )
+
+
+def copy_image_summaries(
+    images: Iterable[ImageModel], sources: Iterable[ImageModel]
+) -> None:
+    """
+    Exact duplicates share the summary of the image they were copied from,
+    once it has one.
+    """
+    sources = {image.id: source.id for image, source in zip(images, sources)}
+    summaries = {
+        source.id: ImageSummary(
+            dhash=source.dhash,
+            placeholder=source.placeholder,
+            dominant_color=source.dominant_color,
+        )
+        for source in ImageModel.objects.filter(id__in=set(sources.values())).only(
+            "id", "placeholder", "dominant_color", *DHASH_FIELDS
+        )
+        if source.dhash is not None
+    }
+    store_image_summaries(
+        {image_id: summaries.get(source_id) for image_id, source_id in sources.items()}
+    )
+
+
+class RenderStats(NamedTuple):
+    images: int
+    thumbnails: int
+    errors: dict
+
+
+class RenderEngine:
+    """
+    Renders thumbnails of many images in parallel.
+
+    Worker processes receive ``RenderTask`` tuples (a file path and the
+    requested sizes) and send back encoded thumbnails, the parent process
+    stores the files and inserts ``Thumbnail`` rows in batches.
+    """
+
+    def __init__(
+        self,
+        workers: Optional[int] = None,
+        batch_size: Optional[int] = None,
+        replace: bool = False,
+    ) -> None:
+        self.workers = workers or os.cpu_count() or 1
+        self.batch_size = batch_size or settings.THUMBNAIL_ENGINE_BATCH_SIZE
+        # delete the previous thumbnails of every successfully rendered image
+        self.replace = replace
+
+    @staticmethod
+    def build_task(
+        image_model: ImageModel,
+        heights: Iterable[int],
+        profiles: Optional[dict[int, RenderProfile]] = None,
+    ) -> RenderTask:
+        image_filename = os.path.basename(image_model.image.name)
+        name, extension = image_filename.split(".")
+        sizes = {
+            get_thumbnail_dimensions(
+                image_height=image_model.height,
+                image_width=image_model.width,
+                thumbnail_height=height,
+            )
+            for height in heights
+        }
+        return RenderTask(
+            image_id=image_model.id,
+            source_path=image_model.image.path,
+            name=name,
+            extension=extension,
+            sizes=tuple(sizes),
+            variant_formats=tuple(settings.THUMBNAIL_VARIANT_FORMATS),
+            profiles=profiles,
+        )
+
+    def render(self, tasks: Iterable[RenderTask]) -> Iterator[RenderResult]:
+        if self.workers == 1:
+            yield from map(render_task, tasks)
+            return
+
+        # keep a bounded number of tasks in flight so huge backfills
+        # do not have to be materialized up front
+        max_pending = self.workers * 2
+        with ProcessPoolExecutor(max_workers=self.workers) as executor:
+            pending = set()
+            for task in tasks:
+                pending.add(executor.submit(render_task, task))
+                if len(pending) >= max_pending:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        yield future.result()
+            for future in pending:
+                yield future.result()
+
+    def _build_thumbnails(
+        self, task: RenderTask, result: RenderResult
+    ) -> list[Thumbnail]:
+        return [
+            build_thumbnail(
+                image_id=result.image_id,
+                name=task.name,
+                extension=task.extension,
+                rendered=rendered,
+            )
+            for rendered in result.thumbnails
+        ]
+
+    def _save(self, thumbnails: list[Thumbnail], summaries: dict) -> int:
+        try:
+            return self._save_rows(thumbnails, summaries)
+        except Exception:
+            # the files were stored when the thumbnails were built
+            delete_thumbnail_files(thumbnails)
+            raise
+
+    @transaction.atomic
+    def _save_rows(self, thumbnails: list[Thumbnail], summaries: dict) -> int:
+        thumbnails = Thumbnail.objects.bulk_create(thumbnails)
+        # only images rendered without error have summaries, a failed or
+        # interrupted run keeps the old thumbnails
+        image_ids = set(summaries)
+        if self.replace:
+            Thumbnail.objects.filter(image_id__in=image_ids).exclude(
+                id__in=[thumbnail.id for thumbnail in thumbnails]
+            ).delete()
+        store_image_summaries(summaries)
+        ImageModel.objects.filter(id__in=image_ids).update(updated_at=timezone.now())
+        bump_image_owner_versions(image_ids)
+        return len(thumbnails)
+
+    def run(self, tasks: Iterable[RenderTask]) -> RenderStats:
+        tasks_by_image = {}
+
+        def track(tasks):
+            for task in tasks:
+                tasks_by_image[task.image_id] = task
+                yield task
+
+        images_count = thumbnails_count = 0
+        errors = {}
+        batch = []
+        summaries = {}
+        for result in self.render(track(tasks)):
+            task = tasks_by_image.pop(result.image_id)
+            if result.error:
+                errors[result.image_id] = result.error
+                continue
+
+            images_count += 1
+            batch.extend(self._build_thumbnails(task=task, result=result))
+            summaries[result.image_id] = get_cascade_summary(result.thumbnails)
+            if len(batch) >= self.batch_size:
+                thumbnails_count += self._save(batch, summaries)
+                batch = []
+                summaries = {}
+
+        if summaries:
+            thumbnails_count += self._save(batch, summaries)
+        return RenderStats(
+            images=images_count, thumbnails=thumbnails_count, errors=errors
+        )
@@ -4,3 +4,11 @@ class UnsupportedFileExtension(Exception):
 
 class InvalidImageAccessToken(Exception):
     pass
+
+
+class InvalidUploadChunk(Exception):
+    pass
+
+
+class IncompleteUpload(Exception):
+    pass
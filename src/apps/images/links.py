@@ -0,0 +1,82 @@
+import time
+from datetime import datetime, timezone as dt_timezone
+from uuid import UUID
+
+from django.conf import settings
+from django.core import signing
+from django.utils import timezone
+
+from src.apps.images.exceptions import InvalidImageAccessToken
+from src.apps.images.models import RevokedAccessToken
+
+
+class SignedAccessToken:
+    """
+    Temporary link which carries the image id, its file name and the expiry
+    date, HMAC-signed with ``SECRET_KEY``. Validating it needs no query.
+    """
+
+    __slots__ = ("token", "image_id", "image_name", "expires")
+
+    signer = signing.Signer(salt="images.temporary-link")
+
+    def __init__(
+        self, token: str, image_id: UUID, image_name: str, expires: datetime
+    ) -> None:
+        self.token = token
+        self.image_id = image_id
+        self.image_name = image_name
+        self.expires = expires
+
+    @property
+    def signature(self) -> str:
+        return self.token.rsplit(self.signer.sep, 1)[1]
+
+    @classmethod
+    def create(
+        cls, image_id: UUID, image_name: str, expires: datetime
+    ) -> "SignedAccessToken":
+        token = cls.signer.sign_object(
+            {"i": image_id.hex, "n": image_name, "e": int(expires.timestamp())},
+            compress=True,
+        )
+        return cls(
+            token=token, image_id=image_id, image_name=image_name, expires=expires
+        )
+
+    @classmethod
+    def load(cls, token: str) -> "SignedAccessToken":
+        try:
+            payload = cls.signer.unsign_object(token)
+        except signing.BadSignature:
+            raise InvalidImageAccessToken("Invalid access token")
+        return cls(
+            token=token,
+            image_id=UUID(payload["i"]),
+            image_name=payload["n"],
+            expires=datetime.fromtimestamp(payload["e"], tz=dt_timezone.utc),
+        )
+
+
+# signatures of revoked, not yet expired tokens, local to the process
+_revoked = {"signatures": frozenset(), "refresh_at": 0.0}
+
+
+def is_revoked(signature: str) -> bool:
+    """
+    Revocations are reloaded at most every ACCESS_TOKEN_REVOCATIONS_REFRESH
+    seconds, or right after one is saved in this process.
+    """
+    now = time.monotonic()
+    if now >= _revoked["refresh_at"]:
+        _revoked["signatures"] = frozenset(
+            RevokedAccessToken.objects.filter(expires__gte=timezone.now()).values_list(
+                "signature", flat=True
+            )
+        )
+        _revoked["refresh_at"] = now + settings.ACCESS_TOKEN_REVOCATIONS_REFRESH
+    return signature in _revoked["signatures"]
+
+
+def clear_revocations() -> None:
+    _revoked["refresh_at"] = 0.0
@@ -0,0 +1,357 @@
+import asyncio
+import json
+import math
+import random
+import statistics
+import time
+from collections import defaultdict
+from typing import NamedTuple, Optional
+from urllib.parse import urlsplit
+
+import h11
+from django.contrib.auth import get_user_model
+from django.test.client import BOUNDARY, MULTIPART_CONTENT, encode_multipart
+
+from src.apps.accounts.models import UserAccount
+from src.apps.images.benchmarks import generate_image
+from src.apps.images.models import Image as ImageModel
+from src.apps.memberships.models import MembershipType
+
+User = get_user_model()
+
+ENDPOINTS = ("list", "detail", "upload", "generate-link", "temporary-link")
+DEFAULT_MIX = "list=50,detail=30,upload=5,generate-link=5,temporary-link=10"
+UPLOAD_SIZE = (640, 480)
+LINK_SECONDS = 300
+
+
+class LoadTestUser(NamedTuple):
+    username: str
+    can_generate_links: bool
+
+
+class Response(NamedTuple):
+    status: int
+    content: bytes
+
+    def json(self):
+        return json.loads(self.content)
+
+
+def parse_mix(value: str) -> dict[str, int]:
+    """
+    Parses ``"list=50,detail=30"`` into request weights by endpoint.
+    """
+    mix = {}
+    for item in value.split(","):
+        endpoint, _, weight = item.strip().partition("=")
+        if endpoint not in ENDPOINTS:
+            raise ValueError(
+                f"Unknown endpoint {endpoint!r}, use {', '.join(ENDPOINTS)}"
+            )
+        mix[endpoint] = int(weight or 1)
+    return mix
+
+
+def create_fixture_users(fixtures_path: str, password: str) -> list[LoadTestUser]:
+    """
+    One user per membership type of the fixture file, so every serializer
+    and permission path gets load.
+    """
+    with open(fixtures_path) as file:
+        fixtures = json.load(file)
+    membership_ids = [
+        fixture["pk"]
+        for fixture in fixtures
+        if fixture["model"] == "memberships.membershiptype"
+    ]
+    users = []
+    for membership_type in MembershipType.objects.filter(id__in=membership_ids):
+        user, _ = User.objects.get_or_create(
+            username=f"loadtest-{membership_type.name.lower()}"
+        )
+        user.set_password(password)
+        user.save(update_fields=["password"])
+        UserAccount.objects.update_or_create(
+            user=user, defaults={"membership_type": membership_type}
+        )
+        users.append(
+            LoadTestUser(
+                username=user.username,
+                can_generate_links=membership_type.generates_expiring_link,
+            )
+        )
+    return users
+
+
+def delete_fixture_users(users: list[LoadTestUser]) -> None:
+    """
+    Deletes the load test users with the images they uploaded, the files go
+    with the images.
+    """
+    usernames = [user.username for user in users]
+    ImageModel.objects.filter(uploaded_by__user__username__in=usernames).delete()
+    User.objects.filter(username__in=usernames).delete()
+
+
+def get_percentile(values: list[float], fraction: float) -> float:
+    """
+    Nearest-rank percentile of sorted ``values``.
+    """
+    index = max(0, math.ceil(len(values) * fraction) - 1)
+    return values[index]
+
+
+def summarize(
+    latencies: dict[str, list[float]], errors: dict[str, int], seconds: float
+) -> dict[str, dict]:
+    summary = {}
+    for endpoint in ENDPOINTS:
+        values = sorted(latencies.get(endpoint, []))
+        if not values and not errors.get(endpoint):
+            continue
+        summary[endpoint] = {
+            "requests": len(values),
+            "errors": errors.get(endpoint, 0),
+            "throughput": len(values) / seconds,
+            "mean": statistics.mean(values) if values else None,
+            "p50": get_percentile(values, 0.5) if values else None,
+            "p95": get_percentile(values, 0.95) if values else None,
+            "p99": get_percentile(values, 0.99) if values else None,
+        }
+    return summary
+
+
+class HTTPConnection:
+    """
+    A keep-alive HTTP/1.1 connection, requests are sent one at a time.
+    """
+
+    def __init__(self, url: str):
+        parts = urlsplit(url)
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.reader = self.writer = self.connection = None
+
+    async def connect(self) -> None:
+        await self.close()
+        self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        self.connection = h11.Connection(h11.CLIENT)
+
+    async def close(self) -> None:
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = self.connection = None
+
+    async def request(
+        self,
+        method: str,
+        target: str,
+        headers: Optional[list[tuple[str, str]]] = None,
+        body: bytes = b"",
+    ) -> Response:
+        if self.connection is None or self.connection.our_state is not h11.IDLE:
+            await self.connect()
+        headers = [
+            ("Host", f"{self.host}:{self.port}"),
+            ("Content-Length", str(len(body))),
+            *(headers or []),
+        ]
+        # one write, headers and body in separate segments would wait on
+        # Nagle's algorithm and delayed ACKs
+        self.writer.write(
+            b"".join(
+                self.connection.send(event)
+                for event in (
+                    h11.Request(method=method, target=target, headers=headers),
+                    h11.Data(data=body),
+                    h11.EndOfMessage(),
+                )
+            )
+        )
+        await self.writer.drain()
+
+        status, content = None, []
+        while True:
+            event = self.connection.next_event()
+            if event is h11.NEED_DATA:
+                self.connection.receive_data(await self.reader.read(64 * 1024))
+            elif isinstance(event, h11.Response):
+                status = event.status_code
+            elif isinstance(event, h11.Data):
+                content.append(event.data)
+            elif isinstance(event, h11.EndOfMessage):
+                break
+            elif isinstance(event, h11.ConnectionClosed):
+                await self.close()
+                raise ConnectionError("Connection closed by the server")
+
+        if self.connection.our_state is h11.DONE and (
+            self.connection.their_state is h11.DONE
+        ):
+            self.connection.start_next_cycle()
+        else:
+            await self.close()
+        return Response(status=status, content=b"".join(content))
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        # paths of generated temporary links, fetched anonymously by every client
+        self.links = []
+
+
+class LoadTestClient:
+    def __init__(self, url: str, user: LoadTestUser, password: str, recorder: Recorder):
+        self.http = HTTPConnection(url)
+        self.user = user
+        self.password = password
+        self.recorder = recorder
+        self.access_token = None
+        self.image_ids = []
+
+    async def send(
+        self,
+        method: str,
+        target: str,
+        data: Optional[dict] = None,
+        files: Optional[dict] = None,
+        authenticated: bool = True,
+    ) -> Response:
+        headers, body = [], b""
+        if files:
+            headers.append(("Content-Type", MULTIPART_CONTENT))
+            body = encode_multipart(BOUNDARY, {**(data or {}), **files})
+        elif data is not None:
+            headers.append(("Content-Type", "application/json"))
+            body = json.dumps(data).encode()
+        if authenticated:
+            headers.append(("Authorization", f"Bearer {self.access_token}"))
+        return await self.http.request(method, target, headers=headers, body=body)
+
+    async def login(self) -> None:
+        response = await self.send(
+            "POST",
+            "/api/login/",
+            data={"username": self.user.username, "password": self.password},
+            authenticated=False,
+        )
+        if response.status != 200:
+            raise ConnectionError(
+                f"Could not log in {self.user.username}: HTTP {response.status}"
+            )
+        self.access_token = response.json()["access_token"]
+
+    async def prepare(self) -> None:
+        await self.login()
+        response = await self.send("GET", "/api/images/?page_size=100")
+        self.image_ids = [image["id"] for image in response.json()["results"]]
+        if not self.image_ids:
+            response = await self.upload()
+            if not self.image_ids:
+                raise ConnectionError(
+                    f"Could not upload an image for {self.user.username}: "
+                    f"HTTP {response.status}"
+                )
+
+    def get_mix(self, mix: dict[str, int]) -> dict[str, int]:
+        if self.user.can_generate_links:
+            return mix
+        return {
+            endpoint: weight
+            for endpoint, weight in mix.items()
+            if endpoint != "generate-link"
+        }
+
+    async def upload(self) -> Response:
+        image = await asyncio.to_thread(generate_image, "JPEG", UPLOAD_SIZE)
+        response = await self.send(
+            "POST", "/api/images/", data={"title": "loadtest"}, files={"image": image}
+        )
+        if response.status in (201, 202):
+            self.image_ids.append(response.json()["id"])
+        return response
+
+    async def generate_link(self) -> Response:
+        image_id = random.choice(self.image_ids)
+        response = await self.send(
+            "POST",
+            f"/api/images/{image_id}/generate-temporary-link/",
+            data={"seconds": LINK_SECONDS},
+        )
+        if response.status == 201:
+            self.recorder.links.append(urlsplit(response.json()["img_url"]).path)
+        return response
+
+    async def call(self, endpoint: str) -> Optional[Response]:
+        if endpoint == "list":
+            return await self.send("GET", "/api/images/")
+        if endpoint == "detail":
+            return await self.send(
+                "GET", f"/api/images/{random.choice(self.image_ids)}/"
+            )
+        if endpoint == "upload":
+            return await self.upload()
+        if endpoint == "generate-link":
+            return await self.generate_link()
+        if not self.recorder.links:
+            return None
+        link = random.choice(self.recorder.links)
+        return await self.send("GET", link, authenticated=False)
+
+    async def run(self, mix: dict[str, int], deadline: float) -> None:
+        mix = self.get_mix(mix)
+        endpoints, weights = list(mix), list(mix.values())
+        while time.perf_counter() < deadline:
+            [endpoint] = random.choices(endpoints, weights)
+            start = time.perf_counter()
+            try:
+                response = await self.call(endpoint)
+                if response is not None and response.status == 401:
+                    # access tokens expire after a few minutes
+                    await self.login()
+                    start = time.perf_counter()
+                    response = await self.call(endpoint)
+            except (ConnectionError, h11.ProtocolError):
+                self.recorder.errors[endpoint] += 1
+                await self.http.close()
+                continue
+            if response is None:
+                continue
+            if response.status >= 400:
+                self.recorder.errors[endpoint] += 1
+                continue
+            self.recorder.latencies[endpoint].append(time.perf_counter() - start)
+        await self.http.close()
+
+
+async def run_load_test(
+    url: str,
+    users: list[LoadTestUser],
+    password: str,
+    mix: dict[str, int],
+    concurrency: int,
+    duration: float,
+) -> dict[str, dict]:
+    """
+    Runs ``concurrency`` clients, spread over ``users``, for ``duration``
+    seconds and summarizes the latencies of successful requests by endpoint.
+    """
+    recorder = Recorder()
+    clients = [
+        LoadTestClient(url, users[index % len(users)], password, recorder)
+        for index in range(concurrency)
+    ]
+    # one at a time, setup requests are not measured
+    for client in clients:
+        await client.prepare()
+
+    start = time.perf_counter()
+    await asyncio.gather(
+        *(client.run(mix, deadline=start + duration) for client in clients)
+    )
+    return summarize(
+        recorder.latencies, recorder.errors, seconds=time.perf_counter() - start
+    )
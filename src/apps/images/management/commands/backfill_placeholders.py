@@ -0,0 +1,50 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from src.apps.images.models import Image
+from src.apps.images.services import ImageService
+
+
+class Command(BaseCommand):
+    help = (
+        "Computes placeholders, dominant colors and perceptual hashes of images "
+        "uploaded before they were introduced, from their smallest thumbnail."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=500,
+            help="Number of images summarized per query.",
+        )
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        images = (
+            Image.objects.filter(placeholder="")
+            .only("id", "image", "width", "height")
+            .order_by("id")
+        )
+        images_count = errors_count = 0
+        last_id = None
+        while True:
+            batch = images if last_id is None else images.filter(id__gt=last_id)
+            batch = list(batch[: options["batch_size"]])
+            if not batch:
+                break
+
+            errors = ImageService.summarize_images(batch)
+            for image_id, error in errors.items():
+                self.stderr.write(f"Image {image_id}: {error}")
+            images_count += len(batch) - len(errors)
+            errors_count += len(errors)
+            # failed images keep an empty placeholder, move past them
+            last_id = batch[-1].id
+
+        elapsed = time.perf_counter() - start
+        self.stdout.write(
+            f"Summarized {images_count} image(s), {errors_count} error(s) "
+            f"in {elapsed:.2f}s"
+        )
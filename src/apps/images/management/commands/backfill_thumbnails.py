@@ -0,0 +1,77 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from src.apps.images.engine import RenderEngine
+from src.apps.images.services import ThumbnailBackfillService
+
+
+class Command(BaseCommand):
+    help = (
+        "Renders thumbnails missing from existing images, e.g. after a size was "
+        "added to a membership type. Progress is checkpointed, an interrupted "
+        "run resumes where it stopped."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=500,
+            help="Number of images checked per query and checkpoint.",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=None,
+            help="Number of render processes, defaults to the number of cores.",
+        )
+        parser.add_argument(
+            "--checkpoint",
+            default="backfill_thumbnails",
+            help="Name under which progress is stored.",
+        )
+        parser.add_argument(
+            "--reset",
+            action="store_true",
+            help="Ignore the stored checkpoint and start from the first image.",
+        )
+
+    def handle(self, *args, **options):
+        service_class = ThumbnailBackfillService
+        engine = RenderEngine(workers=options["workers"])
+        checkpoint = service_class.get_checkpoint(
+            name=options["checkpoint"], reset=options["reset"]
+        )
+        if checkpoint.last_image_id:
+            self.stdout.write(f"Resuming after image {checkpoint.last_image_id}")
+
+        start = time.perf_counter()
+        images_count = thumbnails_count = 0
+        while True:
+            image_ids = service_class.get_image_batch(
+                after=checkpoint.last_image_id, limit=options["batch_size"]
+            )
+            if not image_ids:
+                break
+
+            missing = service_class.get_missing_thumbnails(image_ids=image_ids)
+            if missing:
+                stats = engine.run(service_class.build_tasks(missing=missing))
+                images_count += stats.images
+                thumbnails_count += stats.thumbnails
+                for image_id, error in stats.errors.items():
+                    self.stderr.write(f"Image {image_id}: {error}")
+
+            checkpoint.last_image_id = image_ids[-1]
+            checkpoint.save(update_fields=["last_image_id", "updated_at"])
+
+        # the run is complete, the next one has to look at every image again
+        checkpoint.last_image_id = None
+        checkpoint.save(update_fields=["last_image_id", "updated_at"])
+
+        elapsed = time.perf_counter() - start
+        self.stdout.write(
+            f"Rendered {thumbnails_count} missing thumbnail(s) of {images_count} "
+            f"image(s) in {elapsed:.2f}s"
+        )
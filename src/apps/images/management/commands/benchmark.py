@@ -0,0 +1,128 @@
+import json
+import os
+import shutil
+import tempfile
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connection
+from django.test.utils import (
+    override_settings,
+    setup_databases,
+    setup_test_environment,
+    teardown_databases,
+    teardown_test_environment,
+)
+
+from src.apps.images.benchmarks import compare_results, get_benchmark_cases, measure
+
+
+class Command(BaseCommand):
+    help = (
+        "Times thumbnail rendering, uploads, image lists and temporary link "
+        "resolution on synthetic images in a test database, and fails when a "
+        "result regressed past the tolerance compared to the saved baseline."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--repeat",
+            type=int,
+            default=5,
+            help="Runs per case, the median is reported.",
+        )
+        parser.add_argument(
+            "--filter",
+            default="",
+            help="Only run cases whose name contains this text.",
+        )
+        parser.add_argument(
+            "--baseline",
+            default=settings.BENCHMARK_BASELINE,
+            help="JSON file the results are compared to.",
+        )
+        parser.add_argument(
+            "--tolerance",
+            type=float,
+            default=settings.BENCHMARK_TOLERANCE,
+            help="Fraction a timing or the RSS growth may grow by.",
+        )
+        parser.add_argument(
+            "--save",
+            action="store_true",
+            help="Write the results to the baseline file instead of comparing.",
+        )
+
+    def load_baseline(self, path: str) -> dict:
+        if not os.path.exists(path):
+            return {}
+        with open(path) as file:
+            baseline = json.load(file)
+        if baseline["database"] != connection.vendor:
+            raise CommandError(
+                f"Baseline was recorded on {baseline['database']}, "
+                f"run with --save to record one on {connection.vendor}"
+            )
+        return baseline["results"]
+
+    def run_cases(self, options) -> dict[str, dict]:
+        results = {}
+        for case in get_benchmark_cases():
+            if options["filter"] not in case.name:
+                continue
+            result = measure(case, repeat=options["repeat"])
+            results[case.name] = result._asdict()
+            self.stdout.write(
+                f"{case.name:<40} {result.wall * 1000:>9.2f} ms wall "
+                f"{result.cpu * 1000:>9.2f} ms cpu "
+                f"{result.rss_growth_kb / 1024:>+7.1f} MiB "
+                f"{result.queries:>4} queries"
+            )
+        return results
+
+    def handle(self, *args, **options):
+        baseline = {} if options["save"] else self.load_baseline(options["baseline"])
+
+        setup_test_environment()
+        old_config = setup_databases(
+            verbosity=0, interactive=False, aliases={DEFAULT_DB_ALIAS}
+        )
+        media_root = tempfile.mkdtemp(prefix="benchmark-")
+        try:
+            with override_settings(
+                MEDIA_ROOT=media_root,
+                DERIVATIVE_CACHE_DIR=os.path.join(media_root, "derivatives/"),
+                THUMBNAILS_ASYNC=False,
+                CACHES={
+                    "default": {
+                        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+                        "LOCATION": "benchmark",
+                    }
+                },
+            ):
+                results = self.run_cases(options)
+        finally:
+            teardown_databases(old_config, verbosity=0)
+            teardown_test_environment()
+            shutil.rmtree(media_root, ignore_errors=True)
+
+        if options["save"]:
+            os.makedirs(os.path.dirname(options["baseline"]), exist_ok=True)
+            with open(options["baseline"], "w") as file:
+                json.dump(
+                    {"database": connection.vendor, "results": results},
+                    file,
+                    indent=2,
+                )
+            self.stdout.write(f"Saved baseline to {options['baseline']}")
+            return
+
+        if not baseline:
+            self.stdout.write("No baseline to compare to, run with --save first")
+            return
+        regressions = compare_results(results, baseline, options["tolerance"])
+        if regressions:
+            raise CommandError(
+                "Benchmarks regressed past the tolerance:\n" + "\n".join(regressions)
+            )
+        self.stdout.write(f"No regressions past {options['tolerance']:.0%}")
@@ -0,0 +1,126 @@
+import asyncio
+import json
+import os
+import secrets
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from src.apps.images.loadtest import (
+    DEFAULT_MIX,
+    create_fixture_users,
+    delete_fixture_users,
+    parse_mix,
+    run_load_test,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Logs in one user per fixture membership type and drives a mix of "
+        "image list, detail, upload, generate-link and temporary-link requests "
+        "from concurrent clients against a running server, then reports "
+        "throughput and latency percentiles per endpoint. The users are "
+        "deleted afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--url",
+            default="http://localhost:8000",
+            help="Base URL of the server under load.",
+        )
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            default=10,
+            help="Number of clients, each keeps one connection open.",
+        )
+        parser.add_argument(
+            "--duration",
+            type=float,
+            default=30,
+            help="Seconds to send requests for.",
+        )
+        parser.add_argument(
+            "--mix",
+            default=DEFAULT_MIX,
+            help="Weights of each endpoint, e.g. 'list=50,detail=30,upload=5'.",
+        )
+        parser.add_argument(
+            "--fixtures",
+            default=os.path.join(settings.BASE_DIR, "fixtures/fixtures.json"),
+            help="Fixture file whose membership types get a load test user.",
+        )
+        parser.add_argument(
+            "--password",
+            help="Password set on the load test users, random by default.",
+        )
+        parser.add_argument(
+            "--keep-users",
+            action="store_true",
+            help="Keep the load test users and their images after the run.",
+        )
+        parser.add_argument(
+            "--output",
+            help="Also write the results to this JSON file.",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            mix = parse_mix(options["mix"])
+        except ValueError as exc:
+            raise CommandError(exc)
+        password = options["password"] or secrets.token_urlsafe(16)
+        users = create_fixture_users(options["fixtures"], password)
+        if not users:
+            raise CommandError("No membership types found, load the fixtures first")
+
+        try:
+            results = asyncio.run(
+                run_load_test(
+                    url=options["url"],
+                    users=users,
+                    password=password,
+                    mix=mix,
+                    concurrency=options["concurrency"],
+                    duration=options["duration"],
+                )
+            )
+        except (ConnectionError, OSError) as exc:
+            raise CommandError(f"Could not prepare the clients: {exc}")
+        finally:
+            if options["keep_users"]:
+                self.stdout.write(
+                    f"Kept {', '.join(user.username for user in users)} "
+                    f"with password {password}"
+                )
+            else:
+                delete_fixture_users(users)
+
+        for endpoint, result in results.items():
+            line = (
+                f"{endpoint:<15} {result['requests']:>7} requests "
+                f"{result['errors']:>5} errors {result['throughput']:>8.1f} req/s"
+            )
+            if result["requests"]:
+                line += "".join(
+                    f" {percentile} {result[percentile] * 1000:>8.1f} ms"
+                    for percentile in ("p50", "p95", "p99")
+                )
+            self.stdout.write(line)
+
+        if options["output"]:
+            with open(options["output"], "w") as file:
+                json.dump(
+                    {
+                        "url": options["url"],
+                        "concurrency": options["concurrency"],
+                        "duration": options["duration"],
+                        "mix": mix,
+                        "endpoints": results,
+                    },
+                    file,
+                    indent=2,
+                )
+            self.stdout.write(f"Saved results to {options['output']}")
@@ -0,0 +1,84 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from src.apps.images.services import (
+    TemporaryLinkService,
+    ThumbnailJobService,
+    UploadSessionService,
+)
+
+
+class Command(BaseCommand):
+    help = "Drains the thumbnail job queue, rendering pending thumbnails."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=settings.THUMBNAIL_JOB_BATCH_SIZE,
+            help="Number of jobs claimed per round.",
+        )
+        parser.add_argument(
+            "--poll-interval",
+            type=float,
+            default=1.0,
+            help="Seconds to sleep when the queue is empty.",
+        )
+        parser.add_argument(
+            "--sweep-interval",
+            type=float,
+            default=None,
+            help=(
+                "Also delete expired access tokens and upload sessions "
+                "every SWEEP_INTERVAL seconds."
+            ),
+        )
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Exit as soon as the queue is empty.",
+        )
+
+    def handle(self, *args, **options):
+        service_class = ThumbnailJobService
+        batch_size = options["batch_size"]
+
+        sweep_interval = options["sweep_interval"]
+        next_sweep = time.monotonic()
+
+        try:
+            while True:
+                if sweep_interval is not None and time.monotonic() >= next_sweep:
+                    result = TemporaryLinkService.delete_expired_tokens(
+                        batch_size=settings.ACCESS_TOKEN_SWEEP_BATCH_SIZE
+                    )
+                    self.stdout.write(
+                        f"Deleted {result.deleted} expired access token(s) and "
+                        f"{result.revocations_deleted} expired revocation(s) "
+                        f"in {result.seconds:.2f}s"
+                    )
+                    result = UploadSessionService.delete_expired_sessions(
+                        batch_size=settings.UPLOAD_SESSION_SWEEP_BATCH_SIZE
+                    )
+                    self.stdout.write(
+                        f"Deleted {result.deleted} expired upload session(s) "
+                        f"in {result.seconds:.2f}s"
+                    )
+                    next_sweep = time.monotonic() + sweep_interval
+
+                requeued = service_class.requeue_stale_jobs()
+                if requeued:
+                    self.stdout.write(f"Requeued {requeued} stale job(s)")
+
+                processed = service_class.process_jobs(limit=batch_size)
+                if processed:
+                    self.stdout.write(f"Processed {processed} job(s)")
+                    continue
+
+                if options["once"]:
+                    break
+                time.sleep(options["poll_interval"])
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,79 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from src.apps.images.engine import RenderEngine, get_render_profiles
+from src.apps.images.models import Image as ImageModel
+from src.apps.memberships.models import MembershipType
+
+
+class Command(BaseCommand):
+    help = "Re-renders thumbnails of existing images on all CPU cores."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--user",
+            help="Only regenerate images uploaded by the user with this username.",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=None,
+            help="Number of render processes, defaults to the number of cores.",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=None,
+            help="Number of thumbnail rows inserted at once.",
+        )
+
+    def get_tasks(self, images, heights_by_membership, profiles, chunk_size):
+        chunk = []
+        for image in images.iterator(chunk_size=chunk_size):
+            chunk.append(image)
+            if len(chunk) >= chunk_size:
+                yield from self.get_chunk_tasks(chunk, heights_by_membership, profiles)
+                chunk = []
+        yield from self.get_chunk_tasks(chunk, heights_by_membership, profiles)
+
+    def get_chunk_tasks(self, images, heights_by_membership, profiles):
+        for image in images:
+            heights = heights_by_membership[image.uploaded_by.membership_type_id]
+            yield RenderEngine.build_task(
+                image_model=image, heights=heights, profiles=profiles
+            )
+
+    def handle(self, *args, **options):
+        # old thumbnails are replaced as new ones are saved, images that fail
+        # to render keep theirs
+        engine = RenderEngine(
+            workers=options["workers"], batch_size=options["batch_size"], replace=True
+        )
+        heights_by_membership = {
+            membership.id: [size.height for size in membership.thumbnail_sizes.all()]
+            for membership in MembershipType.objects.prefetch_related("thumbnail_sizes")
+        }
+
+        images = (
+            ImageModel.objects.select_related("uploaded_by")
+            .filter(uploaded_by__membership_type__isnull=False)
+            .order_by("id")
+        )
+        if options["user"]:
+            images = images.filter(uploaded_by__user__username=options["user"])
+
+        start = time.perf_counter()
+        stats = engine.run(
+            self.get_tasks(
+                images, heights_by_membership, get_render_profiles(), engine.batch_size
+            )
+        )
+        elapsed = time.perf_counter() - start
+
+        for image_id, error in stats.errors.items():
+            self.stderr.write(f"Image {image_id}: {error}")
+        self.stdout.write(
+            f"Rendered {stats.thumbnails} thumbnail(s) of {stats.images} image(s) "
+            f"with {engine.workers} worker(s) in {elapsed:.2f}s"
+        )
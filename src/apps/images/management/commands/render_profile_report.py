@@ -0,0 +1,92 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand
+
+from src.apps.images.models import Image as ImageModel, ThumbnailSize
+from src.apps.images.rendering import (
+    DEFAULT_RENDER_PROFILE,
+    RenderProfile,
+    render_thumbnail_cascade,
+)
+from src.apps.images.utils import get_format, get_thumbnail_dimensions
+
+
+class Command(BaseCommand):
+    help = (
+        "Renders a sample of images with every thumbnail size's render profile "
+        "and reports the time and bytes each one costs."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--sample",
+            type=int,
+            default=20,
+            help="Number of most recent images to render.",
+        )
+        parser.add_argument(
+            "--baseline",
+            action="store_true",
+            help="Also render every height with the default profile.",
+        )
+
+    def describe(self, profile: RenderProfile) -> str:
+        return (
+            f"{profile.resample}, gap={profile.reducing_gap or '-'}, "
+            f"q={profile.quality or '-'}, progressive={profile.progressive}, "
+            f"optimize={profile.optimize}, png={profile.png_compress_level}, "
+            f"strip={profile.strip_metadata}"
+        )
+
+    def measure(self, images, height: int, profile: RenderProfile):
+        seconds = 0.0
+        total_bytes = rendered_count = 0
+        for image in images:
+            extension = os.path.splitext(image.image.name)[1][1:]
+            format = get_format(extension=extension.lower())
+            if not format or not os.path.exists(image.image.path):
+                continue
+            size = get_thumbnail_dimensions(
+                image_height=image.height,
+                image_width=image.width,
+                thumbnail_height=height,
+            )
+            start = time.perf_counter()
+            [rendered] = render_thumbnail_cascade(
+                source=image.image.path,
+                sizes=[size],
+                format=format,
+                profiles={height: profile},
+            )
+            seconds += time.perf_counter() - start
+            total_bytes += len(rendered.content)
+            rendered_count += 1
+        return rendered_count, seconds, total_bytes
+
+    def report(self, images, height: int, profile: RenderProfile, label: str):
+        count, seconds, total_bytes = self.measure(images, height, profile)
+        if not count:
+            self.stdout.write(f"{height}px {label}: no images rendered")
+            return
+        self.stdout.write(
+            f"{height}px {label} [{self.describe(profile)}]: "
+            f"{count} image(s), {seconds / count * 1000:.1f} ms and "
+            f"{total_bytes / count / 1024:.1f} KiB per thumbnail"
+        )
+
+    def handle(self, *args, **options):
+        images = list(
+            ImageModel.objects.only("id", "image", "height", "width").order_by(
+                "-created_at"
+            )[: options["sample"]]
+        )
+        if not images:
+            self.stdout.write("No images to sample")
+            return
+
+        for thumbnail_size in ThumbnailSize.objects.order_by("height"):
+            height = thumbnail_size.height
+            self.report(images, height, thumbnail_size.get_render_profile(), "profile")
+            if options["baseline"]:
+                self.report(images, height, DEFAULT_RENDER_PROFILE, "default")
@@ -0,0 +1,29 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from src.apps.images import response_cache
+
+
+class Command(BaseCommand):
+    help = "Prints hit/miss counters of the image list/detail response cache."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--reset",
+            action="store_true",
+            help="Reset the counters after printing them.",
+        )
+
+    def handle(self, *args, **options):
+        if not settings.IMAGE_RESPONSE_CACHE_STATS:
+            self.stdout.write(
+                "Counters are disabled, set IMAGE_RESPONSE_CACHE_STATS=True"
+            )
+            return
+        stats = response_cache.get_stats()
+        self.stdout.write(
+            f"Hits: {stats['hits']}, misses: {stats['misses']}, "
+            f"hit ratio: {stats['hit_ratio']:.2%}"
+        )
+        if options["reset"]:
+            response_cache.reset_stats()
@@ -0,0 +1,44 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from src.apps.images.services import TemporaryLinkService
+
+
+class Command(BaseCommand):
+    help = "Deletes expired image access tokens in bounded batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=settings.ACCESS_TOKEN_SWEEP_BATCH_SIZE,
+            help="Number of tokens deleted per transaction.",
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=None,
+            help="Keep running and sweep every INTERVAL seconds.",
+        )
+
+    def sweep(self, batch_size):
+        result = TemporaryLinkService.delete_expired_tokens(batch_size=batch_size)
+        self.stdout.write(
+            f"Deleted {result.deleted} expired access token(s) and "
+            f"{result.revocations_deleted} expired revocation(s) "
+            f"in {result.seconds:.2f}s"
+        )
+
+    def handle(self, *args, **options):
+        self.sweep(batch_size=options["batch_size"])
+        if options["interval"] is None:
+            return
+
+        try:
+            while True:
+                time.sleep(options["interval"])
+                self.sweep(batch_size=options["batch_size"])
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,43 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from src.apps.images.services import UploadSessionService
+
+
+class Command(BaseCommand):
+    help = "Deletes expired upload sessions together with their partial files."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=settings.UPLOAD_SESSION_SWEEP_BATCH_SIZE,
+            help="Number of sessions deleted per transaction.",
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=None,
+            help="Keep running and sweep every INTERVAL seconds.",
+        )
+
+    def sweep(self, batch_size):
+        result = UploadSessionService.delete_expired_sessions(batch_size=batch_size)
+        self.stdout.write(
+            f"Deleted {result.deleted} expired upload session(s) "
+            f"in {result.seconds:.2f}s"
+        )
+
+    def handle(self, *args, **options):
+        self.sweep(batch_size=options["batch_size"])
+        if options["interval"] is None:
+            return
+
+        try:
+            while True:
+                time.sleep(options["interval"])
+                self.sweep(batch_size=options["batch_size"])
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,17 @@
+# Generated by Django 4.0.6 on 2026-10-18 18:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('images', '0007_backfillcheckpoint'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='image',
+            index=models.Index(fields=['uploaded_by', 'created_at', 'id'], name='image_owner_created_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.0.6 on 2026-10-18 18:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('images', '0008_image_owner_created_idx'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='imageaccesstoken',
+            name='expires',
+            field=models.DateTimeField(db_index=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.0.6 on 2026-10-18 19:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('images', '0012_image_sha256'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='thumbnail',
+            name='variants',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 4.0.6 on 2026-10-18 19:13
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('images', '0013_thumbnail_variants'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='thumbnailsize',
+            name='optimize',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='thumbnailsize',
+            name='png_compress_level',
+            field=models.PositiveSmallIntegerField(default=6, validators=[django.core.validators.MaxValueValidator(9)]),
+        ),
+        migrations.AddField(
+            model_name='thumbnailsize',
+            name='progressive',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='thumbnailsize',
+            name='quality',
+            field=models.PositiveSmallIntegerField(blank=True, help_text='JPEG/WebP/AVIF quality, the encoder default when empty.', null=True, validators=[django.core.validators.MinValueValidator(1), django.core.validators.MaxValueValidator(100)]),
+        ),
+        migrations.AddField(
+            model_name='thumbnailsize',
+            name='reducing_gap',
+            field=models.FloatField(blank=True, help_text='Reduce by an integer factor first, faster with a small quality cost.', null=True, validators=[django.core.validators.MinValueValidator(1.0)]),
+        ),
+        migrations.AddField(
+            model_name='thumbnailsize',
+            name='resample',
+            field=models.CharField(choices=[('nearest', 'Nearest'), ('box', 'Box'), ('bilinear', 'Bilinear'), ('hamming', 'Hamming'), ('bicubic', 'Bicubic'), ('lanczos', 'Lanczos')], default='lanczos', max_length=10),
+        ),
+        migrations.AddField(
+            model_name='thumbnailsize',
+            name='strip_metadata',
+            field=models.BooleanField(default=True),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 4.0.6 on 2026-10-18 19:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('images', '0014_thumbnailsize_render_profile'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='image',
+            name='image',
+            field=models.ImageField(db_index=True, height_field='height', upload_to='images', width_field='width'),
+        ),
+        migrations.AlterField(
+            model_name='image',
+            name='sha256',
+            field=models.CharField(blank=True, db_index=True, max_length=64),
+        ),
+        migrations.AlterField(
+            model_name='thumbnail',
+            name='thumbnail',
+            field=models.ImageField(db_index=True, height_field='height', upload_to='thumbnails', width_field='width'),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 4.0.10 on 2026-10-18 20:06
+
+import django.core.validators
+from django.db import migrations, models
+
+
+def set_reducing_gap(apps, schema_editor):
+    # sizes created before the default rendered with Image.thumbnail()'s gap
+    ThumbnailSize = apps.get_model("images", "ThumbnailSize")
+    ThumbnailSize.objects.filter(reducing_gap__isnull=True).update(reducing_gap=2.0)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('images', '0017_image_placeholder'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='thumbnailsize',
+            name='reducing_gap',
+            field=models.FloatField(blank=True, default=2.0, help_text='Reduce by an integer factor first, faster with a small quality cost. Empty resizes in a single step.', null=True, validators=[django.core.validators.MinValueValidator(1.0)]),
+        ),
+        migrations.RunPython(set_reducing_gap, migrations.RunPython.noop),
+    ]
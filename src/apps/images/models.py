@@ -1,5 +1,9 @@
+from typing import Optional
 from uuid import uuid4
+from django.core.validators import MaxValueValidator, MinValueValidator
 from django.db import models
+from django.utils import timezone
+from src.apps.images.rendering import RenderProfile, join_hash
 from src.core.models import TimeStampedModel
 
 
@@ -11,23 +15,108 @@ class Image(TimeStampedModel):
     height = models.IntegerField(default=0)
     width = models.IntegerField(default=0)
 
+    # files are named after their content, identical uploads share one file
     image = models.ImageField(
-        upload_to="images", height_field="height", width_field="width"
+        upload_to="images", height_field="height", width_field="width", db_index=True
     )
+    sha256 = models.CharField(max_length=64, blank=True, db_index=True)
+
+    # 64-bit dHash split into 16-bit chunks, see src.apps.images.similarity
+    dhash_0 = models.IntegerField(null=True, blank=True)
+    dhash_1 = models.IntegerField(null=True, blank=True)
+    dhash_2 = models.IntegerField(null=True, blank=True)
+    dhash_3 = models.IntegerField(null=True, blank=True)
+    near_duplicate_of = models.ForeignKey(
+        "self", on_delete=models.SET_NULL, null=True, blank=True, related_name="+"
+    )
+    # data URI of a tiny preview and "#rrggbb", shown until thumbnails load
+    placeholder = models.TextField(blank=True)
+    dominant_color = models.CharField(max_length=7, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["uploaded_by", "created_at", "id"],
+                name="image_owner_created_idx",
+            ),
+            models.Index(fields=["uploaded_by", "dhash_0"], name="image_dhash_0_idx"),
+            models.Index(fields=["uploaded_by", "dhash_1"], name="image_dhash_1_idx"),
+            models.Index(fields=["uploaded_by", "dhash_2"], name="image_dhash_2_idx"),
+            models.Index(fields=["uploaded_by", "dhash_3"], name="image_dhash_3_idx"),
+        ]
 
     def __str__(self) -> str:
         return f"Image: {self.title}"
 
+    @property
+    def dhash(self) -> Optional[int]:
+        chunks = (self.dhash_0, self.dhash_1, self.dhash_2, self.dhash_3)
+        if None in chunks:
+            return None
+        return join_hash(chunks)
+
 
 class ImageAccessToken(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid4, editable=False)
     image = models.ForeignKey(Image, on_delete=models.CASCADE, editable=False)
-    expires = models.DateTimeField()
+    expires = models.DateTimeField(db_index=True)
+
+
+class RevokedAccessToken(models.Model):
+    id = models.UUIDField(primary_key=True, default=uuid4, editable=False)
+    signature = models.CharField(max_length=100, unique=True)
+    expires = models.DateTimeField(db_index=True)
 
 
 class ThumbnailSize(models.Model):
+    class Resample(models.TextChoices):
+        NEAREST = "nearest"
+        BOX = "box"
+        BILINEAR = "bilinear"
+        HAMMING = "hamming"
+        BICUBIC = "bicubic"
+        LANCZOS = "lanczos"
+
     height = models.IntegerField()
 
+    # render profile, the defaults match what thumbnails were always rendered with
+    resample = models.CharField(
+        max_length=10, choices=Resample.choices, default=Resample.LANCZOS
+    )
+    reducing_gap = models.FloatField(
+        null=True,
+        blank=True,
+        default=2.0,
+        validators=[MinValueValidator(1.0)],
+        help_text=(
+            "Reduce by an integer factor first, faster with a small quality cost. "
+            "Empty resizes in a single step."
+        ),
+    )
+    quality = models.PositiveSmallIntegerField(
+        null=True,
+        blank=True,
+        validators=[MinValueValidator(1), MaxValueValidator(100)],
+        help_text="JPEG/WebP/AVIF quality, the encoder default when empty.",
+    )
+    progressive = models.BooleanField(default=False)
+    optimize = models.BooleanField(default=False)
+    png_compress_level = models.PositiveSmallIntegerField(
+        default=6, validators=[MaxValueValidator(9)]
+    )
+    strip_metadata = models.BooleanField(default=True)
+
+    def get_render_profile(self) -> RenderProfile:
+        return RenderProfile(
+            resample=self.resample,
+            reducing_gap=self.reducing_gap,
+            quality=self.quality,
+            progressive=self.progressive,
+            optimize=self.optimize,
+            png_compress_level=self.png_compress_level,
+            strip_metadata=self.strip_metadata,
+        )
+
     def __str__(self) -> str:
         return f"Thumbnail heigth: {self.height}"
 
@@ -40,8 +129,85 @@ class Thumbnail(TimeStampedModel):
     height = models.IntegerField(default=0)
     width = models.IntegerField(default=0)
     thumbnail = models.ImageField(
-        upload_to="thumbnails", height_field="height", width_field="width"
+        upload_to="thumbnails",
+        height_field="height",
+        width_field="width",
+        db_index=True,
     )
+    # smaller encodings of the same thumbnail, {"webp": {"name": ..., "size": ...}}
+    variants = models.JSONField(default=dict, blank=True)
 
     def __str__(self) -> str:
         return f"Thumbnail of image: {self.image.title} ({self.width} x {self.height})"
+
+
+class ThumbnailJob(TimeStampedModel):
+    class Status(models.TextChoices):
+        PENDING = "pending"
+        PROCESSING = "processing"
+        DONE = "done"
+        FAILED = "failed"
+
+    image = models.ForeignKey(
+        Image, on_delete=models.CASCADE, related_name="thumbnail_jobs"
+    )
+    height = models.IntegerField()
+
+    status = models.CharField(
+        max_length=10, choices=Status.choices, default=Status.PENDING
+    )
+    attempts = models.IntegerField(default=0)
+    run_after = models.DateTimeField(default=timezone.now)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["image", "height"], name="unique_thumbnail_job"
+            )
+        ]
+        indexes = [
+            models.Index(fields=["status", "run_after"], name="thumbnail_job_queue_idx")
+        ]
+
+    def __str__(self) -> str:
+        return (
+            f"Thumbnail job of image: {self.image_id} ({self.height}px, {self.status})"
+        )
+
+
+class BackfillCheckpoint(TimeStampedModel):
+    name = models.CharField(max_length=100, unique=True)
+    last_image_id = models.UUIDField(null=True, blank=True)
+
+    def __str__(self) -> str:
+        return f"Backfill checkpoint: {self.name} ({self.last_image_id})"
+
+
+class UploadSession(TimeStampedModel):
+    uploaded_by = models.ForeignKey(
+        "accounts.UserAccount", on_delete=models.CASCADE, related_name="upload_sessions"
+    )
+    title = models.CharField(max_length=200)
+    filename = models.CharField(max_length=255)
+    size = models.BigIntegerField()
+    # sorted, merged [start, end) byte ranges written so far
+    received_ranges = models.JSONField(default=list)
+    expires = models.DateTimeField(db_index=True)
+
+    @property
+    def offset(self) -> int:
+        """
+        Number of contiguous bytes received from the start of the file.
+        """
+        if self.received_ranges and self.received_ranges[0][0] == 0:
+            return self.received_ranges[0][1]
+        return 0
+
+    @property
+    def is_complete(self) -> bool:
+        return self.offset == self.size
+
+    def __str__(self) -> str:
+        return f"Upload session: {self.filename} ({self.offset}/{self.size} bytes)"
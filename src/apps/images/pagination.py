@@ -0,0 +1,13 @@
+from rest_framework.pagination import CursorPagination
+
+
+class ImageCursorPagination(CursorPagination):
+    """
+    Keyset pagination, newest images first. Backed by the
+    (uploaded_by, created_at, id) index, a page costs the same no matter
+    how deep it is, and no COUNT(*) is needed.
+    """
+
+    ordering = ("-created_at", "-id")
+    page_size_query_param = "page_size"
+    max_page_size = 100
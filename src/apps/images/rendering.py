@@ -0,0 +1,316 @@
+import base64
+import io
+from typing import Any, BinaryIO, Iterable, NamedTuple, Optional, Union
+from uuid import UUID
+from PIL import Image
+
+from src.apps.images.exceptions import UnsupportedFileExtension
+from src.apps.images.utils import get_format
+
+
+RESAMPLE_FILTERS = {
+    "nearest": Image.Resampling.NEAREST,
+    "box": Image.Resampling.BOX,
+    "bilinear": Image.Resampling.BILINEAR,
+    "hamming": Image.Resampling.HAMMING,
+    "bicubic": Image.Resampling.BICUBIC,
+    "lanczos": Image.Resampling.LANCZOS,
+}
+
+
+class RenderProfile(NamedTuple):
+    """
+    Resampling and encoder settings of a thumbnail size, see ``ThumbnailSize``.
+    """
+
+    resample: str = "lanczos"
+    # what Image.thumbnail() uses
+    reducing_gap: Optional[float] = 2.0
+    quality: Optional[int] = None
+    progressive: bool = False
+    optimize: bool = False
+    png_compress_level: int = 6
+    strip_metadata: bool = True
+
+
+DEFAULT_RENDER_PROFILE = RenderProfile()
+
+DHASH_SIZE = 8
+DHASH_CHUNKS = 4
+DHASH_CHUNK_BITS = 64 // DHASH_CHUNKS
+
+PLACEHOLDER_SIZE = 20
+PLACEHOLDER_QUALITY = 50
+DOMINANT_COLOR_PALETTE = 8
+
+
+class ImageSummary(NamedTuple):
+    """
+    Values derived from an image once, while its thumbnails are rendered.
+    """
+
+    dhash: int
+    # data URI of a tiny preview clients can show while thumbnails load
+    placeholder: str
+    dominant_color: str
+
+
+class RenderedThumbnail(NamedTuple):
+    size: tuple[int]
+    width: int
+    height: int
+    content: bytes
+    # (format, content) pairs of alternative encodings smaller than ``content``
+    variants: tuple[tuple[str, bytes]] = ()
+    # set on the smallest thumbnail of a cascade
+    summary: Optional[ImageSummary] = None
+
+
+class RenderTask(NamedTuple):
+    image_id: UUID
+    source_path: str
+    name: str
+    extension: str
+    sizes: tuple[tuple[int]]
+    variant_formats: tuple[str] = ()
+    # thumbnail height -> profile, sizes without one use the default
+    profiles: Optional[dict[int, RenderProfile]] = None
+
+
+class RenderResult(NamedTuple):
+    image_id: UUID
+    thumbnails: list[RenderedThumbnail]
+    error: Optional[str] = None
+
+
+def open_image(source: Union[str, BinaryIO], size: tuple[int]) -> Image.Image:
+    """
+    Decodes ``source`` no larger than necessary to produce ``size``.
+
+    For JPEG files ``draft`` makes libjpeg scale the image down by 1/2, 1/4
+    or 1/8 while decoding, so large photos are never fully decompressed.
+    """
+    image = Image.open(source)
+    image.draft(image.mode, size)
+    image.load()
+    return image
+
+
+def get_save_options(
+    format: str, profile: RenderProfile, metadata: Optional[dict] = None
+) -> dict[str, Any]:
+    options = {}
+    if format == "PNG":
+        options["optimize"] = profile.optimize
+        options["compress_level"] = profile.png_compress_level
+    elif format == "JPEG":
+        options["optimize"] = profile.optimize
+        options["progressive"] = profile.progressive
+    if format != "PNG" and profile.quality is not None:
+        options["quality"] = profile.quality
+    if not profile.strip_metadata and metadata:
+        options.update(metadata)
+    return options
+
+
+def encode_image(
+    image: Image.Image,
+    format: str,
+    profile: RenderProfile = DEFAULT_RENDER_PROFILE,
+    metadata: Optional[dict] = None,
+) -> bytes:
+    if format == "JPEG" and image.mode not in ("RGB", "L", "CMYK"):
+        image = image.convert("RGB")
+    buffer = io.BytesIO()
+    image.save(buffer, format, **get_save_options(format, profile, metadata))
+    return buffer.getvalue()
+
+
+def resize_image(
+    image: Image.Image, size: tuple[int], profile: RenderProfile
+) -> Image.Image:
+    return image.resize(
+        size,
+        RESAMPLE_FILTERS[profile.resample],
+        reducing_gap=profile.reducing_gap,
+    )
+
+
+def get_dhash(image: Image.Image) -> int:
+    """
+    64-bit difference hash: every bit tells whether a pixel of a 9x8
+    grayscale reduction is darker than its right neighbour. Re-encoded or
+    resized copies of an image end up a few bits apart.
+    """
+    width = DHASH_SIZE + 1
+    pixels = (
+        image.convert("L").resize((width, DHASH_SIZE), Image.Resampling.BOX).tobytes()
+    )
+    value = 0
+    for row in range(0, width * DHASH_SIZE, width):
+        for index in range(row, row + DHASH_SIZE):
+            value = value << 1 | (pixels[index] < pixels[index + 1])
+    return value
+
+
+def split_hash(value: int) -> tuple[int]:
+    mask = (1 << DHASH_CHUNK_BITS) - 1
+    return tuple(
+        value >> (DHASH_CHUNK_BITS * index) & mask
+        for index in reversed(range(DHASH_CHUNKS))
+    )
+
+
+def join_hash(chunks: Iterable[int]) -> int:
+    value = 0
+    for chunk in chunks:
+        value = value << DHASH_CHUNK_BITS | chunk
+    return value
+
+
+def get_placeholder(image: Image.Image) -> tuple[str, str]:
+    """
+    Returns a ``PLACEHOLDER_SIZE`` preview of ``image`` as a data URI and the
+    most common color of its reduced palette as ``#rrggbb``.
+    """
+    preview = image.convert("RGBA" if "A" in image.getbands() else "RGB")
+    preview.thumbnail((PLACEHOLDER_SIZE, PLACEHOLDER_SIZE), Image.Resampling.BOX)
+
+    format = "WEBP" if get_supported_formats(["WEBP"]) else "PNG"
+    content = encode_image(
+        preview, format, RenderProfile(quality=PLACEHOLDER_QUALITY, optimize=True)
+    )
+    placeholder = (
+        f"data:image/{format.lower()};base64,{base64.b64encode(content).decode()}"
+    )
+
+    palette_image = preview.convert("RGB").quantize(colors=DOMINANT_COLOR_PALETTE)
+    _, index = max(palette_image.getcolors())
+    red, green, blue = palette_image.getpalette()[index * 3 : index * 3 + 3]
+    return placeholder, f"#{red:02x}{green:02x}{blue:02x}"
+
+
+def summarize_image(image: Image.Image) -> ImageSummary:
+    placeholder, dominant_color = get_placeholder(image)
+    return ImageSummary(
+        dhash=get_dhash(image),
+        placeholder=placeholder,
+        dominant_color=dominant_color,
+    )
+
+
+def get_cascade_summary(
+    rendered: Iterable[RenderedThumbnail],
+) -> Optional[ImageSummary]:
+    return next(
+        (thumbnail.summary for thumbnail in rendered if thumbnail.summary is not None),
+        None,
+    )
+
+
+def get_supported_formats(formats: Iterable[str]) -> tuple[str]:
+    """
+    Filters out formats the installed Pillow cannot encode, e.g. AVIF.
+    """
+    Image.init()
+    return tuple(format for format in formats if format in Image.SAVE)
+
+
+def encode_variants(
+    image: Image.Image,
+    formats: Iterable[str],
+    max_size: int,
+    profile: RenderProfile = DEFAULT_RENDER_PROFILE,
+    metadata: Optional[dict] = None,
+) -> tuple[tuple[str, bytes]]:
+    variants = []
+    for format in formats:
+        try:
+            content = encode_image(image, format, profile, metadata)
+        except (OSError, ValueError):
+            # mode the encoder cannot handle, the main format still can
+            continue
+        # a variant is only worth serving if it saves bytes
+        if len(content) < max_size:
+            variants.append((format, content))
+    return tuple(variants)
+
+
+def render_thumbnail_cascade(
+    source: Union[str, BinaryIO],
+    sizes: list[tuple[int]],
+    format: str,
+    variant_formats: Iterable[str] = (),
+    profiles: Optional[dict[int, RenderProfile]] = None,
+    summarize: bool = False,
+) -> list[RenderedThumbnail]:
+    """
+    Decodes ``source`` once and renders every size from largest to smallest,
+    each one derived from the previous, already reduced, image.
+    Images are never upscaled.
+
+    Every thumbnail is also encoded in ``variant_formats``, keeping the
+    encodings which are smaller than the one in ``format``. ``profiles``
+    picks the resampling and encoder settings by thumbnail height.
+    With ``summarize``, the smallest thumbnail carries the source's
+    ``ImageSummary``.
+    """
+    sizes = sorted(sizes, key=lambda size: size[1], reverse=True)
+    if not sizes:
+        return []
+
+    variant_formats = get_supported_formats(variant_formats)
+    profiles = profiles or {}
+    current = open_image(source, sizes[0])
+    metadata = {
+        key: current.info[key] for key in ("exif", "icc_profile") if key in current.info
+    }
+    rendered = []
+    for size in sizes:
+        profile = profiles.get(size[1], DEFAULT_RENDER_PROFILE)
+        if size[1] < current.height:
+            current = resize_image(current, size, profile)
+        content = encode_image(current, format, profile, metadata)
+        rendered.append(
+            RenderedThumbnail(
+                size=size,
+                width=current.width,
+                height=current.height,
+                content=content,
+                variants=encode_variants(
+                    current, variant_formats, len(content), profile, metadata
+                ),
+            )
+        )
+    if summarize:
+        rendered[-1] = rendered[-1]._replace(summary=summarize_image(current))
+    return rendered
+
+
+def render_task(task: RenderTask) -> RenderResult:
+    """
+    Entry point for render worker processes. Takes and returns plain data
+    only, so it can be pickled without touching the ORM.
+    """
+    try:
+        format = get_format(extension=task.extension)
+        if not format:
+            raise UnsupportedFileExtension(
+                "We do not provide support for this file extension."
+            )
+        thumbnails = render_thumbnail_cascade(
+            source=task.source_path,
+            sizes=list(task.sizes),
+            format=format,
+            variant_formats=task.variant_formats,
+            profiles=task.profiles,
+            # the engine stores the summary along with the thumbnails
+            summarize=True,
+        )
+    except Exception as exc:
+        return RenderResult(
+            image_id=task.image_id,
+            thumbnails=[],
+            error=f"{exc.__class__.__name__}: {exc}",
+        )
+    return RenderResult(image_id=task.image_id, thumbnails=thumbnails)
@@ -0,0 +1,114 @@
+import hashlib
+from typing import Iterable, Optional
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.cache import DEFAULT_CACHE_ALIAS, cache, caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+
+from src.apps.images.models import Image
+from src.apps.images.utils import get_accepted_variants
+from src.apps.memberships.profiles import MembershipProfile
+
+HITS_KEY = "images:response-cache:hits"
+MISSES_KEY = "images:response-cache:misses"
+
+
+def is_enabled() -> bool:
+    # versions bumped by other processes, the thumbnail worker among them,
+    # never reach a per-process cache
+    return bool(settings.IMAGE_RESPONSE_CACHE_TIMEOUT) and not isinstance(
+        caches[DEFAULT_CACHE_ALIAS], LocMemCache
+    )
+
+
+def get_user_version_key(user_id: int) -> str:
+    return f"images:user-version:{user_id}"
+
+
+def get_user_version(user_id: int) -> str:
+    key = get_user_version_key(user_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, uuid4().hex, timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def bump_user_versions(user_ids: Iterable[int]) -> None:
+    """
+    Invalidates cached responses of the given users once the current
+    transaction commits, so no request can cache data read before it.
+
+    A fresh random version is used rather than an increment, a version key
+    evicted from the cache can never bring back old entries.
+    """
+    if not is_enabled():
+        return
+    keys = {get_user_version_key(user_id) for user_id in user_ids}
+    if keys:
+        transaction.on_commit(
+            lambda: cache.set_many({key: uuid4().hex for key in keys}, timeout=None)
+        )
+
+
+def bump_image_owner_versions(image_ids: Iterable) -> None:
+    bump_user_versions(
+        Image.objects.filter(id__in=image_ids, uploaded_by__isnull=False)
+        .values_list("uploaded_by__user_id", flat=True)
+        .distinct()
+    )
+
+
+def get_response_key(request, profile: MembershipProfile) -> Optional[str]:
+    # superusers see every user's images, no single version covers them
+    if request.user.is_superuser or not is_enabled():
+        return None
+
+    url = "|".join(
+        (
+            request.build_absolute_uri(),
+            request.accepted_renderer.format,
+            *get_accepted_variants(request.headers.get("Accept", "")),
+        )
+    )
+    return "images:response:{}:{}:{}:{}".format(
+        request.user.pk,
+        get_user_version(request.user.pk),
+        profile.version,
+        hashlib.md5(url.encode()).hexdigest(),
+    )
+
+
+def get_cached_data(key: str):
+    data = cache.get(key)
+    if not settings.IMAGE_RESPONSE_CACHE_STATS:
+        return data
+    counter = MISSES_KEY if data is None else HITS_KEY
+    if not cache.add(counter, 1, timeout=None):
+        try:
+            cache.incr(counter)
+        except ValueError:
+            # evicted between add and incr
+            cache.add(counter, 1, timeout=None)
+    return data
+
+
+def set_cached_data(key: str, data) -> None:
+    cache.set(key, data, timeout=settings.IMAGE_RESPONSE_CACHE_TIMEOUT)
+
+
+def get_stats() -> dict[str, int]:
+    hits = cache.get(HITS_KEY, 0)
+    misses = cache.get(MISSES_KEY, 0)
+    total = hits + misses
+    return {
+        "hits": hits,
+        "misses": misses,
+        "hit_ratio": round(hits / total, 4) if total else 0.0,
+    }
+
+
+def reset_stats() -> None:
+    cache.delete_many([HITS_KEY, MISSES_KEY])
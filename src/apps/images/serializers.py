@@ -1,15 +1,129 @@
 from typing import Any
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.urls import reverse
 from rest_framework import serializers
-from src.apps.images.models import Image, ImageAccessToken, Thumbnail
+from src.apps.images.models import (
+    Image,
+    ImageAccessToken,
+    Thumbnail,
+    ThumbnailJob,
+    UploadSession,
+)
+from src.apps.images.utils import get_format
+
+
+def get_filename_format(filename: str) -> str:
+    name, _, extension = filename.rpartition(".")
+    format = get_format(extension.lower())
+    if not name or "." in name or not format:
+        raise serializers.ValidationError("Please upload a .png, .jpg or .jpeg file")
+    return format
+
+
+class UploadedImageField(serializers.ImageField):
+    """
+    Relies on the checks ``ImageUploadHandler`` made while the file was being
+    received instead of decoding it with Pillow once more. The extension has
+    to match the format sniffed from the file's magic bytes.
+    """
+
+    def to_internal_value(self, data):
+        upload_error = getattr(data, "upload_error", None)
+        if upload_error:
+            raise serializers.ValidationError(upload_error)
+        format = get_filename_format(getattr(data, "name", None) or "")
+        image_format = getattr(data, "image_format", None)
+        if image_format is not None and image_format != format:
+            raise serializers.ValidationError(
+                "File extension does not match the image format."
+            )
+        if getattr(data, "image_size", None) is None:
+            return super().to_internal_value(data)
+        return serializers.FileField.to_internal_value(self, data)
 
 
 class ImageInputSerializer(serializers.Serializer):
     title = serializers.CharField(max_length=200)
-    image = serializers.ImageField()
+    image = UploadedImageField()
+
+
+class ImageBulkInputSerializer(serializers.Serializer):
+    images = serializers.ListField(
+        child=serializers.FileField(),
+        allow_empty=False,
+        max_length=settings.IMAGE_BULK_UPLOAD_MAX_FILES,
+    )
+    titles = serializers.ListField(
+        child=serializers.CharField(max_length=200), required=False
+    )
+
+    def validate(self, data: dict[str, Any]) -> dict[str, Any]:
+        titles = data.get("titles")
+        if titles is not None and len(titles) != len(data["images"]):
+            raise serializers.ValidationError(
+                "Please provide a title for every image or none at all"
+            )
+        return data
+
+
+class UploadSessionInputSerializer(serializers.Serializer):
+    title = serializers.CharField(max_length=200)
+    filename = serializers.CharField(max_length=255)
+    size = serializers.IntegerField(
+        min_value=1, max_value=settings.UPLOAD_SESSION_MAX_SIZE
+    )
+
+    def validate_filename(self, filename: str) -> str:
+        get_filename_format(filename)
+        return filename
+
+
+class UploadSessionOutputSerializer(serializers.ModelSerializer):
+    upload_url = serializers.HyperlinkedIdentityField(
+        view_name="images:upload-session-detail", lookup_field="pk", read_only=True
+    )
+    offset = serializers.IntegerField(read_only=True)
+    complete = serializers.BooleanField(source="is_complete", read_only=True)
+
+    class Meta:
+        model = UploadSession
+        fields = (
+            "id",
+            "upload_url",
+            "title",
+            "filename",
+            "size",
+            "offset",
+            "received_ranges",
+            "complete",
+            "expires",
+        )
+        read_only_fields = fields
+
+
+class RenderInputSerializer(serializers.Serializer):
+    h = serializers.IntegerField(min_value=1)
+    fmt = serializers.ChoiceField(
+        choices=list(settings.DERIVATIVE_FORMATS), required=False
+    )
+
+
+class SpriteInputSerializer(serializers.Serializer):
+    h = serializers.IntegerField(min_value=1)
+
+
+class SimilarImagesInputSerializer(serializers.Serializer):
+    distance = serializers.IntegerField(
+        min_value=0,
+        max_value=settings.IMAGE_SIMILARITY_MAX_DISTANCE,
+        default=settings.IMAGE_SIMILARITY_MAX_DISTANCE,
+    )
 
 
 class TemporaryLinkInputSerializer(serializers.Serializer):
     seconds = serializers.IntegerField()
+    signed = serializers.BooleanField(default=False)
 
     def validate(self, data: dict[str, Any]) -> dict[str, Any]:
         if data["seconds"] < 300 or data["seconds"] > 30000:
@@ -40,7 +154,21 @@ class TemporaryLinkOutputSerializer(serializers.ModelSerializer):
         read_only_fields = fields
 
 
+class SignedTemporaryLinkOutputSerializer(serializers.Serializer):
+    img_url = serializers.SerializerMethodField()
+    expires = serializers.DateTimeField(read_only=True)
+
+    def get_img_url(self, obj) -> str:
+        url = reverse("images:signed-temporary-image", kwargs={"token": obj.token})
+        request = self.context.get("request")
+        if request is None:
+            return url
+        return request.build_absolute_uri(url)
+
+
 class ThumbnailOutputSerializer(serializers.ModelSerializer):
+    thumbnail = serializers.SerializerMethodField()
+    variants = serializers.SerializerMethodField()
     created_at = serializers.DateTimeField(format="%Y-%m-%d %H:%M:%S", read_only=True)
     updated_at = serializers.DateTimeField(format="%Y-%m-%d %H:%M:%S", read_only=True)
 
@@ -49,11 +177,49 @@ class ThumbnailOutputSerializer(serializers.ModelSerializer):
         fields = (
             "height",
             "thumbnail",
+            "variants",
             "created_at",
             "updated_at",
         )
         read_only_fields = fields
 
+    def get_url(self, name: str) -> str:
+        url = default_storage.url(name)
+        request = self.context.get("request")
+        if request is None:
+            return url
+        return request.build_absolute_uri(url)
+
+    def get_thumbnail(self, obj) -> str:
+        """
+        The smallest encoding the client accepts, see ``get_accepted_variants``.
+        """
+        accepted = self.context.get("accepted_variants", ())
+        candidates = [
+            variant for format, variant in obj.variants.items() if format in accepted
+        ]
+        if not candidates:
+            return self.get_url(obj.thumbnail.name)
+        return self.get_url(
+            min(candidates, key=lambda variant: variant["size"])["name"]
+        )
+
+    def get_variants(self, obj) -> dict[str, str]:
+        return {
+            format: self.get_url(variant["name"])
+            for format, variant in obj.variants.items()
+        }
+
+
+class ThumbnailJobOutputSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ThumbnailJob
+        fields = (
+            "height",
+            "status",
+        )
+        read_only_fields = fields
+
 
 class BasicImageOutputSerializer(serializers.ModelSerializer):
     thumbnails = ThumbnailOutputSerializer(many=True, read_only=True)
@@ -67,6 +233,9 @@ class BasicImageOutputSerializer(serializers.ModelSerializer):
             "id",
             "title",
             "thumbnails",
+            "near_duplicate_of",
+            "placeholder",
+            "dominant_color",
             "created_at",
             "updated_at",
         )
@@ -75,6 +244,10 @@ class BasicImageOutputSerializer(serializers.ModelSerializer):
 
 class OriginalImageOutputSerializer(serializers.ModelSerializer):
     thumbnails = ThumbnailOutputSerializer(many=True, read_only=True)
+    # originals are not public, the action serves them through nginx
+    image = serializers.HyperlinkedIdentityField(
+        view_name="images:image-original", lookup_field="pk", read_only=True
+    )
 
     created_at = serializers.DateTimeField(format="%Y-%m-%d %H:%M:%S", read_only=True)
     updated_at = serializers.DateTimeField(format="%Y-%m-%d %H:%M:%S", read_only=True)
@@ -85,6 +258,9 @@ class OriginalImageOutputSerializer(serializers.ModelSerializer):
             "id",
             "title",
             "thumbnails",
+            "near_duplicate_of",
+            "placeholder",
+            "dominant_color",
             "image",
             "created_at",
             "updated_at",
@@ -107,6 +283,9 @@ class ImageWithLinkOutputSerializer(serializers.ModelSerializer):
             "id",
             "title",
             "thumbnails",
+            "near_duplicate_of",
+            "placeholder",
+            "dominant_color",
             "temporary_link_generator",
             "created_at",
             "updated_at",
@@ -116,6 +295,10 @@ class ImageWithLinkOutputSerializer(serializers.ModelSerializer):
 
 class OriginalImageWithLinkOutputSerializer(serializers.ModelSerializer):
     thumbnails = ThumbnailOutputSerializer(many=True, read_only=True)
+    # originals are not public, the action serves them through nginx
+    image = serializers.HyperlinkedIdentityField(
+        view_name="images:image-original", lookup_field="pk", read_only=True
+    )
     temporary_link_generator = serializers.HyperlinkedIdentityField(
         view_name="images:generate-image-link", lookup_field="pk", read_only=True
     )
@@ -129,6 +312,9 @@ class OriginalImageWithLinkOutputSerializer(serializers.ModelSerializer):
             "id",
             "title",
             "thumbnails",
+            "near_duplicate_of",
+            "placeholder",
+            "dominant_color",
             "image",
             "temporary_link_generator",
             "created_at",
@@ -1,81 +1,786 @@
-import io
 import os
+import time
+from collections import defaultdict
 from datetime import timedelta
-from typing import Any
+from typing import Any, BinaryIO, Iterable, NamedTuple, Optional, Union
 from uuid import UUID
+from django.conf import settings
+from django.core.cache import cache
 from django.db import transaction
-from django.core.files.base import ContentFile
+from django.db.models import Exists, F, OuterRef
+from django.db.models.functions import Least
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import UploadedFile
 from PIL import Image
 from django.shortcuts import get_object_or_404
 from django.utils import timezone
 
-from src.apps.images.exceptions import InvalidImageAccessToken, UnsupportedFileExtension
+from src.apps.images.exceptions import (
+    IncompleteUpload,
+    InvalidImageAccessToken,
+    InvalidUploadChunk,
+    UnsupportedFileExtension,
+)
 from src.apps.accounts.models import UserAccount
-from src.apps.images.models import ImageAccessToken, Thumbnail, Image as ImageModel
+from src.apps.images.derivatives import DerivativeCache
+from src.apps.images.engine import (
+    RenderEngine,
+    build_thumbnail,
+    copy_image_summaries,
+    delete_thumbnail_files,
+    get_render_profiles,
+    store_image_summaries,
+)
+from src.apps.images.links import SignedAccessToken, is_revoked
+from src.apps.images.models import (
+    BackfillCheckpoint,
+    ImageAccessToken,
+    RevokedAccessToken,
+    Thumbnail,
+    ThumbnailJob,
+    UploadSession,
+    Image as ImageModel,
+)
+from src.apps.images.rendering import (
+    PLACEHOLDER_SIZE,
+    RenderTask,
+    get_cascade_summary,
+    get_supported_formats,
+    open_image,
+    render_thumbnail_cascade,
+    summarize_image,
+)
+from src.apps.images.sprites import (
+    SpriteSheet,
+    encode_sprite,
+    get_sprite_key,
+    layout_sprite,
+    render_sprite,
+)
+from src.apps.images.response_cache import (
+    bump_image_owner_versions,
+    bump_user_versions,
+)
+from src.apps.memberships.profiles import get_membership_profile_by_user_id
+from src.apps.images.uploadhandlers import inspect_image_file
 from src.apps.images.utils import (
     get_thumbnail_dimensions,
+    get_content_image_name,
+    get_file_sha256,
     get_format,
-    get_thumbnail_filename,
-    get_new_image_name,
 )
 
 
 class ImageService:
     @classmethod
-    def _create_thumbnail(
-        self, instance: ImageModel, thumbnail_size: tuple[int]
-    ) -> Thumbnail:
-        image = instance.image
-        image_file = Image.open(image.path)
-
-        image_file.thumbnail(thumbnail_size, Image.ANTIALIAS)
-
-        image_filename = os.path.basename(image.name)
+    def build_thumbnails(
+        cls,
+        image_model: ImageModel,
+        heights: Iterable[int],
+        source: Optional[BinaryIO] = None,
+    ) -> list[Thumbnail]:
+        image_filename = os.path.basename(image_model.image.name)
         name, extension = image_filename.split(".")
 
-        thumbnail_filename = get_thumbnail_filename(
-            name=name, extension=extension, size=thumbnail_size
-        )
         format = get_format(extension=extension)
         if not format:
             raise UnsupportedFileExtension(
                 "We do not provide support for this file extension."
             )
-        temporary_thumbnail = io.BytesIO()
-        image_file.save(temporary_thumbnail, format)
-        file = ContentFile(temporary_thumbnail.getvalue(), name=thumbnail_filename)
-        temporary_thumbnail.close()
-
-        thumbnail = Thumbnail.objects.create(image=instance, thumbnail=file)
-        return thumbnail
 
-    @classmethod
-    def create_thumbnails(cls, image_model: ImageModel, thumbnail_sizes):
-        for thumbnail_size in thumbnail_sizes:
-            size = get_thumbnail_dimensions(
+        sizes = {
+            get_thumbnail_dimensions(
                 image_height=image_model.height,
                 image_width=image_model.width,
-                thumbnail_height=thumbnail_size.height,
+                thumbnail_height=height,
             )
-            cls._create_thumbnail(instance=image_model, thumbnail_size=size)
+            for height in heights
+        }
+        if source is None:
+            source = image_model.image.path
+        else:
+            source.seek(0)
+
+        rendered = render_thumbnail_cascade(
+            source=source,
+            sizes=list(sizes),
+            format=format,
+            variant_formats=settings.THUMBNAIL_VARIANT_FORMATS,
+            profiles=get_render_profiles(),
+            summarize=True,
+        )
+        store_image_summaries({image_model.id: get_cascade_summary(rendered)})
+        return [
+            build_thumbnail(
+                image_id=image_model.id,
+                name=name,
+                extension=extension,
+                rendered=thumbnail,
+            )
+            for thumbnail in rendered
+        ]
+
+    @classmethod
+    def render_thumbnails(
+        cls,
+        image_model: ImageModel,
+        heights: Iterable[int],
+        source: Optional[BinaryIO] = None,
+    ) -> list[Thumbnail]:
+        thumbnails = cls.build_thumbnails(
+            image_model=image_model, heights=heights, source=source
+        )
+        return cls.save_thumbnails(image_model=image_model, thumbnails=thumbnails)
+
+    @classmethod
+    def save_thumbnails(
+        cls, image_model: ImageModel, thumbnails: list[Thumbnail]
+    ) -> list[Thumbnail]:
+        thumbnails = Thumbnail.objects.bulk_create(thumbnails)
+        # new thumbnails change the image's representation, see ImageViewSet.get_etag
+        ImageModel.objects.filter(id=image_model.id).update(updated_at=timezone.now())
+        bump_image_owner_versions([image_model.id])
+        return thumbnails
+
+    @classmethod
+    def create_thumbnails(
+        cls,
+        image_model: ImageModel,
+        thumbnail_sizes,
+        source: Optional[BinaryIO] = None,
+    ) -> list[Thumbnail]:
+        heights = [thumbnail_size.height for thumbnail_size in thumbnail_sizes]
+        return cls.render_thumbnails(
+            image_model=image_model, heights=heights, source=source
+        )
+
+    @classmethod
+    def summarize_images(cls, image_models: list[ImageModel]) -> dict[UUID, str]:
+        """
+        Computes missing placeholders, dominant colors and hashes from the
+        smallest stored thumbnail of each image, or the original if it has
+        none. Returns errors by image id.
+        """
+        sources = {image_model.id: image_model.image for image_model in image_models}
+        thumbnails = Thumbnail.objects.filter(image__in=image_models).order_by(
+            "-height"
+        )
+        for thumbnail in thumbnails.only("image_id", "thumbnail", "width", "height"):
+            sources[thumbnail.image_id] = thumbnail.thumbnail
+
+        summaries = {}
+        errors = {}
+        for image_id, source in sources.items():
+            try:
+                with source.open("rb") as file:
+                    image = open_image(file, (PLACEHOLDER_SIZE, PLACEHOLDER_SIZE))
+                summaries[image_id] = summarize_image(image)
+            except (OSError, ValueError) as exc:
+                errors[image_id] = f"{exc.__class__.__name__}: {exc}"
+
+        store_image_summaries(summaries)
+        ImageModel.objects.filter(id__in=summaries).update(updated_at=timezone.now())
+        bump_image_owner_versions(list(summaries))
+        return errors
+
+    @classmethod
+    def render_derivative(
+        cls,
+        image_model: ImageModel,
+        height: int,
+        format: str,
+        source: Optional[str] = None,
+    ) -> bytes:
+        size = get_thumbnail_dimensions(
+            image_height=image_model.height,
+            image_width=image_model.width,
+            thumbnail_height=height,
+        )
+        [rendered] = render_thumbnail_cascade(
+            source=source or image_model.image.path,
+            sizes=[size],
+            format=format,
+            profiles=get_render_profiles(),
+        )
+        return rendered.content
+
+    @classmethod
+    def open_derivative(
+        cls, image_model: ImageModel, height: int, extension: str
+    ) -> BinaryIO:
+        """
+        Serves the stored thumbnail of ``height`` if it is already encoded in
+        the requested format, otherwise renders the derivative from it, or
+        from the original if the image has no such thumbnail.
+        """
+        format = settings.DERIVATIVE_FORMATS[extension]
+        source = None
+        thumbnail = (
+            Thumbnail.objects.filter(image=image_model, height=height)
+            .only("thumbnail", "width", "height", "variants")
+            .first()
+        )
+        if thumbnail is not None:
+            name = thumbnail.thumbnail.name
+            if get_format(extension=os.path.splitext(name)[1][1:]) == format:
+                return default_storage.open(name, "rb")
+            if extension in thumbnail.variants:
+                return default_storage.open(thumbnail.variants[extension]["name"], "rb")
+            source = thumbnail.thumbnail.path
+
+        cache = DerivativeCache.from_settings()
+        return cache.open(
+            key=f"{image_model.id.hex}-{height}.{extension}",
+            render=lambda: cls.render_derivative(
+                image_model=image_model, height=height, format=format, source=source
+            ),
+        )
 
     @classmethod
-    @transaction.atomic
     def upload_image(
         cls, data: dict[str, Any], user_account: UserAccount
     ) -> ImageModel:
-        title = data["title"]
-        image_file = data["image"]
+        [image_model] = cls.bulk_upload_images(items=[data], user_account=user_account)
+        return image_model
 
-        new_name = get_new_image_name(image_file.name)
-        image_file.name = new_name
+    @classmethod
+    def get_stored_images(cls, hashes: Iterable[str]) -> dict[str, ImageModel]:
+        """
+        Images already holding a file with the given content, by hash.
+        """
+        stored = {}
+        images = ImageModel.objects.filter(sha256__in=set(hashes)).only(
+            "id", "image", "width", "height", "sha256"
+        )
+        for image_model in images:
+            if image_model.sha256 in stored:
+                continue
+            if default_storage.exists(image_model.image.name):
+                stored[image_model.sha256] = image_model
+        return stored
+
+    @classmethod
+    def get_stored_thumbnails(
+        cls, hashes: Iterable[str], heights: Iterable[int]
+    ) -> dict[tuple[str, int], Thumbnail]:
+        """
+        Rendered thumbnails of the given content, by hash and height.
+        """
+        thumbnails = Thumbnail.objects.filter(
+            image__sha256__in=set(hashes), height__in=set(heights)
+        ).annotate(sha256=F("image__sha256"))
+        return {
+            (thumbnail.sha256, thumbnail.height): thumbnail for thumbnail in thumbnails
+        }
 
-        image_model = ImageModel.objects.create(
-            image=image_file, title=title, uploaded_by=user_account
+    @classmethod
+    def copy_thumbnail(cls, image_model: ImageModel, thumbnail: Thumbnail) -> Thumbnail:
+        # the copy points at the same files, they are released with the last row
+        return Thumbnail(
+            image=image_model,
+            thumbnail=thumbnail.thumbnail.name,
+            width=thumbnail.width,
+            height=thumbnail.height,
+            variants=thumbnail.variants,
         )
-        thumbnail_sizes = user_account.membership_type.thumbnail_sizes.all()
-        cls.create_thumbnails(image_model=image_model, thumbnail_sizes=thumbnail_sizes)
-        return image_model
+
+    @classmethod
+    @transaction.atomic
+    def bulk_upload_images(
+        cls, items: list[dict[str, Any]], user_account: UserAccount
+    ) -> list[ImageModel]:
+        hashes = []
+        for data in items:
+            image_file = data["image"]
+            # files received by ImageUploadHandler are hashed while streamed
+            hashes.append(
+                getattr(image_file, "sha256", None) or get_file_sha256(image_file)
+            )
+        stored = cls.get_stored_images(hashes)
+
+        image_models = [None] * len(items)
+        duplicates = []
+        for index, (data, sha256) in enumerate(zip(items, hashes)):
+            if sha256 in stored:
+                duplicates.append(index)
+                continue
+            image_file = data["image"]
+            image_file.name = get_content_image_name(image_file.name, sha256)
+            # filling in dimensions known from the upload spares ImageField
+            # from reading the file again
+            width, height = getattr(image_file, "image_size", None) or (0, 0)
+            image_models[index] = ImageModel(
+                image=image_file,
+                title=data["title"],
+                uploaded_by=user_account,
+                width=width,
+                height=height,
+                sha256=sha256,
+            )
+            stored[sha256] = image_models[index]
+        new_images = ImageModel.objects.bulk_create(filter(None, image_models))
+
+        # duplicates, of stored images or of ones inserted above, reuse the
+        # stored file and are neither written nor decoded again
+        for index in duplicates:
+            source = stored[hashes[index]]
+            image_models[index] = ImageModel(
+                image=source.image.name,
+                title=items[index]["title"],
+                uploaded_by=user_account,
+                width=source.width,
+                height=source.height,
+                sha256=source.sha256,
+            )
+        ImageModel.objects.bulk_create([image_models[index] for index in duplicates])
+        bump_user_versions([user_account.user_id])
+
+        profile = get_membership_profile_by_user_id(user_account.user_id)
+        heights = set(profile.thumbnail_heights)
+        if settings.THUMBNAILS_ASYNC:
+            ThumbnailJobService.enqueue_jobs_for_images(
+                image_models=new_images, heights=heights
+            )
+        else:
+            new_ids = {image_model.id for image_model in new_images}
+            thumbnails = []
+            for image_model, data in zip(image_models, items):
+                if image_model.id in new_ids:
+                    thumbnails += cls.build_thumbnails(
+                        image_model=image_model, heights=heights, source=data["image"]
+                    )
+            Thumbnail.objects.bulk_create(thumbnails)
+        if not duplicates:
+            return image_models
+        copy_image_summaries(
+            images=[image_models[index] for index in duplicates],
+            sources=[stored[hashes[index]] for index in duplicates],
+        )
+
+        # thumbnails of sizes already rendered are shared as well, only the
+        # missing ones are rendered or queued
+        rendered = cls.get_stored_thumbnails(
+            hashes=[hashes[index] for index in duplicates], heights=heights
+        )
+        thumbnails = []
+        for index in duplicates:
+            image_model = image_models[index]
+            missing = []
+            for height in heights:
+                thumbnail = rendered.get((image_model.sha256, height))
+                if thumbnail is None:
+                    missing.append(height)
+                else:
+                    thumbnails.append(cls.copy_thumbnail(image_model, thumbnail))
+            if not missing:
+                continue
+            if settings.THUMBNAILS_ASYNC:
+                ThumbnailJobService.enqueue_jobs_for_images(
+                    image_models=[image_model], heights=missing
+                )
+            else:
+                thumbnails += cls.build_thumbnails(
+                    image_model=image_model,
+                    heights=missing,
+                    source=items[index]["image"],
+                )
+        Thumbnail.objects.bulk_create(thumbnails)
+        return image_models
+
+    @classmethod
+    def release_image_files(cls, names: Iterable[str]) -> None:
+        """
+        Deletes image files no image row refers to anymore.
+        """
+        names = set(filter(None, names))
+        referenced = set(
+            ImageModel.objects.filter(image__in=names).values_list("image", flat=True)
+        )
+        for name in names - referenced:
+            default_storage.delete(name)
+
+    @classmethod
+    def release_thumbnail_files(cls, thumbnails: dict[str, dict]) -> None:
+        """
+        Deletes thumbnail files, with their variants, no thumbnail row refers
+        to anymore. ``thumbnails`` maps file names to variants.
+        """
+        referenced = set(
+            Thumbnail.objects.filter(thumbnail__in=thumbnails).values_list(
+                "thumbnail", flat=True
+            )
+        )
+        for name, variants in thumbnails.items():
+            if not name or name in referenced:
+                continue
+            default_storage.delete(name)
+            for variant in variants.values():
+                default_storage.delete(variant["name"])
+
+
+class ThumbnailJobService:
+    """
+    Postgres-backed queue of thumbnail renders.
+
+    Uploads enqueue one job per thumbnail height, workers claim them with
+    ``SELECT ... FOR UPDATE SKIP LOCKED`` so several of them can drain the
+    queue concurrently without a message broker.
+    """
+
+    render_service_class = ImageService
+
+    @classmethod
+    def enqueue_jobs_for_images(
+        cls, image_models: list[ImageModel], heights: Iterable[int]
+    ) -> list[ThumbnailJob]:
+        jobs = [
+            ThumbnailJob(image=image_model, height=height)
+            for image_model in image_models
+            for height in set(heights)
+        ]
+        return ThumbnailJob.objects.bulk_create(jobs)
+
+    @classmethod
+    def enqueue_jobs(
+        cls, image_model: ImageModel, thumbnail_sizes
+    ) -> list[ThumbnailJob]:
+        return cls.enqueue_jobs_for_images(
+            image_models=[image_model],
+            heights=[thumbnail_size.height for thumbnail_size in thumbnail_sizes],
+        )
+
+    @classmethod
+    def claim_jobs(cls, limit: int) -> list[ThumbnailJob]:
+        now = timezone.now()
+        with transaction.atomic():
+            jobs = list(
+                ThumbnailJob.objects.select_for_update(skip_locked=True)
+                .filter(status=ThumbnailJob.Status.PENDING, run_after__lte=now)
+                .order_by("run_after")[:limit]
+            )
+            ThumbnailJob.objects.filter(id__in=[job.id for job in jobs]).update(
+                status=ThumbnailJob.Status.PROCESSING,
+                locked_at=now,
+                attempts=F("attempts") + 1,
+            )
+        for job in jobs:
+            job.status = ThumbnailJob.Status.PROCESSING
+            job.locked_at = now
+            job.attempts += 1
+        return jobs
+
+    @classmethod
+    def requeue_stale_jobs(cls) -> int:
+        """
+        Requeues jobs whose worker died while processing them. A job that
+        keeps killing its worker (out of memory, decompression bomb) never
+        records an error, so it fails once it used up its attempts.
+        """
+        now = timezone.now()
+        stale_jobs = ThumbnailJob.objects.filter(
+            status=ThumbnailJob.Status.PROCESSING,
+            locked_at__lt=now - timedelta(seconds=settings.THUMBNAIL_JOB_LOCK_TIMEOUT),
+        )
+        max_attempts = settings.THUMBNAIL_JOB_MAX_ATTEMPTS
+        stale_jobs.filter(attempts__gte=max_attempts).update(
+            status=ThumbnailJob.Status.FAILED,
+            locked_at=None,
+            last_error="Worker stopped while processing the job",
+            updated_at=now,
+        )
+        return stale_jobs.filter(attempts__lt=max_attempts).update(
+            status=ThumbnailJob.Status.PENDING, locked_at=None, updated_at=now
+        )
+
+    @classmethod
+    def _complete_jobs(cls, jobs: list[ThumbnailJob], image_model: ImageModel) -> None:
+        # rendering takes a while, only the rows are written in a transaction
+        thumbnails = cls.render_service_class.build_thumbnails(
+            image_model=image_model, heights=[job.height for job in jobs]
+        )
+        try:
+            with transaction.atomic():
+                cls.render_service_class.save_thumbnails(
+                    image_model=image_model, thumbnails=thumbnails
+                )
+                ThumbnailJob.objects.filter(id__in=[job.id for job in jobs]).update(
+                    status=ThumbnailJob.Status.DONE,
+                    locked_at=None,
+                    last_error="",
+                    updated_at=timezone.now(),
+                )
+        except Exception:
+            delete_thumbnail_files(thumbnails)
+            raise
+
+    @classmethod
+    def _fail_job(cls, job: ThumbnailJob, exc: Exception) -> None:
+        job.locked_at = None
+        job.last_error = f"{exc.__class__.__name__}: {exc}"
+        if job.attempts >= settings.THUMBNAIL_JOB_MAX_ATTEMPTS:
+            job.status = ThumbnailJob.Status.FAILED
+        else:
+            delay = settings.THUMBNAIL_JOB_RETRY_DELAY * 2 ** (job.attempts - 1)
+            job.status = ThumbnailJob.Status.PENDING
+            job.run_after = timezone.now() + timedelta(seconds=delay)
+        job.save(
+            update_fields=[
+                "status",
+                "locked_at",
+                "last_error",
+                "run_after",
+                "updated_at",
+            ]
+        )
+
+    @classmethod
+    def process_jobs(cls, limit: int) -> int:
+        jobs = cls.claim_jobs(limit=limit)
+        images = ImageModel.objects.in_bulk({job.image_id for job in jobs})
+
+        jobs_by_image = defaultdict(list)
+        for job in jobs:
+            jobs_by_image[job.image_id].append(job)
+
+        for image_id, image_jobs in jobs_by_image.items():
+            if image_id not in images:
+                # image was deleted in the meantime, its jobs went with it
+                continue
+            try:
+                cls._complete_jobs(jobs=image_jobs, image_model=images[image_id])
+            except Exception as exc:
+                for job in image_jobs:
+                    cls._fail_job(job=job, exc=exc)
+        return len(jobs)
+
+
+class ThumbnailBackfillService:
+    """
+    Finds thumbnails missing after a membership's sizes change and renders
+    them, preferring an existing larger thumbnail over the original as the
+    source.
+    """
+
+    @classmethod
+    def get_checkpoint(cls, name: str, reset: bool = False) -> BackfillCheckpoint:
+        checkpoint, _ = BackfillCheckpoint.objects.get_or_create(name=name)
+        if reset:
+            checkpoint.last_image_id = None
+            checkpoint.save(update_fields=["last_image_id", "updated_at"])
+        return checkpoint
+
+    @classmethod
+    def get_image_batch(cls, after: Optional[UUID], limit: int) -> list[UUID]:
+        images = ImageModel.objects.order_by("id")
+        if after:
+            images = images.filter(id__gt=after)
+        return list(images.values_list("id", flat=True)[:limit])
+
+    @classmethod
+    def get_missing_thumbnails(cls, image_ids: list[UUID]) -> dict[UUID, set[int]]:
+        unfinished_jobs = ThumbnailJob.objects.filter(
+            image=OuterRef("pk"),
+            status__in=[ThumbnailJob.Status.PENDING, ThumbnailJob.Status.PROCESSING],
+        )
+        # thumbnails are never upscaled, so an image smaller than the requested
+        # size has a thumbnail as high as the image itself
+        expected = (
+            ImageModel.objects.filter(
+                id__in=image_ids,
+                uploaded_by__membership_type__thumbnail_sizes__isnull=False,
+            )
+            .filter(~Exists(unfinished_jobs))
+            .annotate(
+                thumbnail_height=Least(
+                    "height", "uploaded_by__membership_type__thumbnail_sizes__height"
+                )
+            )
+            .order_by()
+            .values_list("id", "thumbnail_height")
+        )
+        existing = (
+            Thumbnail.objects.filter(image_id__in=image_ids)
+            .order_by()
+            .values_list("image_id", "height")
+        )
+
+        missing = defaultdict(set)
+        for image_id, height in expected.difference(existing):
+            missing[image_id].add(height)
+        return missing
+
+    @classmethod
+    def build_tasks(cls, missing: dict[UUID, set[int]]) -> list[RenderTask]:
+        images = ImageModel.objects.in_bulk(missing.keys())
+
+        sources = {}
+        for thumbnail in Thumbnail.objects.filter(image_id__in=missing.keys()).order_by(
+            "height"
+        ):
+            image_id = thumbnail.image_id
+            if image_id not in sources and thumbnail.height > max(missing[image_id]):
+                sources[image_id] = thumbnail.thumbnail.path
+
+        profiles = get_render_profiles()
+        tasks = []
+        for image_id, heights in missing.items():
+            task = RenderEngine.build_task(
+                image_model=images[image_id], heights=heights, profiles=profiles
+            )
+            if image_id in sources:
+                task = task._replace(source_path=sources[image_id])
+            tasks.append(task)
+        return tasks
+
+
+class SweepResult(NamedTuple):
+    deleted: int
+    seconds: float
+
+
+class TokenSweepResult(NamedTuple):
+    deleted: int
+    revocations_deleted: int
+    seconds: float
+
+
+def merge_ranges(ranges: list[list[int]]) -> list[list[int]]:
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return merged
+
+
+class UploadSessionService:
+    """
+    Resumable uploads. Every chunk is written at its offset into a
+    preallocated sparse file, so chunks may arrive in any order and a retry
+    only resends the missing ranges. Memory use does not depend on the
+    file size.
+    """
+
+    upload_service_class = ImageService
+    chunk_size = 64 * 1024
+
+    @staticmethod
+    def get_path(session_id: UUID) -> str:
+        return os.path.join(settings.UPLOAD_SESSIONS_DIR, f"{session_id.hex}.part")
+
+    @staticmethod
+    def get_expiry_date():
+        return timezone.now() + timedelta(seconds=settings.UPLOAD_SESSION_TTL)
+
+    @classmethod
+    def create_session(
+        cls, data: dict[str, Any], user_account: UserAccount
+    ) -> UploadSession:
+        session = UploadSession.objects.create(
+            uploaded_by=user_account,
+            title=data["title"],
+            filename=data["filename"],
+            size=data["size"],
+            expires=cls.get_expiry_date(),
+        )
+        os.makedirs(settings.UPLOAD_SESSIONS_DIR, exist_ok=True)
+        with open(cls.get_path(session.id), "wb") as file:
+            file.truncate(session.size)
+        return session
+
+    @classmethod
+    def write_chunk(
+        cls, session: UploadSession, start: int, length: int, stream: BinaryIO
+    ) -> UploadSession:
+        if start < 0 or length <= 0 or start + length > session.size:
+            raise InvalidUploadChunk("Chunk does not fit in the uploaded file")
+
+        written = 0
+        with open(cls.get_path(session.id), "r+b") as file:
+            file.seek(start)
+            while written < length:
+                chunk = stream.read(min(cls.chunk_size, length - written))
+                if not chunk:
+                    break
+                file.write(chunk)
+                written += len(chunk)
+            file.flush()
+            # the range is recorded only once its bytes are on disk
+            os.fsync(file.fileno())
+
+        if written != length:
+            raise InvalidUploadChunk("Chunk is shorter than its Content-Range")
+
+        with transaction.atomic():
+            session = UploadSession.objects.select_for_update().get(id=session.id)
+            session.received_ranges = merge_ranges(
+                session.received_ranges + [[start, start + length]]
+            )
+            session.expires = cls.get_expiry_date()
+            session.save(update_fields=["received_ranges", "expires", "updated_at"])
+        return session
+
+    @classmethod
+    def open_upload(cls, session: UploadSession) -> UploadedFile:
+        if not session.is_complete:
+            raise IncompleteUpload("Upload is missing some of its bytes")
+        upload = UploadedFile(
+            file=open(cls.get_path(session.id), "rb"),
+            name=session.filename,
+            size=session.size,
+        )
+        # the same format and pixel checks as uploads through the images endpoint
+        inspect_image_file(upload)
+        return upload
+
+    @classmethod
+    @transaction.atomic
+    def finalize_session(
+        cls, session: UploadSession, data: dict[str, Any]
+    ) -> ImageModel:
+        # locks the session, a concurrent finalize waits and then finds it gone
+        session = get_object_or_404(
+            UploadSession.objects.select_for_update().select_related("uploaded_by"),
+            id=session.id,
+        )
+        image = cls.upload_service_class.upload_image(
+            data=data, user_account=session.uploaded_by
+        )
+        cls.delete_session(session)
+        return image
+
+    @classmethod
+    def delete_session(cls, session: UploadSession) -> None:
+        path = cls.get_path(session.id)
+        session.delete()
+        transaction.on_commit(lambda: cls._remove_file(path))
+
+    @staticmethod
+    def _remove_file(path: str) -> None:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    @classmethod
+    def delete_expired_sessions(cls, batch_size: int) -> SweepResult:
+        start = time.perf_counter()
+        now = timezone.now()
+        deleted = 0
+        while True:
+            expired_ids = list(
+                UploadSession.objects.filter(expires__lt=now).values_list(
+                    "id", flat=True
+                )[:batch_size]
+            )
+            if not expired_ids:
+                break
+            UploadSession.objects.filter(id__in=expired_ids).delete()
+            for session_id in expired_ids:
+                cls._remove_file(cls.get_path(session_id))
+            deleted += len(expired_ids)
+        return SweepResult(deleted=deleted, seconds=time.perf_counter() - start)
 
 
 class TemporaryLinkService:
@@ -85,23 +790,174 @@ class TemporaryLinkService:
         cls,
         image_id: UUID,
         data: dict[str, int],
-    ) -> ImageAccessToken:
+    ) -> Union[ImageAccessToken, SignedAccessToken]:
         image = get_object_or_404(ImageModel, id=image_id)
 
         seconds = data["seconds"]
         expires = timezone.now() + timedelta(seconds=seconds)
+        if data.get("signed"):
+            return SignedAccessToken.create(
+                image_id=image.id, image_name=image.image.name, expires=expires
+            )
         token = ImageAccessToken.objects.create(image=image, expires=expires)
         return token
 
     @classmethod
     def _validate_access_token(cls, access_token: ImageAccessToken) -> ImageAccessToken:
+        # expired tokens are removed in bulk by delete_expired_tokens
         if access_token.expires < timezone.now():
-            access_token.delete()
             raise InvalidImageAccessToken("Invalid access token")
         return
 
+    @classmethod
+    def delete_expired_tokens(cls, batch_size: int) -> TokenSweepResult:
+        """
+        Deletes expired tokens in batches of ``batch_size`` rows, each in its
+        own short transaction, so no lock is held for long, and revocations
+        of expired signed tokens.
+        """
+        start = time.perf_counter()
+        now = timezone.now()
+        deleted = 0
+        while True:
+            expired_ids = list(
+                ImageAccessToken.objects.filter(expires__lt=now).values_list(
+                    "id", flat=True
+                )[:batch_size]
+            )
+            if not expired_ids:
+                break
+            batch_deleted, _ = ImageAccessToken.objects.filter(
+                id__in=expired_ids
+            ).delete()
+            deleted += batch_deleted
+
+        # revocations are only needed until the signed token expires anyway
+        revocations_deleted, _ = RevokedAccessToken.objects.filter(
+            expires__lt=now
+        ).delete()
+        return TokenSweepResult(
+            deleted=deleted,
+            revocations_deleted=revocations_deleted,
+            seconds=time.perf_counter() - start,
+        )
+
+    @classmethod
+    def get_image_name_from_signed_token(cls, token: str) -> str:
+        access_token = SignedAccessToken.load(token)
+        if access_token.expires < timezone.now() or is_revoked(access_token.signature):
+            raise InvalidImageAccessToken("Invalid access token")
+        return access_token.image_name
+
+    @classmethod
+    def revoke_signed_token(cls, token: str) -> RevokedAccessToken:
+        access_token = SignedAccessToken.load(token)
+        revoked_token, _ = RevokedAccessToken.objects.get_or_create(
+            signature=access_token.signature,
+            defaults={"expires": access_token.expires},
+        )
+        return revoked_token
+
     @classmethod
     def get_image_from_token(cls, access_token_id: UUID) -> Image:
         access_token = get_object_or_404(ImageAccessToken, id=access_token_id)
         cls._validate_access_token(access_token)
         return access_token.image
+
+
+class SpriteService:
+    """
+    Sprite sheets of a page of images, one thumbnail height each. Sheets are
+    described in the cache by a key derived from their content, the files
+    are rendered into the derivative cache on first request.
+    """
+
+    cache_prefix = "images:sprite"
+
+    @classmethod
+    def get_format(cls) -> str:
+        return (get_supported_formats(["WEBP"]) or ("PNG",))[0]
+
+    @classmethod
+    def get_file_key(cls, sheet: SpriteSheet) -> str:
+        return f"sprite-{sheet.key}.{cls.get_format().lower()}"
+
+    @classmethod
+    def get_master_key(cls, sheet: SpriteSheet) -> str:
+        return f"sprite-{sheet.key}.png"
+
+    @classmethod
+    def get_sheet(
+        cls, user_id: int, image_models: Iterable[ImageModel], height: int
+    ) -> SpriteSheet:
+        # thumbnails are prefetched along with the page
+        thumbnails = [
+            thumbnail
+            for image_model in image_models
+            for thumbnail in image_model.thumbnails.all()
+            if thumbnail.height == height
+        ]
+        tiles, width, sheet_height = layout_sprite(
+            thumbnails, max_width=settings.SPRITE_MAX_WIDTH
+        )
+        sheet = SpriteSheet(
+            key=get_sprite_key(user_id, height, tiles),
+            user_id=user_id,
+            thumbnail_height=height,
+            width=width,
+            height=sheet_height,
+            tiles=tuple(tiles),
+        )
+        cache.set(
+            f"{cls.cache_prefix}:{sheet.key}", sheet, timeout=settings.SPRITE_TIMEOUT
+        )
+        return sheet
+
+    @classmethod
+    def get_cached_sheet(cls, key: str) -> Optional[SpriteSheet]:
+        return cache.get(f"{cls.cache_prefix}:{key}")
+
+    @classmethod
+    def render_master(cls, sheet: SpriteSheet) -> bytes:
+        latest_key = (
+            f"{cls.cache_prefix}-latest:{sheet.user_id}:{sheet.thumbnail_height}"
+        )
+        previous = cls.get_cached_sheet(cache.get(latest_key, ""))
+        previous_file = None
+        if previous is not None:
+            previous_file = DerivativeCache.from_settings().get(
+                cls.get_master_key(previous)
+            )
+        try:
+            content = render_sprite(
+                sheet, previous=previous, previous_file=previous_file
+            )
+        finally:
+            if previous_file is not None:
+                previous_file.close()
+        cache.set(latest_key, sheet.key, timeout=settings.SPRITE_TIMEOUT)
+        return content
+
+    @classmethod
+    def open_sprite(cls, sheet: SpriteSheet) -> BinaryIO:
+        """
+        Serves a lossy WebP encoded from the lossless PNG master, which later
+        sheets reuse tiles from. Without WebP the master is served itself.
+        """
+        derivatives = DerivativeCache.from_settings()
+        master_key = cls.get_master_key(sheet)
+        format = cls.get_format()
+
+        def render_master() -> bytes:
+            return cls.render_master(sheet)
+
+        if format == "PNG":
+            return derivatives.open(key=master_key, render=render_master)
+
+        def render() -> bytes:
+            with derivatives.open(key=master_key, render=render_master) as master:
+                return encode_sprite(
+                    master, format=format, quality=settings.SPRITE_WEBP_QUALITY
+                )
+
+        return derivatives.open(key=cls.get_file_key(sheet), render=render)
@@ -0,0 +1,112 @@
+import mimetypes
+import os
+import re
+from typing import Iterator, Optional
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.http import FileResponse, Http404, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+CHUNK_SIZE = 64 * 1024
+
+
+class UnsatisfiableRange(Exception):
+    pass
+
+
+def parse_range(header: str, size: int) -> Optional[tuple[int]]:
+    """
+    Returns the inclusive (start, end) byte range requested by a ``Range``
+    header. Only single ranges are supported, anything else is ignored and
+    the whole file is served.
+    """
+    match = RANGE_RE.match(header.strip())
+    if not match or match.groups() == ("", ""):
+        return None
+
+    start, end = match.groups()
+    if not start:
+        # suffix range, the last ``end`` bytes
+        length = int(end)
+        if length == 0:
+            raise UnsatisfiableRange()
+        return max(size - length, 0), size - 1
+
+    start = int(start)
+    end = min(int(end), size - 1) if end else size - 1
+    if start >= size or start > end:
+        raise UnsatisfiableRange()
+    return start, end
+
+
+def read_range(path: str, start: int, end: int) -> Iterator[bytes]:
+    with open(path, "rb") as file:
+        file.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = file.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def serve_media_file(request, name: str) -> HttpResponse:
+    """
+    Serves a stored file after Django has authorized the request.
+
+    With ``TEMPORARY_LINK_SERVE_MODE = "accel"`` nginx sends the bytes from
+    an ``internal`` location (sendfile, ranges), otherwise they are streamed
+    by Django, which is meant for development.
+    """
+    try:
+        path = default_storage.path(name)
+        stat = os.stat(path)
+    except (FileNotFoundError, NotImplementedError):
+        raise Http404("Image file does not exist")
+
+    etag = f'"{int(stat.st_mtime):x}-{stat.st_size:x}"'
+    last_modified = int(stat.st_mtime)
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        content_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+        if settings.TEMPORARY_LINK_SERVE_MODE == "accel":
+            response = HttpResponse(content_type=content_type)
+            response["X-Accel-Redirect"] = settings.PROTECTED_MEDIA_URL + name
+        else:
+            response = _stream_file(request, path, stat.st_size, etag, content_type)
+
+    response["ETag"] = etag
+    response["Last-Modified"] = http_date(last_modified)
+    response["Cache-Control"] = "private"
+    return response
+
+
+def _stream_file(
+    request, path: str, size: int, etag: str, content_type: str
+) -> HttpResponse:
+    byte_range = None
+    range_header = request.headers.get("Range")
+    if_range = request.headers.get("If-Range")
+    if range_header and (if_range is None or if_range == etag):
+        try:
+            byte_range = parse_range(range_header, size)
+        except UnsatisfiableRange:
+            response = HttpResponse(status=416)
+            response["Content-Range"] = f"bytes */{size}"
+            return response
+
+    if byte_range is None:
+        response = FileResponse(open(path, "rb"), content_type=content_type)
+    else:
+        start, end = byte_range
+        response = StreamingHttpResponse(
+            read_range(path, start, end), status=206, content_type=content_type
+        )
+        response["Content-Range"] = f"bytes {start}-{end}/{size}"
+        response["Content-Length"] = str(end - start + 1)
+    response["Accept-Ranges"] = "bytes"
+    return response
@@ -0,0 +1,40 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from src.apps.accounts.models import UserAccount
+from src.apps.images.links import clear_revocations
+from src.apps.images.models import Image, RevokedAccessToken, Thumbnail
+from src.apps.images.response_cache import bump_user_versions
+from src.apps.images.services import ImageService
+
+
+@receiver(post_save, sender=RevokedAccessToken)
+@receiver(post_delete, sender=RevokedAccessToken)
+def reload_revocations(sender, **kwargs):
+    clear_revocations()
+
+
+@receiver(post_save, sender=Image)
+@receiver(post_delete, sender=Image)
+def invalidate_owner_responses(sender, instance, **kwargs):
+    # bulk uploads and thumbnail renders bump versions themselves
+    if instance.uploaded_by_id is not None:
+        bump_user_versions(
+            UserAccount.objects.filter(id=instance.uploaded_by_id).values_list(
+                "user_id", flat=True
+            )
+        )
+
+
+@receiver(post_delete, sender=Image)
+def release_image_file(sender, instance, **kwargs):
+    # identical uploads share a file, it goes with the last image using it
+    name = instance.image.name
+    transaction.on_commit(lambda: ImageService.release_image_files([name]))
+
+
+@receiver(post_delete, sender=Thumbnail)
+def release_thumbnail_file(sender, instance, **kwargs):
+    thumbnails = {instance.thumbnail.name: instance.variants}
+    transaction.on_commit(lambda: ImageService.release_thumbnail_files(thumbnails))
@@ -0,0 +1,81 @@
+from itertools import combinations
+from typing import Optional
+from uuid import UUID
+
+from django.conf import settings
+from django.db.models import Q, QuerySet
+
+from src.apps.images.models import Image
+from src.apps.images.rendering import DHASH_CHUNK_BITS, split_hash
+
+DHASH_FIELDS = ("dhash_0", "dhash_1", "dhash_2", "dhash_3")
+
+
+def get_distance(first: int, second: int) -> int:
+    return (first ^ second).bit_count()
+
+
+def get_chunk_neighbours(chunk: int, radius: int) -> list[int]:
+    """
+    Every chunk value at most ``radius`` bits away from ``chunk``.
+    """
+    neighbours = [chunk]
+    for distance in range(1, radius + 1):
+        for bits in combinations(range(DHASH_CHUNK_BITS), distance):
+            neighbour = chunk
+            for bit in bits:
+                neighbour ^= 1 << bit
+            neighbours.append(neighbour)
+    return neighbours
+
+
+def get_similar_images(
+    queryset: QuerySet, value: int, max_distance: int
+) -> list[tuple[Image, int]]:
+    """
+    Images of ``queryset`` whose hash is at most ``max_distance`` bits away
+    from ``value``, closest first.
+
+    Multi-index hashing: two hashes ``max_distance`` apart differ by at most
+    ``max_distance // 4`` bits in one of their four chunks, so only rows
+    matching a neighbour of one chunk exactly, found through the chunk
+    indexes, are compared in full.
+    """
+    radius = max_distance // len(DHASH_FIELDS)
+    condition = Q()
+    for field, chunk in zip(DHASH_FIELDS, split_hash(value)):
+        condition |= Q(**{f"{field}__in": get_chunk_neighbours(chunk, radius)})
+
+    similar = []
+    for image in queryset.filter(condition):
+        distance = get_distance(value, image.dhash)
+        if distance <= max_distance:
+            similar.append((image, distance))
+    return sorted(similar, key=lambda item: (item[1], item[0].created_at))
+
+
+def store_image_hashes(hashes: dict[UUID, Optional[int]]) -> None:
+    """
+    Saves the hashes of freshly rendered images and flags each one as a near
+    duplicate of its owner's closest other image, if any is close enough.
+    """
+    images = Image.objects.filter(id__in=hashes).only("id", "uploaded_by")
+    for image in images:
+        value = hashes[image.id]
+        if value is None:
+            continue
+        near_duplicate = None
+        if image.uploaded_by_id is not None:
+            similar = get_similar_images(
+                Image.objects.filter(uploaded_by_id=image.uploaded_by_id)
+                .exclude(id=image.id)
+                .only("id", "created_at", *DHASH_FIELDS),
+                value=value,
+                max_distance=settings.IMAGE_NEAR_DUPLICATE_DISTANCE,
+            )
+            if similar:
+                near_duplicate = similar[0][0]
+        Image.objects.filter(id=image.id).update(
+            near_duplicate_of=near_duplicate,
+            **dict(zip(DHASH_FIELDS, split_hash(value))),
+        )
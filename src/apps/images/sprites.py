@@ -0,0 +1,123 @@
+import hashlib
+import io
+from typing import BinaryIO, Iterable, NamedTuple, Optional
+
+from django.core.files.storage import default_storage
+from PIL import Image
+
+from src.apps.images.models import Thumbnail
+
+
+class SpriteTile(NamedTuple):
+    image_id: str
+    # rows are replaced whenever thumbnails are rendered again, their ids
+    # identify the content of a tile
+    thumbnail_id: str
+    name: str
+    x: int
+    y: int
+    width: int
+    height: int
+
+
+class SpriteSheet(NamedTuple):
+    key: str
+    user_id: int
+    thumbnail_height: int
+    width: int
+    height: int
+    tiles: tuple[SpriteTile]
+
+
+def layout_sprite(
+    thumbnails: Iterable[Thumbnail], max_width: int
+) -> tuple[list[SpriteTile], int, int]:
+    """
+    Packs thumbnails of one height left to right in rows at most
+    ``max_width`` wide, keeping their order. Returns the tiles and the size
+    of the sheet.
+    """
+    tiles = []
+    x = y = width = 0
+    row_height = 0
+    for thumbnail in thumbnails:
+        if x and x + thumbnail.width > max_width:
+            x, y = 0, y + row_height
+            row_height = 0
+        tiles.append(
+            SpriteTile(
+                image_id=str(thumbnail.image_id),
+                thumbnail_id=str(thumbnail.id),
+                name=thumbnail.thumbnail.name,
+                x=x,
+                y=y,
+                width=thumbnail.width,
+                height=thumbnail.height,
+            )
+        )
+        x += thumbnail.width
+        width = max(width, x)
+        row_height = max(row_height, thumbnail.height)
+    return tiles, width, y + row_height
+
+
+def get_sprite_key(user_id: int, thumbnail_height: int, tiles: list[SpriteTile]) -> str:
+    key = "|".join(
+        [str(user_id), str(thumbnail_height)]
+        + [f"{tile.image_id}:{tile.thumbnail_id}" for tile in tiles]
+    )
+    return hashlib.md5(key.encode()).hexdigest()
+
+
+def render_sprite(
+    sheet: SpriteSheet,
+    previous: Optional[SpriteSheet] = None,
+    previous_file: Optional[BinaryIO] = None,
+) -> bytes:
+    """
+    Pastes the tiles of ``sheet`` on a transparent canvas and returns it as
+    a lossless PNG master. Tiles already in the ``previous`` master of the
+    same user and height, e.g. after a new upload shifted the page by one
+    image, are cropped out of its file instead of decoding every thumbnail
+    again.
+    """
+    reusable = {}
+    if previous is not None and previous_file is not None:
+        reusable = {tile.thumbnail_id: tile for tile in previous.tiles}
+    previous_image = None
+
+    canvas = Image.new("RGBA", (sheet.width, sheet.height))
+    for tile in sheet.tiles:
+        old_tile = reusable.get(tile.thumbnail_id)
+        if old_tile is not None:
+            if previous_image is None:
+                previous_image = Image.open(previous_file)
+                previous_image.load()
+            image = previous_image.crop(
+                (
+                    old_tile.x,
+                    old_tile.y,
+                    old_tile.x + old_tile.width,
+                    old_tile.y + old_tile.height,
+                )
+            )
+        else:
+            with default_storage.open(tile.name) as file:
+                image = Image.open(file)
+                image.load()
+        canvas.paste(image.convert("RGBA"), (tile.x, tile.y))
+
+    buffer = io.BytesIO()
+    # a low effort, sheets are rebuilt whenever a page changes
+    canvas.save(buffer, "PNG", compress_level=1)
+    return buffer.getvalue()
+
+
+def encode_sprite(master: BinaryIO, format: str, quality: int) -> bytes:
+    """
+    Lossy encoding of a master sheet, the one served to clients.
+    """
+    with Image.open(master) as image:
+        buffer = io.BytesIO()
+        image.save(buffer, format, quality=quality)
+    return buffer.getvalue()
@@ -0,0 +1,153 @@
+import hashlib
+from io import BytesIO
+from typing import BinaryIO, Optional
+
+from django.conf import settings
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+from PIL import Image
+
+MAGIC_BYTES = {
+    b"\x89PNG\r\n\x1a\n": "PNG",
+    b"\xff\xd8\xff": "JPEG",
+}
+
+
+def sniff_format(header: bytes) -> Optional[str]:
+    for magic, image_format in MAGIC_BYTES.items():
+        if header.startswith(magic):
+            return image_format
+    return None
+
+
+class ImageHeaderInspector:
+    """
+    Sniffs the format from the magic bytes and reads the dimensions from the
+    header of an image fed in chunks, without decoding the pixel data.
+    Sets ``error`` for images which are not PNG/JPEG or exceed
+    ``IMAGE_UPLOAD_MAX_PIXELS``.
+    """
+
+    header_max_size = 1024 * 1024
+
+    def __init__(self) -> None:
+        self.header = bytearray()
+        self.image_format = None
+        self.image_size = None
+        self.error = None
+
+    @property
+    def done(self) -> bool:
+        return self.error is not None or self.image_size is not None
+
+    def reject(self, message: str) -> None:
+        self.error = message
+        self.header = bytearray()
+
+    def feed(self, raw_data: bytes) -> None:
+        self.header += raw_data
+        if self.image_format is None:
+            if len(self.header) < max(len(magic) for magic in MAGIC_BYTES):
+                return
+            self.image_format = sniff_format(self.header)
+            if self.image_format is None:
+                self.reject("Upload a valid PNG or JPEG image.")
+                return
+
+        try:
+            # only parses the header, the pixel data is not decoded
+            with Image.open(BytesIO(self.header), formats=[self.image_format]) as image:
+                width, height = image.size
+        except Image.DecompressionBombError:
+            self.reject("Image dimensions are too large.")
+            return
+        except Exception:
+            if len(self.header) >= self.header_max_size:
+                self.reject("Upload a valid PNG or JPEG image.")
+            return
+
+        if width * height > settings.IMAGE_UPLOAD_MAX_PIXELS:
+            self.reject("Image dimensions are too large.")
+            return
+        self.image_size = (width, height)
+        self.header = bytearray()
+
+    def close(self) -> None:
+        if not self.done:
+            self.reject("Upload a valid PNG or JPEG image.")
+
+
+def inspect_image_file(file: BinaryIO, chunk_size: int = 64 * 1024) -> None:
+    """
+    Runs the checks ``ImageUploadHandler`` makes while receiving a file over
+    a file that is already stored, and sets the same ``upload_error``,
+    ``image_format`` and ``image_size`` attributes on it.
+    """
+    inspector = ImageHeaderInspector()
+    file.seek(0)
+    while not inspector.done:
+        chunk = file.read(chunk_size)
+        if not chunk:
+            inspector.close()
+            break
+        inspector.feed(chunk)
+    file.seek(0)
+    file.upload_error = inspector.error
+    file.image_format = inspector.image_format
+    file.image_size = inspector.image_size
+
+
+class ImageUploadHandler(TemporaryFileUploadHandler):
+    """
+    Streams uploaded images to a temporary file and, in the same pass over
+    the chunks, computes their SHA-256, sniffs the format from the magic
+    bytes and reads the dimensions from the header.
+
+    Files that are too large, are not PNG/JPEG or exceed
+    ``IMAGE_UPLOAD_MAX_PIXELS`` stop being written as soon as that is known
+    and are flagged with ``upload_error``, which the serializer reports for
+    that file only.
+    """
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.sha256 = hashlib.sha256()
+        self.inspector = ImageHeaderInspector()
+        self.received = 0
+        self.upload_error = None
+
+    def reject(self, message: str) -> None:
+        self.upload_error = message
+        self.file.truncate(0)
+
+    def receive_data_chunk(self, raw_data, start):
+        if self.upload_error is not None:
+            return None
+
+        self.received += len(raw_data)
+        if self.received > settings.IMAGE_UPLOAD_MAX_SIZE:
+            self.reject(
+                f"File exceeds the maximum size of "
+                f"{settings.IMAGE_UPLOAD_MAX_SIZE} bytes."
+            )
+            return None
+
+        self.sha256.update(raw_data)
+        if not self.inspector.done:
+            self.inspector.feed(raw_data)
+            if self.inspector.error is not None:
+                self.reject(self.inspector.error)
+                return None
+        return super().receive_data_chunk(raw_data, start)
+
+    def file_complete(self, file_size):
+        if self.upload_error is None:
+            self.inspector.close()
+            if self.inspector.error is not None:
+                self.reject(self.inspector.error)
+
+        file = super().file_complete(file_size)
+        file.upload_error = self.upload_error
+        file.image_format = self.inspector.image_format
+        file.image_size = self.inspector.image_size
+        file.sha256 = self.sha256.hexdigest() if self.upload_error is None else None
+        return file
@@ -1,17 +1,30 @@
+from django.conf import settings
 from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 from src.apps.images.views import (
     GenerateTemporaryLinkAPIView,
     ImageViewSet,
+    SignedTemporaryImageLinkAPIView,
     TemporaryImageLinkAPIView,
+    UploadSessionViewSet,
+    signed_temporary_image_link,
+    temporary_image_link,
 )
 
 app_name = "images"
 
 router = DefaultRouter()
 router.register(r"images", ImageViewSet, basename="image")
+router.register(r"uploads", UploadSessionViewSet, basename="upload-session")
 urlpatterns = router.urls
 
+if settings.ASYNC_TEMPORARY_LINK_VIEWS:
+    temporary_image_view = temporary_image_link
+    signed_temporary_image_view = signed_temporary_image_link
+else:
+    temporary_image_view = TemporaryImageLinkAPIView.as_view()
+    signed_temporary_image_view = SignedTemporaryImageLinkAPIView.as_view()
+
 urlpatterns += [
     path(
         "images/<uuid:pk>/generate-temporary-link/",
@@ -20,7 +33,12 @@ urlpatterns += [
     ),
     path(
         "imgtmp/<uuid:pk>/",
-        TemporaryImageLinkAPIView.as_view(),
+        temporary_image_view,
         name="temporary-image",
     ),
+    path(
+        "imgtmp/s/<str:token>/",
+        signed_temporary_image_view,
+        name="signed-temporary-image",
+    ),
 ]
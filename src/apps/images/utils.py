@@ -1,4 +1,6 @@
+import hashlib
 from math import ceil
+from typing import BinaryIO
 from uuid import uuid4
 
 
@@ -29,3 +31,48 @@ def get_new_image_name(name: str) -> str:
     _, ext = name.split(".")
     img_id = str(uuid4())
     return ".".join([img_id, ext])
+
+
+def get_content_image_name(name: str, sha256: str) -> str:
+    _, ext = name.split(".")
+    return ".".join([sha256, ext.lower()])
+
+
+def get_file_sha256(file: BinaryIO, chunk_size: int = 64 * 1024) -> str:
+    file.seek(0)
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: file.read(chunk_size), b""):
+        digest.update(chunk)
+    file.seek(0)
+    return digest.hexdigest()
+
+
+VARIANT_MEDIA_TYPES = {
+    "image/avif": "avif",
+    "image/webp": "webp",
+}
+
+
+def get_accepted_variants(accept: str) -> tuple[str]:
+    """
+    Returns thumbnail variants the ``Accept`` header names explicitly.
+    Wildcards do not count, generic clients send ``*/*`` whether they can
+    decode WebP or not.
+    """
+    accepted = set()
+    for media_range in accept.split(","):
+        media_type, *params = [part.strip() for part in media_range.split(";")]
+        variant = VARIANT_MEDIA_TYPES.get(media_type.lower())
+        if variant is None:
+            continue
+        quality = 1.0
+        for param in params:
+            key, _, value = param.partition("=")
+            if key.strip() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    pass
+        if quality > 0:
+            accepted.add(variant)
+    return tuple(sorted(accepted))
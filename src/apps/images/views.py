@@ -1,19 +1,47 @@
+import hashlib
+import os
+import re
+from datetime import datetime
+from typing import Optional
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
 from django.contrib.auth.models import User
-from django.http import Http404
+from django.core.exceptions import ValidationError
+from django.core.files.storage import default_storage
+from django.db.models import Count, Max, Prefetch, prefetch_related_objects
+from django.http import FileResponse, Http404, JsonResponse
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date
 
-from rest_framework import viewsets, status, generics, permissions
+from rest_framework import viewsets, status, generics, permissions, views
+from rest_framework.decorators import action
 from rest_framework.response import Response
 from drf_yasg.utils import swagger_auto_schema
 
 from src.apps.accounts.models import UserAccount
-from src.apps.images.exceptions import InvalidImageAccessToken
-from src.apps.images.models import Image, ImageAccessToken
+from src.apps.images import response_cache
+from src.apps.images.exceptions import (
+    IncompleteUpload,
+    InvalidImageAccessToken,
+    InvalidUploadChunk,
+)
+from src.apps.images.links import SignedAccessToken
+from src.apps.images.models import Image, ImageAccessToken, Thumbnail, UploadSession
+from src.apps.images.pagination import ImageCursorPagination
 from src.apps.images.permissions import (
     UserCanGenerateTemporaryLinkPermission,
     UserHasAccountPermission,
 )
 from src.apps.images.serializers import (
+    ImageBulkInputSerializer,
     ImageInputSerializer,
+    RenderInputSerializer,
+    SignedTemporaryLinkOutputSerializer,
+    SimilarImagesInputSerializer,
+    SpriteInputSerializer,
     BasicImageOutputSerializer,
     OriginalImageOutputSerializer,
     ImageWithLinkOutputSerializer,
@@ -21,38 +49,191 @@ from src.apps.images.serializers import (
     TemporaryImageOutputSerializer,
     TemporaryLinkInputSerializer,
     TemporaryLinkOutputSerializer,
+    ThumbnailJobOutputSerializer,
+    UploadSessionInputSerializer,
+    UploadSessionOutputSerializer,
 )
-from src.apps.images.services import ImageService, TemporaryLinkService
+from src.apps.images.services import (
+    ImageService,
+    SpriteService,
+    TemporaryLinkService,
+    UploadSessionService,
+)
+from src.apps.images.serving import serve_media_file
+from src.apps.images.similarity import DHASH_FIELDS, get_similar_images
+from src.apps.images.uploadhandlers import ImageUploadHandler
+from src.apps.images.utils import get_accepted_variants, get_format
+from src.apps.memberships.profiles import get_membership_profile
+
+CONTENT_RANGE_RE = re.compile(r"^bytes (\d+)-(\d+)/(\d+|\*)$")
+
+
+def get_image_serializer_class(user):
+    profile = get_membership_profile(user)
+
+    if profile.contains_original_link and profile.generates_expiring_link:
+        return OriginalImageWithLinkOutputSerializer
+
+    if profile.contains_original_link:
+        return OriginalImageOutputSerializer
+
+    if profile.generates_expiring_link:
+        return ImageWithLinkOutputSerializer
+
+    return BasicImageOutputSerializer
+
+
+def get_upload_response(image: Image, serializer) -> Response:
+    response_data = serializer.data
+    if not settings.THUMBNAILS_ASYNC:
+        return Response(response_data, status=status.HTTP_201_CREATED)
+
+    response_data["thumbnail_jobs"] = ThumbnailJobOutputSerializer(
+        image.thumbnail_jobs.all(), many=True
+    ).data
+    return Response(response_data, status=status.HTTP_202_ACCEPTED)
 
 
 class ImageViewSet(viewsets.ReadOnlyModelViewSet):
-    queryset = Image.objects.all()
+    # width and height are loaded as well, ImageField reads the file
+    # to fill them in whenever they are missing
+    only_fields = (
+        "id",
+        "title",
+        "image",
+        "height",
+        "width",
+        "near_duplicate_of",
+        "placeholder",
+        "dominant_color",
+        "created_at",
+        "updated_at",
+    )
+    queryset = Image.objects.only(*only_fields).prefetch_related(
+        Prefetch(
+            "thumbnails",
+            queryset=Thumbnail.objects.only(
+                "id",
+                "image_id",
+                "thumbnail",
+                "height",
+                "width",
+                "created_at",
+                "updated_at",
+                "variants",
+            ),
+        )
+    )
     service_class = ImageService
     permission_classes = [UserHasAccountPermission]
+    pagination_class = ImageCursorPagination
+
+    def initialize_request(self, request, *args, **kwargs):
+        # has to be set before the body is parsed
+        if request.method == "POST":
+            request.upload_handlers = [ImageUploadHandler(request)]
+        return super().initialize_request(request, *args, **kwargs)
 
     def get_queryset(self):
-        qs = self.queryset
+        qs = self.queryset.all()
         user = self.request.user
         if user.is_superuser:
             return qs
         return qs.filter(uploaded_by__user=user)
 
     def get_serializer_class(self):
-        account = self.request.user.user_account
-        membership = account.membership_type
-        if not membership:
-            return BasicImageOutputSerializer
+        return get_image_serializer_class(self.request.user)
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context["accepted_variants"] = get_accepted_variants(
+            self.request.headers.get("Accept", "")
+        )
+        return context
+
+    def get_etag(self, queryset) -> tuple[str, Optional[datetime]]:
+        """
+        Validator for list and detail responses, computed with a single
+        aggregate query. Thumbnail writes touch ``Image.updated_at`` and
+        deletions change the count, the membership profile version covers
+        membership changes and the URL covers pagination and hyperlinks.
+        """
+        state = queryset.order_by().aggregate(
+            last_modified=Max("updated_at"), count=Count("id")
+        )
+        last_modified = state["last_modified"]
+        key = "|".join(
+            (
+                str(self.request.user.pk),
+                get_membership_profile(self.request.user).version,
+                self.request.build_absolute_uri(),
+                self.request.accepted_renderer.format,
+                ",".join(get_accepted_variants(self.request.headers.get("Accept", ""))),
+                str(state["count"]),
+                last_modified.isoformat() if last_modified else "",
+            )
+        )
+        return f'"{hashlib.md5(key.encode()).hexdigest()}"', last_modified
+
+    def conditional_response(self, request, queryset, view):
+        try:
+            etag, last_modified = self.get_etag(queryset)
+        except (ValueError, ValidationError):
+            # malformed pk, let the regular view answer with a 404
+            return view()
+
+        # only the ETag is compared, Last-Modified alone would miss deletions
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = view()
+            if response.status_code != status.HTTP_200_OK:
+                return response
+        response["ETag"] = etag
+        # thumbnail URLs depend on the image formats the client accepts
+        patch_vary_headers(response, ("Accept",))
+        if last_modified is not None:
+            response["Last-Modified"] = http_date(last_modified.timestamp())
+        return response
 
-        if membership.contains_original_link and membership.generates_expiring_link:
-            return OriginalImageWithLinkOutputSerializer
+    def cached_response(self, request, view):
+        """
+        Serves the serialized data from the response cache. Entries are keyed
+        by the owner's version, which every upload and thumbnail render bumps.
+        """
+        key = response_cache.get_response_key(
+            request, get_membership_profile(request.user)
+        )
+        if key is None:
+            return view()
+
+        data = response_cache.get_cached_data(key)
+        if data is not None:
+            return Response(data, status=status.HTTP_200_OK)
 
-        if membership.contains_original_link:
-            return OriginalImageOutputSerializer
+        response = view()
+        if response.status_code == status.HTTP_200_OK:
+            response_cache.set_cached_data(key, response.data)
+        return response
 
-        if membership.generates_expiring_link:
-            return ImageWithLinkOutputSerializer
+    def list(self, request, *args, **kwargs):
+        return self.conditional_response(
+            request,
+            self.get_queryset(),
+            lambda: self.cached_response(
+                request,
+                lambda: super(ImageViewSet, self).list(request, *args, **kwargs),
+            ),
+        )
 
-        return BasicImageOutputSerializer
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional_response(
+            request,
+            self.get_queryset().filter(pk=kwargs["pk"]),
+            lambda: self.cached_response(
+                request,
+                lambda: super(ImageViewSet, self).retrieve(request, *args, **kwargs),
+            ),
+        )
 
     @swagger_auto_schema(request_body=ImageInputSerializer)
     def create(self, request, *args, **kwargs):
@@ -62,10 +243,276 @@ class ImageViewSet(viewsets.ReadOnlyModelViewSet):
         image = self.service_class.upload_image(
             data=serializer.validated_data, user_account=user_account
         )
+        return get_upload_response(image, self.get_serializer(image))
+
+    @swagger_auto_schema(request_body=ImageBulkInputSerializer)
+    @action(detail=False, methods=["post"], url_path="bulk", url_name="bulk")
+    def bulk_create(self, request, *args, **kwargs):
+        serializer = ImageBulkInputSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        files = serializer.validated_data["images"]
+        titles = serializer.validated_data.get("titles") or [
+            os.path.splitext(file.name)[0][:200] for file in files
+        ]
+
+        results = [None] * len(files)
+        valid_items = []
+        for index, (file, title) in enumerate(zip(files, titles)):
+            item_serializer = ImageInputSerializer(data={"title": title, "image": file})
+            if item_serializer.is_valid():
+                valid_items.append((index, item_serializer.validated_data))
+            else:
+                results[index] = {
+                    "index": index,
+                    "status": status.HTTP_400_BAD_REQUEST,
+                    "errors": item_serializer.errors,
+                }
+
+        if not valid_items:
+            return Response({"results": results}, status=status.HTTP_400_BAD_REQUEST)
+
+        images = self.service_class.bulk_upload_images(
+            items=[data for _, data in valid_items],
+            user_account=request.user.user_account,
+        )
+        prefetch_related_objects(images, "thumbnails", "thumbnail_jobs")
+
+        item_status = (
+            status.HTTP_202_ACCEPTED
+            if settings.THUMBNAILS_ASYNC
+            else status.HTTP_201_CREATED
+        )
+        for (index, _), image in zip(valid_items, images):
+            item_data = {
+                "index": index,
+                "status": item_status,
+                "image": self.get_serializer(image).data,
+            }
+            if settings.THUMBNAILS_ASYNC:
+                item_data["thumbnail_jobs"] = ThumbnailJobOutputSerializer(
+                    image.thumbnail_jobs.all(), many=True
+                ).data
+            results[index] = item_data
+
+        if len(valid_items) < len(files):
+            return Response({"results": results}, status=status.HTTP_207_MULTI_STATUS)
+        return Response({"results": results}, status=item_status)
+
+    @swagger_auto_schema(query_serializer=RenderInputSerializer)
+    @action(detail=True, methods=["get"], url_path="render", url_name="render")
+    def render_derivative(self, request, *args, **kwargs):
+        image = self.get_object()
+        serializer = RenderInputSerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        height = serializer.validated_data["h"]
+        extension = (
+            serializer.validated_data.get("fmt")
+            or get_format(extension=os.path.splitext(image.image.name)[1][1:]).lower()
+        )
+
+        profile = get_membership_profile(request.user)
+        if height not in profile.thumbnail_heights:
+            return Response(
+                "Your membership does not include thumbnails of this height",
+                status=status.HTTP_403_FORBIDDEN,
+            )
+
+        file = self.service_class.open_derivative(
+            image_model=image, height=height, extension=extension
+        )
+        response = FileResponse(file, content_type=f"image/{extension}")
+        response["Cache-Control"] = "private, max-age=86400"
+        return response
+
+    @action(detail=True, methods=["get"], url_path="original", url_name="original")
+    def original(self, request, *args, **kwargs):
+        image = self.get_object()
+        if not get_membership_profile(request.user).contains_original_link:
+            return Response(
+                "Your membership does not include original images",
+                status=status.HTTP_403_FORBIDDEN,
+            )
+        return serve_media_file(request, image.image.name)
+
+    @swagger_auto_schema(query_serializer=SpriteInputSerializer)
+    @action(detail=False, methods=["get"], url_path="sprite", url_name="sprite")
+    def sprite(self, request, *args, **kwargs):
+        """
+        Offsets of a page of thumbnails of height ``h`` within a single sprite
+        image, paginated like the image list.
+        """
+        serializer = SpriteInputSerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        height = serializer.validated_data["h"]
+        if height not in get_membership_profile(request.user).thumbnail_heights:
+            return Response(
+                "Your membership does not include thumbnails of this height",
+                status=status.HTTP_403_FORBIDDEN,
+            )
+
+        page = self.paginate_queryset(self.get_queryset())
+        sheet = SpriteService.get_sheet(
+            user_id=request.user.pk, image_models=page, height=height
+        )
         return Response(
-            self.get_serializer(image).data,
-            status=status.HTTP_201_CREATED,
+            {
+                "next": self.paginator.get_next_link(),
+                "previous": self.paginator.get_previous_link(),
+                "sprite": request.build_absolute_uri(
+                    reverse("images:image-sprite-file", kwargs={"key": sheet.key})
+                )
+                if sheet.tiles
+                else None,
+                "width": sheet.width,
+                "height": sheet.height,
+                "tiles": [
+                    {
+                        "id": tile.image_id,
+                        "x": tile.x,
+                        "y": tile.y,
+                        "width": tile.width,
+                        "height": tile.height,
+                    }
+                    for tile in sheet.tiles
+                ],
+            }
+        )
+
+    @action(
+        detail=False,
+        methods=["get"],
+        url_path=r"sprite/(?P<key>[0-9a-f]{32})",
+        url_name="sprite-file",
+    )
+    def sprite_file(self, request, key, *args, **kwargs):
+        sheet = SpriteService.get_cached_sheet(key)
+        if sheet is None or sheet.user_id != request.user.pk:
+            raise Http404
+        file = SpriteService.open_sprite(sheet)
+        response = FileResponse(
+            file, content_type=f"image/{SpriteService.get_format().lower()}"
+        )
+        # the key changes with the sheet's content
+        response["Cache-Control"] = "private, max-age=86400, immutable"
+        return response
+
+    @swagger_auto_schema(query_serializer=SimilarImagesInputSerializer)
+    @action(detail=True, methods=["get"], url_path="similar", url_name="similar")
+    def similar(self, request, *args, **kwargs):
+        image = self.get_object()
+        serializer = SimilarImagesInputSerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+
+        image = Image.objects.only("uploaded_by", *DHASH_FIELDS).get(pk=image.pk)
+        if image.dhash is None:
+            return Response(
+                "The image is not hashed until its thumbnails are rendered",
+                status=status.HTTP_409_CONFLICT,
+            )
+
+        similar = get_similar_images(
+            self.get_queryset()
+            .filter(uploaded_by_id=image.uploaded_by_id)
+            .exclude(pk=image.pk)
+            .only(*self.only_fields, *DHASH_FIELDS),
+            value=image.dhash,
+            max_distance=serializer.validated_data["distance"],
         )
+        results = []
+        for similar_image, distance in similar:
+            data = self.get_serializer(similar_image).data
+            data["distance"] = distance
+            results.append(data)
+        return Response({"results": results})
+
+
+class UploadSessionViewSet(viewsets.GenericViewSet):
+    """
+    Resumable uploads: create a session, ``PUT`` raw byte ranges with a
+    ``Content-Range`` header in any order, ``GET`` the session to see what
+    was received, then ``finalize`` it into an image.
+    """
+
+    queryset = UploadSession.objects.all()
+    serializer_class = UploadSessionOutputSerializer
+    service_class = UploadSessionService
+    permission_classes = [UserHasAccountPermission]
+
+    def get_queryset(self):
+        return self.queryset.filter(
+            uploaded_by__user=self.request.user, expires__gt=timezone.now()
+        )
+
+    @swagger_auto_schema(request_body=UploadSessionInputSerializer)
+    def create(self, request, *args, **kwargs):
+        serializer = UploadSessionInputSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        session = self.service_class.create_session(
+            data=serializer.validated_data, user_account=request.user.user_account
+        )
+        return Response(
+            self.get_serializer(session).data, status=status.HTTP_201_CREATED
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        return Response(self.get_serializer(self.get_object()).data)
+
+    def update(self, request, *args, **kwargs):
+        session = self.get_object()
+        match = CONTENT_RANGE_RE.match(request.headers.get("Content-Range", ""))
+        if match is None:
+            return Response(
+                "Content-Range header, e.g. 'bytes 0-1023/4096', is required",
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        start, end, total = match.groups()
+        start, end = int(start), int(end)
+        length = end - start + 1
+        if total != "*" and int(total) != session.size:
+            return Response(
+                "Content-Range total does not match the session size",
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        if request.META.get("CONTENT_LENGTH") != str(length):
+            return Response(
+                "Content-Length does not match Content-Range",
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        try:
+            # the body is streamed to disk, request.data is never parsed
+            session = self.service_class.write_chunk(
+                session=session, start=start, length=length, stream=request.stream
+            )
+        except InvalidUploadChunk as exc:
+            return Response(str(exc), status=status.HTTP_400_BAD_REQUEST)
+        return Response(self.get_serializer(session).data)
+
+    def destroy(self, request, *args, **kwargs):
+        self.service_class.delete_session(self.get_object())
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    @action(detail=True, methods=["post"])
+    def finalize(self, request, *args, **kwargs):
+        session = self.get_object()
+        try:
+            upload = self.service_class.open_upload(session)
+        except IncompleteUpload as exc:
+            return Response(str(exc), status=status.HTTP_409_CONFLICT)
+
+        with upload:
+            serializer = ImageInputSerializer(
+                data={"title": session.title, "image": upload}
+            )
+            serializer.is_valid(raise_exception=True)
+            image = self.service_class.finalize_session(
+                session=session, data=serializer.validated_data
+            )
+            image_serializer = get_image_serializer_class(request.user)(
+                image, context=self.get_serializer_context()
+            )
+            return get_upload_response(image, image_serializer)
 
 
 class GenerateTemporaryLinkAPIView(generics.GenericAPIView):
@@ -84,16 +531,20 @@ class GenerateTemporaryLinkAPIView(generics.GenericAPIView):
         access_token = self.service_class.create_access_token(
             image_id=image_id, data=serializer.validated_data
         )
-        return Response(
-            self.get_serializer(access_token).data,
-            status=status.HTTP_201_CREATED,
-        )
+        if isinstance(access_token, SignedAccessToken):
+            output_serializer = SignedTemporaryLinkOutputSerializer(
+                access_token, context=self.get_serializer_context()
+            )
+        else:
+            output_serializer = self.get_serializer(access_token)
+        return Response(output_serializer.data, status=status.HTTP_201_CREATED)
 
 
 class TemporaryImageLinkAPIView(generics.RetrieveAPIView):
     queryset = ImageAccessToken.objects.all()
     serializer_class = TemporaryImageOutputSerializer
     service_class = TemporaryLinkService
+    authentication_classes = []
     permission_classes = [permissions.AllowAny]
 
     def get(self, request, *args, **kwargs):
@@ -102,9 +553,79 @@ class TemporaryImageLinkAPIView(generics.RetrieveAPIView):
             image = self.service_class.get_image_from_token(
                 access_token_id=access_token_id
             )
-            return Response(
-                self.get_serializer(image).data,
-                status=status.HTTP_200_OK,
+        except InvalidImageAccessToken as exc:
+            return Response(str(exc), status=status.HTTP_400_BAD_REQUEST)
+
+        if settings.TEMPORARY_LINK_SERVE_MODE != "json":
+            return serve_media_file(request, image.image.name)
+        return Response(
+            self.get_serializer(image).data,
+            status=status.HTTP_200_OK,
+        )
+
+
+class SignedTemporaryImageLinkAPIView(views.APIView):
+    service_class = TemporaryLinkService
+    authentication_classes = []
+    permission_classes = [permissions.AllowAny]
+
+    def get(self, request, *args, **kwargs):
+        try:
+            image_name = self.service_class.get_image_name_from_signed_token(
+                token=kwargs.get("token")
             )
         except InvalidImageAccessToken as exc:
             return Response(str(exc), status=status.HTTP_400_BAD_REQUEST)
+
+        if settings.TEMPORARY_LINK_SERVE_MODE != "json":
+            return serve_media_file(request, image_name)
+        return Response(
+            {"image": request.build_absolute_uri(default_storage.url(image_name))},
+            status=status.HTTP_200_OK,
+        )
+
+
+# Async variants of the two views above, routed instead of them when
+# ASYNC_TEMPORARY_LINK_VIEWS is set (the ASGI profile). Error bodies match
+# the DRF views.
+
+
+async def temporary_image_link(request, pk):
+    """
+    Async so that, served over ASGI, clients slowly downloading shared images
+    hold a connection rather than a worker. Database queries and file access
+    run in threads.
+    """
+    try:
+        image = await sync_to_async(TemporaryLinkService.get_image_from_token)(
+            access_token_id=pk
+        )
+    except Http404:
+        return JsonResponse({"detail": "Not found."}, status=status.HTTP_404_NOT_FOUND)
+    except InvalidImageAccessToken as exc:
+        return JsonResponse(str(exc), status=status.HTTP_400_BAD_REQUEST, safe=False)
+
+    if settings.TEMPORARY_LINK_SERVE_MODE != "json":
+        return await sync_to_async(serve_media_file, thread_sensitive=False)(
+            request, image.image.name
+        )
+    return JsonResponse(
+        TemporaryImageOutputSerializer(image, context={"request": request}).data
+    )
+
+
+async def signed_temporary_image_link(request, token):
+    try:
+        image_name = await sync_to_async(
+            TemporaryLinkService.get_image_name_from_signed_token
+        )(token=token)
+    except InvalidImageAccessToken as exc:
+        return JsonResponse(str(exc), status=status.HTTP_400_BAD_REQUEST, safe=False)
+
+    if settings.TEMPORARY_LINK_SERVE_MODE != "json":
+        return await sync_to_async(serve_media_file, thread_sensitive=False)(
+            request, image_name
+        )
+    return JsonResponse(
+        {"image": request.build_absolute_uri(default_storage.url(image_name))}
+    )
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class MembershipsConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "src.apps.memberships"
+
+    def ready(self):
+        from src.apps.memberships import signals  # noqa: F401
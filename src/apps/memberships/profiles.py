@@ -0,0 +1,156 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+from uuid import UUID
+
+from django.conf import settings
+
+from src.apps.accounts.models import UserAccount
+
+
+class MembershipProfile:
+    """
+    Immutable snapshot of what a user's membership allows.
+    """
+
+    __slots__ = (
+        "account_id",
+        "membership_id",
+        "contains_original_link",
+        "generates_expiring_link",
+        "thumbnail_heights",
+    )
+
+    def __init__(
+        self,
+        account_id: Optional[UUID] = None,
+        membership_id: Optional[UUID] = None,
+        contains_original_link: bool = False,
+        generates_expiring_link: bool = False,
+        thumbnail_heights: tuple[int] = (),
+    ) -> None:
+        object.__setattr__(self, "account_id", account_id)
+        object.__setattr__(self, "membership_id", membership_id)
+        object.__setattr__(self, "contains_original_link", contains_original_link)
+        object.__setattr__(self, "generates_expiring_link", generates_expiring_link)
+        object.__setattr__(self, "thumbnail_heights", thumbnail_heights)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("MembershipProfile is immutable")
+
+    def __delattr__(self, name):
+        raise AttributeError("MembershipProfile is immutable")
+
+    def __repr__(self) -> str:
+        return (
+            f"MembershipProfile(account_id={self.account_id}, "
+            f"membership_id={self.membership_id}, "
+            f"thumbnail_heights={self.thumbnail_heights})"
+        )
+
+    @property
+    def has_account(self) -> bool:
+        return self.account_id is not None
+
+    @property
+    def version(self) -> str:
+        """
+        Changes whenever anything that shapes the user's responses changes.
+        """
+        state = (
+            self.account_id,
+            self.membership_id,
+            self.contains_original_link,
+            self.generates_expiring_link,
+            self.thumbnail_heights,
+        )
+        return hashlib.md5(repr(state).encode()).hexdigest()[:12]
+
+
+NO_ACCOUNT_PROFILE = MembershipProfile()
+
+# user id -> (expiry timestamp, profile), local to the process, least
+# recently used first
+_profiles: OrderedDict[int, tuple[float, MembershipProfile]] = OrderedDict()
+_profiles_lock = threading.Lock()
+
+
+def load_membership_profile(user_id: int) -> MembershipProfile:
+    account = (
+        UserAccount.objects.select_related("membership_type")
+        .only(
+            "id",
+            "membership_type__id",
+            "membership_type__contains_original_link",
+            "membership_type__generates_expiring_link",
+        )
+        .filter(user_id=user_id)
+        .first()
+    )
+    if account is None:
+        return NO_ACCOUNT_PROFILE
+
+    membership = account.membership_type
+    if membership is None:
+        return MembershipProfile(account_id=account.id)
+
+    thumbnail_heights = sorted(
+        set(membership.thumbnail_sizes.values_list("height", flat=True))
+    )
+    return MembershipProfile(
+        account_id=account.id,
+        membership_id=membership.id,
+        contains_original_link=membership.contains_original_link,
+        generates_expiring_link=membership.generates_expiring_link,
+        thumbnail_heights=tuple(thumbnail_heights),
+    )
+
+
+def get_membership_profile_by_user_id(user_id: int) -> MembershipProfile:
+    """
+    Cached per process and invalidated by signals. Other processes do not
+    see those signals, MEMBERSHIP_PROFILE_TTL bounds how long they can
+    serve a stale profile.
+    """
+    now = time.monotonic()
+    with _profiles_lock:
+        cached = _profiles.get(user_id)
+        if cached is not None:
+            if cached[0] > now:
+                _profiles.move_to_end(user_id)
+                return cached[1]
+            del _profiles[user_id]
+
+    profile = load_membership_profile(user_id)
+    with _profiles_lock:
+        _profiles[user_id] = (now + settings.MEMBERSHIP_PROFILE_TTL, profile)
+        _profiles.move_to_end(user_id)
+        # expired profiles of users who did not come back, then the least
+        # recently used ones past the size bound
+        while _profiles:
+            expires, _ = next(iter(_profiles.values()))
+            if (
+                expires > now
+                and len(_profiles) <= settings.MEMBERSHIP_PROFILE_CACHE_SIZE
+            ):
+                break
+            _profiles.popitem(last=False)
+    return profile
+
+
+def get_membership_profile(user) -> MembershipProfile:
+    if not user.is_authenticated:
+        return NO_ACCOUNT_PROFILE
+    return get_membership_profile_by_user_id(user.pk)
+
+
+def invalidate_membership_profile(user_id: int) -> None:
+    with _profiles_lock:
+        _profiles.pop(user_id, None)
+
+
+def clear_membership_profiles() -> None:
+    with _profiles_lock:
+        _profiles.clear()
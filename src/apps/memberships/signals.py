@@ -0,0 +1,30 @@
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from src.apps.accounts.models import UserAccount
+from src.apps.images.models import ThumbnailSize
+from src.apps.memberships.models import MembershipType
+from src.apps.memberships.profiles import (
+    clear_membership_profiles,
+    invalidate_membership_profile,
+)
+
+
+@receiver(post_save, sender=UserAccount)
+@receiver(post_delete, sender=UserAccount)
+def invalidate_user_account_profile(sender, instance, **kwargs):
+    invalidate_membership_profile(instance.user_id)
+
+
+@receiver(post_save, sender=MembershipType)
+@receiver(post_delete, sender=MembershipType)
+@receiver(post_save, sender=ThumbnailSize)
+@receiver(post_delete, sender=ThumbnailSize)
+def invalidate_membership_profiles(sender, **kwargs):
+    clear_membership_profiles()
+
+
+@receiver(m2m_changed, sender=MembershipType.thumbnail_sizes.through)
+def invalidate_membership_profiles_on_thumbnail_sizes_change(sender, **kwargs):
+    if kwargs["action"].startswith("post_"):
+        clear_membership_profiles()
@@ -1,8 +1,19 @@
+from django.db.models import Prefetch
 from rest_framework import viewsets
+from src.apps.images.models import ThumbnailSize
 from src.apps.memberships.models import MembershipType
 from src.apps.memberships.serializers import MembershipTypeOutputSerializer
 
 
 class MembershipTypeViewSet(viewsets.ReadOnlyModelViewSet):
-    queryset = MembershipType.objects.all()
+    queryset = MembershipType.objects.only(
+        "id",
+        "name",
+        "contains_original_link",
+        "generates_expiring_link",
+        "created_at",
+        "updated_at",
+    ).prefetch_related(
+        Prefetch("thumbnail_sizes", queryset=ThumbnailSize.objects.only("id", "height"))
+    )
     serializer_class = MembershipTypeOutputSerializer
@@ -5,6 +5,8 @@ base_settings = [
     "base.py",
     "drf.py",
     "swagger.py",
+    "images.py",
+    "memberships.py",
 ]
 
 
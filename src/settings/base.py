@@ -87,14 +87,38 @@ WSGI_APPLICATION = "src.wsgi.application"
 # Database
 # https://docs.djangoproject.com/en/4.0/ref/settings/#databases
 
-DATABASES = {
+# "sqlite" runs without a database server, e.g. for the benchmark command
+if env_config.get("DATABASE_ENGINE", default="postgresql") == "sqlite":
+    DATABASES = {
+        "default": {
+            "ENGINE": "django.db.backends.sqlite3",
+            "NAME": os.path.join(BASE_DIR, "db.sqlite3"),
+        }
+    }
+else:
+    DATABASES = {
+        "default": {
+            "ENGINE": "django.db.backends.postgresql",
+            "HOST": env_config.get("POSTGRES_HOST"),
+            "NAME": env_config.get("POSTGRES_DB"),
+            "PORT": env_config.get("POSTGRES_PORT", cast=int),
+            "USER": env_config.get("POSTGRES_USER"),
+            "PASSWORD": env_config.get("POSTGRES_PASSWORD"),
+        }
+    }
+
+
+# Cache
+# https://docs.djangoproject.com/en/4.0/topics/cache/
+# the worker invalidates cached responses, so production processes must share
+# the backend (e.g. FileBasedCache on a shared volume)
+
+CACHES = {
     "default": {
-        "ENGINE": "django.db.backends.postgresql",
-        "HOST": env_config.get("POSTGRES_HOST"),
-        "NAME": env_config.get("POSTGRES_DB"),
-        "PORT": env_config.get("POSTGRES_PORT", cast=int),
-        "USER": env_config.get("POSTGRES_USER"),
-        "PASSWORD": env_config.get("POSTGRES_PASSWORD"),
+        "BACKEND": env_config.get(
+            "CACHE_BACKEND", default="django.core.cache.backends.locmem.LocMemCache"
+        ),
+        "LOCATION": env_config.get("CACHE_LOCATION", default="imageboard"),
     }
 }
 
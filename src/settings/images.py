@@ -0,0 +1,84 @@
+from decouple import Csv
+
+# Thumbnail rendering pipeline
+
+THUMBNAILS_ASYNC = env_config.get("THUMBNAILS_ASYNC", default=True, cast=bool)
+
+THUMBNAIL_JOB_BATCH_SIZE = 20
+THUMBNAIL_JOB_MAX_ATTEMPTS = 5
+THUMBNAIL_JOB_RETRY_DELAY = 10  # seconds, doubled on every failed attempt
+THUMBNAIL_JOB_LOCK_TIMEOUT = 300  # seconds before a processing job is requeued
+
+THUMBNAIL_ENGINE_BATCH_SIZE = 500  # Thumbnail rows written per bulk insert
+
+# extra encodings stored next to each thumbnail when they are smaller,
+# formats the installed Pillow cannot write (e.g. AVIF) are skipped
+THUMBNAIL_VARIANT_FORMATS = env_config.get(
+    "THUMBNAIL_VARIANT_FORMATS", default="WEBP,AVIF", cast=Csv()
+)
+
+# Uploads
+
+IMAGE_BULK_UPLOAD_MAX_FILES = 100
+IMAGE_UPLOAD_MAX_SIZE = 50 * 1024 * 1024  # bytes per file
+IMAGE_UPLOAD_MAX_PIXELS = 50_000_000  # width * height, read from the header
+
+# resumable uploads, chunks are written outside MEDIA_ROOT until finalized
+UPLOAD_SESSIONS_DIR = env_config.get(
+    "UPLOAD_SESSIONS_DIR", default=os.path.join(BASE_DIR, "cache/uploads/")
+)
+UPLOAD_SESSION_MAX_SIZE = 100 * 1024 * 1024  # bytes
+UPLOAD_SESSION_TTL = 24 * 60 * 60  # seconds since the last received chunk
+UPLOAD_SESSION_SWEEP_BATCH_SIZE = 100
+
+# Near-duplicates
+
+IMAGE_NEAR_DUPLICATE_DISTANCE = 4  # dHash bits, flags uploads on render
+IMAGE_SIMILARITY_MAX_DISTANCE = 10  # dHash bits, upper bound of similar image lookups
+
+# Response cache
+
+# only used with a cache shared by all processes, never with LocMemCache
+IMAGE_RESPONSE_CACHE_TIMEOUT = 300  # seconds, 0 disables the list/detail cache
+# hit/miss counters, two more cache writes per cached request
+IMAGE_RESPONSE_CACHE_STATS = env_config.get(
+    "IMAGE_RESPONSE_CACHE_STATS", default=False, cast=bool
+)
+
+# On-demand derivatives
+
+DERIVATIVE_CACHE_DIR = os.path.join(BASE_DIR, "cache/derivatives/")
+DERIVATIVE_CACHE_MAX_SIZE = 512 * 1024 * 1024  # bytes
+DERIVATIVE_FORMATS = {
+    "jpeg": "JPEG",
+    "png": "PNG",
+    "webp": "WEBP",
+}
+
+# Sprite sheets
+
+SPRITE_MAX_WIDTH = 2048  # px, thumbnails wrap to a new row past it
+SPRITE_TIMEOUT = 24 * 60 * 60  # seconds sprite sheet layouts are kept
+SPRITE_WEBP_QUALITY = 80  # served sheets, tiles are reused from a lossless master
+
+# Temporary links
+
+ACCESS_TOKEN_SWEEP_BATCH_SIZE = 1000
+ACCESS_TOKEN_REVOCATIONS_REFRESH = 30  # seconds between reloads of revoked signed links
+
+# "accel" lets nginx send the file through X-Accel-Redirect, "file" streams
+# it from Django, "json" returns the media URL, which nginx does not serve
+# for originals (both only in development). Originals of memberships with
+# original links are served the same way, except "json" streams as well.
+TEMPORARY_LINK_SERVE_MODE = env_config.get("TEMPORARY_LINK_SERVE_MODE", default="accel")
+PROTECTED_MEDIA_URL = "/protected-media/"
+# async temporary link views, only worth it when served over ASGI: under
+# WSGI every request would go through async_to_sync
+ASYNC_TEMPORARY_LINK_VIEWS = env_config.get(
+    "ASYNC_TEMPORARY_LINK_VIEWS", default=False, cast=bool
+)
+
+# Benchmarks, timings depend on the machine so the baseline is not committed
+
+BENCHMARK_BASELINE = os.path.join(BASE_DIR, "cache/benchmark-baseline.json")
+BENCHMARK_TOLERANCE = 0.25  # fraction a timing or RSS may grow by before failing
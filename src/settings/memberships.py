@@ -0,0 +1,4 @@
+# Seconds a process may serve a cached membership profile changed elsewhere
+MEMBERSHIP_PROFILE_TTL = 60
+# Profiles each process keeps, the least recently used ones are dropped first
+MEMBERSHIP_PROFILE_CACHE_SIZE = 10_000
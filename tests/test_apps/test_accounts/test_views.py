@@ -82,3 +82,35 @@ class TestUserAccountViewset(APITestCase):
 
         self.assertEqual(user_data["username"], self.user.username)
         self.assertEqual(user_data["email"], self.user.email)
+
+
+class TestUserAccountViewsetQueries(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create(username="admin", is_superuser=True)
+        UserAccount.objects.create(user=cls.admin)
+        for index in range(10):
+            user = User.objects.create(username=f"user{index}")
+            user_account = UserAccount.objects.create(user=user)
+
+        cls.user_account_list_url = reverse("accounts:user-list")
+        cls.user_account_detail_url = reverse(
+            "accounts:user-detail",
+            kwargs={"pk": user_account.id},
+        )
+
+    def setUp(self):
+        self.client.force_login(user=self.admin)
+
+    def test_user_account_list_query_count_does_not_depend_on_page_size(self):
+        # session, user, count, accounts with their users
+        for limit in (1, 10):
+            with self.assertNumQueries(4):
+                response = self.client.get(self.user_account_list_url, {"limit": limit})
+            self.assertEqual(len(response.data["results"]), limit)
+
+    def test_user_account_detail_query_count(self):
+        # session, user, account with its user
+        with self.assertNumQueries(3):
+            response = self.client.get(self.user_account_detail_url)
+        self.assertEqual(response.data["user"]["username"], "user9")
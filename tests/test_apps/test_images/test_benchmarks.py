@@ -0,0 +1,95 @@
+from django.test import TestCase
+from PIL import Image
+
+from src.apps.images.benchmarks import (
+    BenchmarkCase,
+    compare_results,
+    create_user_account,
+    generate_image,
+    get_list_cases,
+    get_temporary_link_cases,
+    measure,
+)
+from src.apps.images.models import Image as ImageModel
+
+
+class TestBenchmarks(TestCase):
+    def setUp(self):
+        self.baseline = {
+            "case": {"wall": 0.1, "cpu": 0.1, "rss_growth_kb": 10000, "queries": 3}
+        }
+
+    def test_generate_image_is_unique(self):
+        first = generate_image("PNG", (64, 32))
+        second = generate_image("PNG", (64, 32))
+        self.assertNotEqual(first.read(), second.read())
+        first.seek(0)
+        with Image.open(first) as image:
+            self.assertEqual((image.format, image.size), ("PNG", (64, 32)))
+
+    def test_measure_counts_queries_per_iteration(self):
+        calls = []
+        case = BenchmarkCase(
+            name="case",
+            setup=lambda: calls.append("setup"),
+            run=lambda: (calls.append("run"), list(ImageModel.objects.all())),
+            iterations=3,
+        )
+        result = measure(case, repeat=2)
+        self.assertEqual(calls.count("setup"), 2)
+        self.assertEqual(calls.count("run"), 6)
+        self.assertEqual(result.queries, 1)
+        self.assertGreaterEqual(result.rss_growth_kb, 0)
+
+    def test_measure_rss_growth_does_not_depend_on_earlier_cases(self):
+        def allocate(megabytes: int) -> BenchmarkCase:
+            return BenchmarkCase(
+                name="case", run=lambda: bytearray(megabytes * 1024 * 1024)
+            )
+
+        measure(allocate(200), repeat=1)
+        result = measure(allocate(50), repeat=1)
+        self.assertGreater(result.rss_growth_kb, 40 * 1024)
+        self.assertLess(result.rss_growth_kb, 100 * 1024)
+
+    def test_compare_results_within_tolerance(self):
+        results = {
+            "case": {"wall": 0.12, "cpu": 0.1, "rss_growth_kb": 12000, "queries": 2},
+            "new case": {"wall": 1, "cpu": 1, "rss_growth_kb": 1, "queries": 1},
+        }
+        self.assertEqual(compare_results(results, self.baseline, tolerance=0.25), [])
+
+    def test_compare_results_reports_regressions(self):
+        results = {
+            "case": {"wall": 0.2, "cpu": 0.1, "rss_growth_kb": 13000, "queries": 4}
+        }
+        regressions = compare_results(results, self.baseline, tolerance=0.25)
+        self.assertEqual(
+            regressions,
+            [
+                "case: wall 0.1 -> 0.2",
+                "case: rss_growth_kb 10000 -> 13000",
+                "case: queries 3 -> 4",
+            ],
+        )
+
+    def test_compare_results_ignores_timer_noise(self):
+        baseline = {
+            "case": {"wall": 0.00001, "cpu": 0, "rss_growth_kb": 1, "queries": 0}
+        }
+        results = {
+            "case": {"wall": 0.0001, "cpu": 0.0001, "rss_growth_kb": 500, "queries": 0}
+        }
+        self.assertEqual(compare_results(results, baseline, tolerance=0.25), [])
+
+    def test_compare_results_skips_metrics_missing_from_baseline(self):
+        baseline = {"case": {"wall": 0.1, "cpu": 0.1, "queries": 3}}
+        results = {"case": {**baseline["case"], "rss_growth_kb": 10000}}
+        self.assertEqual(compare_results(results, baseline, tolerance=0.25), [])
+
+    def test_list_and_temporary_link_cases_run(self):
+        user_account = create_user_account("benchmark")
+        cases = get_list_cases(user_account) + get_temporary_link_cases(user_account)
+        for case in cases:
+            result = measure(case._replace(iterations=1), repeat=1)
+            self.assertGreater(result.wall, 0)
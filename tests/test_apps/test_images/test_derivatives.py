@@ -0,0 +1,58 @@
+import os, shutil, time
+from unittest import mock
+from django import test
+
+from src.apps.images.derivatives import DerivativeCache
+
+
+TEST_CACHE_DIR = "var/www/site/tmp/derivatives/"
+
+
+class TestDerivativeCache(test.TestCase):
+    def setUp(self):
+        self.cache = DerivativeCache(directory=TEST_CACHE_DIR, max_size=25)
+
+    def tearDown(self) -> None:
+        shutil.rmtree(TEST_CACHE_DIR, ignore_errors=True)
+        return super().tearDown()
+
+    def test_open_renders_missing_entry_once(self):
+        render = mock.Mock(return_value=b"0123456789")
+        with self.cache.open("ab-200.webp", render) as file:
+            self.assertEqual(file.read(), b"0123456789")
+        with self.cache.open("ab-200.webp", render) as file:
+            self.assertEqual(file.read(), b"0123456789")
+        render.assert_called_once()
+
+    def test_evict_removes_least_recently_used_entries(self):
+        for key in ("aa-1.png", "bb-1.png"):
+            self.cache.open(key, lambda: b"0123456789").close()
+        past = time.time() - 60
+        os.utime(self.cache.get_path("aa-1.png"), (past, past))
+        os.utime(self.cache.get_path("bb-1.png"), (past - 60, past - 60))
+
+        # reading refreshes the entry
+        self.cache.open("bb-1.png", lambda: b"").close()
+        self.cache.open("cc-1.png", lambda: b"0123456789").close()
+
+        self.assertFalse(os.path.exists(self.cache.get_path("aa-1.png")))
+        self.assertTrue(os.path.exists(self.cache.get_path("bb-1.png")))
+        self.assertTrue(os.path.exists(self.cache.get_path("cc-1.png")))
+
+    def test_open_scans_only_when_running_total_exceeds_limit(self):
+        with mock.patch.object(self.cache, "evict", wraps=self.cache.evict) as evict:
+            # the first write takes the running total from a scan
+            self.cache.open("aa-1.png", lambda: b"0123456789").close()
+            self.cache.open("bb-1.png", lambda: b"0123456789").close()
+            self.cache.open("bb-1.png", lambda: b"").close()
+            self.assertEqual(evict.call_count, 1)
+
+            self.cache.open("cc-1.png", lambda: b"0123456789").close()
+            self.assertEqual(evict.call_count, 2)
+
+    def test_reading_recent_entry_does_not_touch_it(self):
+        self.cache.open("aa-1.png", lambda: b"0123456789").close()
+        recent = time.time() - 10
+        os.utime(self.cache.get_path("aa-1.png"), (recent, recent))
+        self.cache.open("aa-1.png", lambda: b"").close()
+        self.assertEqual(os.path.getmtime(self.cache.get_path("aa-1.png")), recent)
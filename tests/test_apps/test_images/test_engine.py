@@ -0,0 +1,116 @@
+import os, shutil
+from unittest import mock
+from django.db import IntegrityError
+from django.test import override_settings, TestCase
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from src.apps.accounts.models import UserAccount
+from src.apps.images.engine import RenderEngine
+from src.apps.images.models import Image as ImageModel, Thumbnail
+from tests.test_apps.test_images.utils import generate_image_file
+
+User = get_user_model()
+
+
+TEST_MEDIA_ROOT = "var/www/site/tmp/"
+
+
+@override_settings(MEDIA_ROOT=TEST_MEDIA_ROOT)
+class TestRenderEngine(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username="testuser")
+        cls.user_account = UserAccount.objects.create(user=cls.user)
+
+    def setUp(self):
+        self.images = []
+        for _ in range(3):
+            image_file = generate_image_file()
+            image = ContentFile(image_file.getvalue(), name=image_file.name)
+            self.images.append(
+                ImageModel.objects.create(
+                    title="test", uploaded_by=self.user_account, image=image
+                )
+            )
+
+    def tearDown(self) -> None:
+        for filename in os.listdir(TEST_MEDIA_ROOT):
+            filepath = os.path.join(TEST_MEDIA_ROOT, filename)
+            try:
+                shutil.rmtree(filepath)
+            except OSError:
+                os.remove(filepath)
+        return super().tearDown()
+
+    def test_engine_renders_thumbnails_in_worker_processes(self):
+        engine = RenderEngine(workers=2, batch_size=2)
+        tasks = [
+            engine.build_task(image_model=image, heights=[200, 400])
+            for image in self.images
+        ]
+        stats = engine.run(tasks)
+
+        self.assertEqual(stats.images, 3)
+        self.assertEqual(stats.thumbnails, 6)
+        self.assertEqual(stats.errors, {})
+        for image in self.images:
+            self.assertEqual(
+                sorted(image.thumbnails.values_list("height", flat=True)), [200, 400]
+            )
+
+    def test_engine_reports_failed_images(self):
+        engine = RenderEngine(workers=1)
+        broken_image = self.images[0]
+        os.remove(broken_image.image.path)
+
+        stats = engine.run(
+            [
+                engine.build_task(image_model=image, heights=[200])
+                for image in self.images
+            ]
+        )
+        self.assertEqual(stats.images, 2)
+        self.assertIn(broken_image.id, stats.errors)
+        self.assertFalse(Thumbnail.objects.filter(image=broken_image).exists())
+
+    def test_engine_replaces_thumbnails_of_rendered_images_only(self):
+        engine = RenderEngine(workers=1, replace=True)
+        engine.run(
+            [
+                engine.build_task(image_model=image, heights=[200])
+                for image in self.images
+            ]
+        )
+        old_ids = set(Thumbnail.objects.values_list("id", flat=True))
+        broken_image = self.images[0]
+        os.remove(broken_image.image.path)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            stats = engine.run(
+                [
+                    engine.build_task(image_model=image, heights=[200])
+                    for image in self.images
+                ]
+            )
+        self.assertIn(broken_image.id, stats.errors)
+        self.assertEqual(
+            set(broken_image.thumbnails.values_list("id", flat=True)) - old_ids, set()
+        )
+        self.assertTrue(broken_image.thumbnails.exists())
+        for image in self.images[1:]:
+            thumbnails = list(image.thumbnails.all())
+            self.assertEqual(len(thumbnails), 1)
+            self.assertNotIn(thumbnails[0].id, old_ids)
+            self.assertTrue(os.path.exists(thumbnails[0].thumbnail.path))
+
+    def test_engine_deletes_files_of_thumbnails_it_could_not_save(self):
+        engine = RenderEngine(workers=1)
+        task = engine.build_task(image_model=self.images[0], heights=[200])
+        with mock.patch.object(
+            Thumbnail.objects, "bulk_create", side_effect=IntegrityError
+        ):
+            with self.assertRaises(IntegrityError):
+                engine.run([task])
+
+        self.assertEqual(os.listdir(TEST_MEDIA_ROOT + "thumbnails"), [])
+        self.assertFalse(Thumbnail.objects.exists())
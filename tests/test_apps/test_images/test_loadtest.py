@@ -0,0 +1,130 @@
+import asyncio
+import os
+import shutil
+from itertools import cycle
+from unittest import mock
+
+from django.conf import settings
+from django.test import LiveServerTestCase, TestCase, override_settings
+
+from src.apps.accounts.models import UserAccount
+from src.apps.images.models import Image as ImageModel
+from src.apps.images.loadtest import (
+    create_fixture_users,
+    delete_fixture_users,
+    get_percentile,
+    parse_mix,
+    run_load_test,
+    summarize,
+)
+
+FIXTURES_PATH = os.path.join(settings.BASE_DIR, "fixtures/fixtures.json")
+TEST_MEDIA_ROOT = "var/www/site/tmp/"
+
+
+class TestLoadTestReport(TestCase):
+    def test_parse_mix(self):
+        self.assertEqual(
+            parse_mix("list=50, detail=30,upload"),
+            {"list": 50, "detail": 30, "upload": 1},
+        )
+        with self.assertRaises(ValueError):
+            parse_mix("list=1,unknown=2")
+
+    def test_get_percentile(self):
+        values = [float(value) for value in range(1, 101)]
+        self.assertEqual(get_percentile(values, 0.5), 50)
+        self.assertEqual(get_percentile(values, 0.99), 99)
+        self.assertEqual(get_percentile([7.0], 0.95), 7)
+
+    def test_summarize(self):
+        summary = summarize(
+            {"list": [0.3, 0.1, 0.2], "detail": []},
+            {"upload": 2},
+            seconds=2,
+        )
+        self.assertEqual(list(summary), ["list", "upload"])
+        self.assertEqual(summary["list"]["requests"], 3)
+        self.assertEqual(summary["list"]["throughput"], 1.5)
+        self.assertEqual(summary["list"]["p50"], 0.2)
+        self.assertEqual(summary["list"]["p99"], 0.3)
+        self.assertEqual(summary["upload"]["errors"], 2)
+        self.assertIsNone(summary["upload"]["p95"])
+
+
+class TestFixtureUsers(TestCase):
+    fixtures = [FIXTURES_PATH]
+
+    def test_create_fixture_users(self):
+        users = create_fixture_users(FIXTURES_PATH, password="secret")
+        self.assertEqual(
+            {user.username: user.can_generate_links for user in users},
+            {
+                "loadtest-basic": False,
+                "loadtest-premium": False,
+                "loadtest-enterprise": True,
+            },
+        )
+        # running again reuses the users
+        create_fixture_users(FIXTURES_PATH, password="secret")
+        account = UserAccount.objects.get(user__username="loadtest-basic")
+        self.assertEqual(account.membership_type.name, "Basic")
+        self.assertTrue(account.user.check_password("secret"))
+
+    def test_delete_fixture_users(self):
+        users = create_fixture_users(FIXTURES_PATH, password="secret")
+        account = UserAccount.objects.get(user__username="loadtest-basic")
+        ImageModel.objects.create(
+            title="loadtest",
+            uploaded_by=account,
+            image="images/loadtest.png",
+            width=640,
+            height=480,
+        )
+        delete_fixture_users(users)
+        self.assertFalse(
+            UserAccount.objects.filter(user__username__startswith="loadtest-").exists()
+        )
+        self.assertFalse(ImageModel.objects.filter(title="loadtest").exists())
+
+
+@override_settings(MEDIA_ROOT=TEST_MEDIA_ROOT, THUMBNAILS_ASYNC=False)
+class TestLoadTest(LiveServerTestCase):
+    fixtures = [FIXTURES_PATH]
+
+    def tearDown(self) -> None:
+        for filename in os.listdir(TEST_MEDIA_ROOT):
+            filepath = os.path.join(TEST_MEDIA_ROOT, filename)
+            try:
+                shutil.rmtree(filepath)
+            except OSError:
+                os.remove(filepath)
+        return super().tearDown()
+
+    def test_run_load_test(self):
+        users = [
+            user
+            for user in create_fixture_users(FIXTURES_PATH, password="secret")
+            if user.can_generate_links
+        ]
+        endpoints = ["list", "detail", "generate-link", "temporary-link"]
+        # every endpoint in turn instead of a random pick
+        picks = cycle([endpoint] for endpoint in endpoints)
+        with mock.patch(
+            "src.apps.images.loadtest.random.choices",
+            side_effect=lambda *args: next(picks),
+        ):
+            results = asyncio.run(
+                run_load_test(
+                    url=self.live_server_url,
+                    users=users,
+                    password="secret",
+                    mix=parse_mix(",".join(endpoints)),
+                    concurrency=1,
+                    duration=1,
+                )
+            )
+        self.assertEqual(list(results), endpoints)
+        for result in results.values():
+            self.assertEqual(result["errors"], 0)
+            self.assertGreater(result["requests"], 0)
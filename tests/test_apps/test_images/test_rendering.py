@@ -0,0 +1,173 @@
+import base64
+from io import BytesIO
+from unittest import mock
+from django import test
+from PIL import Image
+
+from src.apps.images.rendering import (
+    DEFAULT_RENDER_PROFILE,
+    RenderProfile,
+    encode_image,
+    encode_variants,
+    get_dhash,
+    get_placeholder,
+    get_supported_formats,
+    join_hash,
+    open_image,
+    render_thumbnail_cascade,
+    resize_image,
+    split_hash,
+)
+from tests.test_apps.test_images.utils import generate_image_file
+
+
+class TestRendering(test.TestCase):
+    def generate_jpeg_file(self, size: tuple[int]) -> BytesIO:
+        file = BytesIO()
+        image = Image.new("RGB", size=size, color=(155, 0, 0))
+        image.save(file, "jpeg")
+        file.seek(0)
+        return file
+
+    def test_open_image_decodes_jpeg_at_reduced_scale(self):
+        file = self.generate_jpeg_file(size=(4000, 3000))
+        image = open_image(file, (267, 200))
+        self.assertEqual(image.size, (500, 375))
+
+    def test_dhash_of_resized_copy_is_close(self):
+        image = Image.linear_gradient("L").rotate(30).convert("RGB")
+        copy = Image.open(BytesIO(encode_image(image.resize((100, 100)), "JPEG")))
+        distance = (get_dhash(image) ^ get_dhash(copy)).bit_count()
+        self.assertLessEqual(distance, 4)
+        self.assertGreater(
+            (get_dhash(image) ^ get_dhash(image.rotate(180))).bit_count(), 16
+        )
+
+    def test_split_hash(self):
+        value = 0x0123456789ABCDEF
+        self.assertEqual(split_hash(value), (0x0123, 0x4567, 0x89AB, 0xCDEF))
+        self.assertEqual(join_hash(split_hash(value)), value)
+
+    def test_render_thumbnail_cascade_summarizes_smallest_thumbnail(self):
+        rendered = render_thumbnail_cascade(
+            source=generate_image_file(), sizes=[(200, 200)], format="PNG"
+        )
+        self.assertIsNone(rendered[0].summary)
+
+        rendered = render_thumbnail_cascade(
+            source=generate_image_file(),
+            sizes=[(200, 200), (400, 400)],
+            format="PNG",
+            summarize=True,
+        )
+        self.assertIsNone(rendered[0].summary)
+        summary = rendered[1].summary
+        self.assertEqual(summary.dhash, 0)
+        self.assertEqual(summary.dominant_color, "#9b0000")
+        self.assertTrue(summary.placeholder.startswith("data:image/webp;base64,"))
+
+    def test_placeholder_is_tiny(self):
+        placeholder, _ = get_placeholder(Image.linear_gradient("L").resize((400, 200)))
+        content = base64.b64decode(placeholder.split(",")[1])
+        self.assertEqual(Image.open(BytesIO(content)).size, (20, 10))
+        self.assertLess(len(placeholder), 500)
+
+    def test_render_thumbnail_cascade_renders_every_size(self):
+        file = generate_image_file()
+        rendered = render_thumbnail_cascade(
+            source=file, sizes=[(200, 200), (400, 400)], format="PNG"
+        )
+        self.assertEqual(
+            [thumbnail.size for thumbnail in rendered], [(400, 400), (200, 200)]
+        )
+        for thumbnail in rendered:
+            image = Image.open(BytesIO(thumbnail.content))
+            self.assertEqual(image.size, (thumbnail.width, thumbnail.height))
+            self.assertEqual(image.size, thumbnail.size)
+
+    def test_render_thumbnail_cascade_decodes_source_once(self):
+        file = generate_image_file()
+        with mock.patch(
+            "src.apps.images.rendering.Image.open", wraps=Image.open
+        ) as image_open:
+            render_thumbnail_cascade(
+                source=file, sizes=[(200, 200), (400, 400)], format="PNG"
+            )
+        image_open.assert_called_once()
+
+    def test_render_thumbnail_cascade_does_not_upscale(self):
+        file = generate_image_file()
+        rendered = render_thumbnail_cascade(
+            source=file, sizes=[(2000, 2000)], format="PNG"
+        )
+        self.assertEqual((rendered[0].width, rendered[0].height), (1000, 1000))
+
+    def test_render_thumbnail_cascade_encodes_smaller_variants(self):
+        file = generate_image_file()
+        rendered = render_thumbnail_cascade(
+            source=file, sizes=[(200, 200)], format="PNG", variant_formats=["WEBP"]
+        )
+        ((format, content),) = rendered[0].variants
+        self.assertEqual(format, "WEBP")
+        self.assertLess(len(content), len(rendered[0].content))
+        image = Image.open(BytesIO(content))
+        self.assertEqual((image.format, image.size), ("WEBP", (200, 200)))
+
+    def test_encode_variants_skips_larger_encodings(self):
+        image = Image.new("RGB", size=(200, 200))
+        self.assertEqual(encode_variants(image, ["WEBP"], max_size=1), ())
+
+    def test_get_supported_formats_skips_unknown_encoders(self):
+        self.assertEqual(get_supported_formats(["WEBP", "UNKNOWN"]), ("WEBP",))
+
+    def test_render_profile_encoder_settings(self):
+        image = Image.effect_noise((300, 200), 64).convert("RGB")
+        low = encode_image(image, "JPEG", RenderProfile(quality=20))
+        high = encode_image(image, "JPEG", RenderProfile(quality=95, progressive=True))
+        self.assertLess(len(low), len(high))
+        self.assertTrue(Image.open(BytesIO(high)).info.get("progressive"))
+
+        fast = encode_image(image, "PNG", RenderProfile(png_compress_level=0))
+        small = encode_image(image, "PNG", RenderProfile(png_compress_level=9))
+        self.assertLess(len(small), len(fast))
+
+    def test_render_profile_keeps_metadata_unless_stripped(self):
+        file = BytesIO()
+        exif = Image.Exif()
+        exif[0x010E] = "description"
+        Image.new("RGB", size=(400, 400)).save(file, "jpeg", exif=exif)
+
+        for strip_metadata in (True, False):
+            file.seek(0)
+            [rendered] = render_thumbnail_cascade(
+                source=file,
+                sizes=[(200, 200)],
+                format="JPEG",
+                profiles={200: RenderProfile(strip_metadata=strip_metadata)},
+            )
+            image = Image.open(BytesIO(rendered.content))
+            self.assertEqual("exif" not in image.info, strip_metadata)
+
+    def test_render_profile_resample_filter(self):
+        file = generate_image_file()
+        with mock.patch.object(Image.Image, "resize", autospec=True) as resize:
+            resize.side_effect = lambda image, size, *args, **kwargs: Image.new(
+                image.mode, size
+            )
+            render_thumbnail_cascade(
+                source=file,
+                sizes=[(200, 200)],
+                format="PNG",
+                profiles={200: RenderProfile(resample="box", reducing_gap=2.0)},
+            )
+        resize.assert_called_once_with(
+            mock.ANY, (200, 200), Image.Resampling.BOX, reducing_gap=2.0
+        )
+
+    def test_default_render_profile_matches_image_thumbnail(self):
+        image = Image.effect_noise((1000, 1000), 64).convert("RGB")
+        expected = image.copy()
+        # thumbnails were rendered like this before render profiles
+        expected.thumbnail((200, 200), Image.Resampling.LANCZOS)
+        resized = resize_image(image, (200, 200), DEFAULT_RENDER_PROFILE)
+        self.assertEqual(resized.tobytes(), expected.tobytes())
@@ -1,19 +1,37 @@
-import os, shutil
+import io, os, shutil
 from datetime import timedelta
+from unittest import mock
+from django.core.management import call_command
+from django.db import connection
 from django.test import override_settings, TestCase
+from django.test.utils import CaptureQueriesContext
 from django.contrib.auth import get_user_model
 from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
 from django.utils import timezone
 from src.apps.accounts.models import UserAccount
-from src.apps.images.exceptions import InvalidImageAccessToken
+from src.apps.images.exceptions import InvalidImageAccessToken, InvalidUploadChunk
+from src.apps.images.links import SignedAccessToken, clear_revocations
 from src.apps.images.models import (
+    BackfillCheckpoint,
     ImageAccessToken,
     Image as ImageModel,
+    RevokedAccessToken,
     Thumbnail,
+    ThumbnailJob,
     ThumbnailSize,
+    UploadSession,
 )
 from src.apps.memberships.models import MembershipType
-from src.apps.images.services import ImageService, TemporaryLinkService
+from src.apps.memberships.profiles import clear_membership_profiles
+from src.apps.images.services import (
+    ImageService,
+    TemporaryLinkService,
+    ThumbnailBackfillService,
+    ThumbnailJobService,
+    UploadSessionService,
+    merge_ranges,
+)
 from tests.test_apps.test_images.utils import generate_image_file
 
 User = get_user_model()
@@ -57,6 +75,9 @@ class TestImageService(TestCase):
         cls.image = ContentFile(cls.image_file.getvalue(), name=cls.image_file.name)
         cls.image_data = {"title": "test", "image": cls.image}
 
+    def setUp(self):
+        clear_membership_profiles()
+
     def tearDown(self) -> None:
         for filename in os.listdir(TEST_MEDIA_ROOT):
             filepath = os.path.join(TEST_MEDIA_ROOT, filename)
@@ -77,6 +98,169 @@ class TestImageService(TestCase):
         self.assertEqual(len(result), 1)
         self.assertEqual(result[0], image_instance)
 
+    def test_image_service_enqueues_thumbnail_jobs_on_upload(self):
+        image_instance = self.service_class.upload_image(
+            data=self.image_data, user_account=self.user_account
+        )
+        jobs = ThumbnailJob.objects.filter(image=image_instance)
+        self.assertEqual(
+            sorted(job.height for job in jobs),
+            [self.thumbnail_200px.height, self.thumbnail_400px.height],
+        )
+        self.assertEqual(Thumbnail.objects.count(), 0)
+
+    @override_settings(THUMBNAILS_ASYNC=False)
+    def test_image_service_renders_thumbnails_on_synchronous_upload(self):
+        image_instance = self.service_class.upload_image(
+            data=self.image_data, user_account=self.user_account
+        )
+        self.assertEqual(image_instance.thumbnails.count(), 2)
+        self.assertEqual(ThumbnailJob.objects.count(), 0)
+
+    @override_settings(THUMBNAIL_VARIANT_FORMATS=[])
+    def test_image_service_renders_with_thumbnail_size_profile(self):
+        image = ImageModel.objects.create(
+            title="test", uploaded_by=self.user_account, image=self.image
+        )
+        default = self.service_class.build_thumbnails(image_model=image, heights=[200])
+
+        self.thumbnail_200px.png_compress_level = 0
+        self.thumbnail_200px.save()
+        uncompressed = self.service_class.build_thumbnails(
+            image_model=image, heights=[200]
+        )
+        self.assertGreater(uncompressed[0].thumbnail.size, default[0].thumbnail.size)
+
+    def test_render_profile_report_command(self):
+        ImageModel.objects.create(
+            title="test", uploaded_by=self.user_account, image=self.image
+        )
+        stdout = io.StringIO()
+        call_command("render_profile_report", "--baseline", stdout=stdout)
+        output = stdout.getvalue()
+        self.assertIn("200px profile [lanczos", output)
+        self.assertIn("200px default [lanczos", output)
+        self.assertIn("1 image(s)", output)
+
+    @override_settings(THUMBNAILS_ASYNC=False)
+    def test_image_service_stores_placeholder_on_upload(self):
+        image_instance = self.service_class.upload_image(
+            data=self.image_data, user_account=self.user_account
+        )
+        image_instance = ImageModel.objects.get(id=image_instance.id)
+        self.assertEqual(image_instance.dominant_color, "#9b0000")
+        self.assertTrue(image_instance.placeholder.startswith("data:image/"))
+        self.assertIsNotNone(image_instance.dhash)
+
+    def test_backfill_placeholders_command(self):
+        image = ImageModel.objects.create(
+            title="test", uploaded_by=self.user_account, image=self.image
+        )
+        missing = ImageModel.objects.create(
+            title="missing", uploaded_by=self.user_account, image=self.image
+        )
+        default_storage.delete(missing.image.name)
+
+        stdout, stderr = io.StringIO(), io.StringIO()
+        call_command("backfill_placeholders", stdout=stdout, stderr=stderr)
+        self.assertIn("Summarized 1 image(s), 1 error(s)", stdout.getvalue())
+        self.assertIn(str(missing.id), stderr.getvalue())
+
+        image = ImageModel.objects.get(id=image.id)
+        self.assertEqual(image.dominant_color, "#9b0000")
+        self.assertIsNotNone(image.dhash)
+
+    @override_settings(THUMBNAILS_ASYNC=False)
+    def test_summarize_images_does_not_load_dimensions_per_row(self):
+        for _ in range(3):
+            file = generate_image_file()
+            self.service_class.upload_image(
+                data={
+                    "title": "test",
+                    "image": ContentFile(file.getvalue(), name=file.name),
+                },
+                user_account=self.user_account,
+            )
+        images = list(ImageModel.objects.only("id", "image", "width", "height"))
+
+        with CaptureQueriesContext(connection) as context:
+            self.service_class.summarize_images(images)
+        thumbnail_queries = [
+            query
+            for query in context.captured_queries
+            if query["sql"].startswith("SELECT")
+            and 'FROM "images_thumbnail"' in query["sql"]
+        ]
+        self.assertEqual(len(thumbnail_queries), 1)
+
+    @override_settings(THUMBNAILS_ASYNC=False, THUMBNAIL_VARIANT_FORMATS=["WEBP"])
+    def test_image_service_stores_smaller_thumbnail_variants(self):
+        image_instance = self.service_class.upload_image(
+            data=self.image_data, user_account=self.user_account
+        )
+        for thumbnail in image_instance.thumbnails.all():
+            variant = thumbnail.variants["webp"]
+            self.assertTrue(variant["name"].endswith(".webp"))
+            self.assertLess(variant["size"], thumbnail.thumbnail.size)
+            self.assertEqual(default_storage.size(variant["name"]), variant["size"])
+
+    @override_settings(THUMBNAILS_ASYNC=False)
+    def test_duplicate_upload_shares_files_and_thumbnails(self):
+        first = self.service_class.upload_image(
+            data=self.image_data, user_account=self.user_account
+        )
+        with mock.patch.object(self.service_class, "build_thumbnails") as build:
+            second = self.service_class.upload_image(
+                data=self.image_data, user_account=self.user_account
+            )
+        build.assert_not_called()
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertEqual(len(os.listdir(os.path.join(TEST_MEDIA_ROOT, "images"))), 1)
+        self.assertEqual(
+            sorted(first.thumbnails.values_list("thumbnail", flat=True)),
+            sorted(second.thumbnails.values_list("thumbnail", flat=True)),
+        )
+
+    def test_duplicate_upload_queues_only_missing_thumbnails(self):
+        first = self.service_class.upload_image(
+            data=self.image_data, user_account=self.user_account
+        )
+        self.service_class.render_thumbnails(image_model=first, heights=[200])
+
+        second = self.service_class.upload_image(
+            data=self.image_data, user_account=self.user_account
+        )
+        self.assertEqual(
+            list(second.thumbnails.values_list("height", flat=True)), [200]
+        )
+        self.assertEqual(
+            list(
+                ThumbnailJob.objects.filter(image=second).values_list(
+                    "height", flat=True
+                )
+            ),
+            [400],
+        )
+
+    @override_settings(THUMBNAILS_ASYNC=False)
+    def test_shared_files_are_deleted_with_last_image(self):
+        first, second = self.service_class.bulk_upload_images(
+            items=[self.image_data, self.image_data], user_account=self.user_account
+        )
+        name = first.image.name
+        thumbnail_name = first.thumbnails.first().thumbnail.name
+        self.assertEqual(second.image.name, name)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertTrue(default_storage.exists(name))
+        self.assertTrue(default_storage.exists(thumbnail_name))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertFalse(default_storage.exists(name))
+        self.assertFalse(default_storage.exists(thumbnail_name))
+
     def test_image_service_correctly_creates_enterprise_thumbnails(self):
         image = ImageModel.objects.create(
             title="test", uploaded_by=self.user_account, image=self.image
@@ -111,6 +295,208 @@ class TestImageService(TestCase):
         self.assertEqual(len(result), 1)
 
 
+@override_settings(MEDIA_ROOT=TEST_MEDIA_ROOT)
+class TestThumbnailJobService(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.service_class = ThumbnailJobService
+
+        cls.thumbnail_200px = ThumbnailSize.objects.create(height=200)
+        cls.thumbnail_400px = ThumbnailSize.objects.create(height=400)
+
+        cls.user = User.objects.create(username="testuser")
+        cls.user_account = UserAccount.objects.create(user=cls.user)
+
+    def setUp(self):
+        image_file = generate_image_file()
+        image = ContentFile(image_file.getvalue(), name=image_file.name)
+        self.image_model = ImageModel.objects.create(
+            title="test", uploaded_by=self.user_account, image=image
+        )
+
+    def tearDown(self) -> None:
+        for filename in os.listdir(TEST_MEDIA_ROOT):
+            filepath = os.path.join(TEST_MEDIA_ROOT, filename)
+            try:
+                shutil.rmtree(filepath)
+            except OSError:
+                os.remove(filepath)
+        return super().tearDown()
+
+    def test_process_jobs_renders_thumbnails(self):
+        self.service_class.enqueue_jobs(
+            image_model=self.image_model,
+            thumbnail_sizes=[self.thumbnail_200px, self.thumbnail_400px],
+        )
+        processed = self.service_class.process_jobs(limit=10)
+
+        self.assertEqual(processed, 2)
+        self.assertEqual(self.image_model.thumbnails.count(), 2)
+        self.assertEqual(
+            ThumbnailJob.objects.filter(status=ThumbnailJob.Status.DONE).count(), 2
+        )
+
+    def test_process_jobs_touches_image(self):
+        self.service_class.enqueue_jobs(
+            image_model=self.image_model, thumbnail_sizes=[self.thumbnail_200px]
+        )
+        self.service_class.process_jobs(limit=10)
+
+        self.image_model.refresh_from_db(fields=["updated_at"])
+        self.assertGreater(self.image_model.updated_at, self.image_model.created_at)
+
+    def test_claim_jobs_skips_jobs_scheduled_in_the_future(self):
+        ThumbnailJob.objects.create(
+            image=self.image_model,
+            height=200,
+            run_after=timezone.now() + timedelta(seconds=60),
+        )
+        self.assertEqual(self.service_class.claim_jobs(limit=10), [])
+
+    def test_failed_job_is_retried_later(self):
+        self.service_class.enqueue_jobs(
+            image_model=self.image_model, thumbnail_sizes=[self.thumbnail_200px]
+        )
+        with mock.patch.object(
+            ImageService, "build_thumbnails", side_effect=OSError("broken file")
+        ):
+            self.service_class.process_jobs(limit=10)
+
+        job = ThumbnailJob.objects.get()
+        self.assertEqual(job.status, ThumbnailJob.Status.PENDING)
+        self.assertEqual(job.attempts, 1)
+        self.assertIn("broken file", job.last_error)
+        self.assertGreater(job.run_after, timezone.now())
+
+    @override_settings(THUMBNAIL_JOB_MAX_ATTEMPTS=1)
+    def test_job_fails_after_max_attempts(self):
+        self.service_class.enqueue_jobs(
+            image_model=self.image_model, thumbnail_sizes=[self.thumbnail_200px]
+        )
+        with mock.patch.object(
+            ImageService, "build_thumbnails", side_effect=OSError("broken file")
+        ):
+            self.service_class.process_jobs(limit=10)
+
+        job = ThumbnailJob.objects.get()
+        self.assertEqual(job.status, ThumbnailJob.Status.FAILED)
+
+    def test_failed_save_deletes_rendered_files(self):
+        self.service_class.enqueue_jobs(
+            image_model=self.image_model, thumbnail_sizes=[self.thumbnail_200px]
+        )
+        with mock.patch.object(
+            ImageService, "save_thumbnails", side_effect=OSError("database gone")
+        ):
+            self.service_class.process_jobs(limit=10)
+
+        job = ThumbnailJob.objects.get()
+        self.assertEqual(job.status, ThumbnailJob.Status.PENDING)
+        self.assertIn("database gone", job.last_error)
+        self.assertEqual(os.listdir(TEST_MEDIA_ROOT + "thumbnails"), [])
+
+    def test_requeue_stale_jobs(self):
+        ThumbnailJob.objects.create(
+            image=self.image_model,
+            height=200,
+            status=ThumbnailJob.Status.PROCESSING,
+            locked_at=timezone.now() - timedelta(days=1),
+        )
+        self.assertEqual(self.service_class.requeue_stale_jobs(), 1)
+        self.assertEqual(ThumbnailJob.objects.get().status, ThumbnailJob.Status.PENDING)
+
+    @override_settings(THUMBNAIL_JOB_MAX_ATTEMPTS=2)
+    def test_stale_job_fails_after_max_attempts(self):
+        ThumbnailJob.objects.create(
+            image=self.image_model,
+            height=200,
+            status=ThumbnailJob.Status.PROCESSING,
+            attempts=2,
+            locked_at=timezone.now() - timedelta(days=1),
+        )
+        self.assertEqual(self.service_class.requeue_stale_jobs(), 0)
+        job = ThumbnailJob.objects.get()
+        self.assertEqual(job.status, ThumbnailJob.Status.FAILED)
+        self.assertIsNone(job.locked_at)
+        self.assertIn("Worker stopped", job.last_error)
+
+
+@override_settings(MEDIA_ROOT=TEST_MEDIA_ROOT)
+class TestThumbnailBackfillService(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.service_class = ThumbnailBackfillService
+
+        cls.thumbnail_200px = ThumbnailSize.objects.create(height=200)
+        cls.thumbnail_400px = ThumbnailSize.objects.create(height=400)
+        cls.premium_membership = MembershipType.objects.create(
+            name="Premium", contains_original_link=True, generates_expiring_link=False
+        )
+        cls.premium_membership.thumbnail_sizes.add(
+            cls.thumbnail_200px, cls.thumbnail_400px
+        )
+
+        cls.user = User.objects.create(username="testuser")
+        cls.user_account = UserAccount.objects.create(
+            user=cls.user, membership_type=cls.premium_membership
+        )
+
+    def setUp(self):
+        image_file = generate_image_file()
+        image = ContentFile(image_file.getvalue(), name=image_file.name)
+        self.image_model = ImageModel.objects.create(
+            title="test", uploaded_by=self.user_account, image=image
+        )
+        ImageService.render_thumbnails(image_model=self.image_model, heights=[400])
+
+    def tearDown(self) -> None:
+        for filename in os.listdir(TEST_MEDIA_ROOT):
+            filepath = os.path.join(TEST_MEDIA_ROOT, filename)
+            try:
+                shutil.rmtree(filepath)
+            except OSError:
+                os.remove(filepath)
+        return super().tearDown()
+
+    def test_get_missing_thumbnails(self):
+        missing = self.service_class.get_missing_thumbnails(
+            image_ids=[self.image_model.id]
+        )
+        self.assertEqual(missing, {self.image_model.id: {200}})
+
+    def test_get_missing_thumbnails_skips_images_with_unfinished_jobs(self):
+        ThumbnailJob.objects.create(image=self.image_model, height=200)
+        missing = self.service_class.get_missing_thumbnails(
+            image_ids=[self.image_model.id]
+        )
+        self.assertEqual(missing, {})
+
+    def test_build_tasks_derives_from_larger_thumbnail(self):
+        tasks = self.service_class.build_tasks(missing={self.image_model.id: {200}})
+        thumbnail = self.image_model.thumbnails.get()
+        self.assertEqual(tasks[0].source_path, thumbnail.thumbnail.path)
+        self.assertEqual(tasks[0].sizes, ((200, 200),))
+
+    def test_backfill_thumbnails_command(self):
+        call_command("backfill_thumbnails", workers=1, stdout=io.StringIO())
+        self.assertEqual(
+            sorted(self.image_model.thumbnails.values_list("height", flat=True)),
+            [200, 400],
+        )
+        checkpoint = BackfillCheckpoint.objects.get(name="backfill_thumbnails")
+        self.assertIsNone(checkpoint.last_image_id)
+
+        call_command("backfill_thumbnails", workers=1, stdout=io.StringIO())
+        self.assertEqual(self.image_model.thumbnails.count(), 2)
+
+    def test_backfill_thumbnails_command_resumes_from_checkpoint(self):
+        BackfillCheckpoint.objects.create(
+            name="backfill_thumbnails", last_image_id=self.image_model.id
+        )
+        call_command("backfill_thumbnails", workers=1, stdout=io.StringIO())
+        self.assertEqual(self.image_model.thumbnails.count(), 1)
+
+
 @override_settings(MEDIA_ROOT=TEST_MEDIA_ROOT)
 class TestTemporaryLinkService(TestCase):
     @classmethod
@@ -139,6 +525,9 @@ class TestTemporaryLinkService(TestCase):
         )
         cls.link_data = {"seconds": 3000}
 
+    def setUp(self):
+        clear_revocations()
+
     def tearDown(self) -> None:
         for filename in os.listdir(TEST_MEDIA_ROOT):
             filepath = os.path.join(TEST_MEDIA_ROOT, filename)
@@ -174,5 +563,140 @@ class TestTemporaryLinkService(TestCase):
             image = self.service_class.get_image_from_token(
                 access_token_id=invalid_access_token.id
             )
-        result = ImageAccessToken.objects.all()
-        self.assertEqual(len(result), 0)
+
+    def test_temporary_link_service_creates_signed_access_token(self):
+        token = self.service_class.create_access_token(
+            image_id=self.image_model.id, data={**self.link_data, "signed": True}
+        )
+        self.assertFalse(ImageAccessToken.objects.exists())
+
+        self.service_class.get_image_name_from_signed_token(token.token)
+        with self.assertNumQueries(0):
+            image_name = self.service_class.get_image_name_from_signed_token(
+                token.token
+            )
+        self.assertEqual(image_name, self.image_model.image.name)
+
+    def test_get_image_name_from_expired_signed_token_raises_exception(self):
+        token = SignedAccessToken.create(
+            image_id=self.image_model.id,
+            image_name=self.image_model.image.name,
+            expires=timezone.now() - timedelta(seconds=1),
+        )
+        with self.assertRaises(InvalidImageAccessToken):
+            self.service_class.get_image_name_from_signed_token(token.token)
+
+    def test_get_image_name_from_tampered_signed_token_raises_exception(self):
+        token = self.service_class.create_access_token(
+            image_id=self.image_model.id, data={**self.link_data, "signed": True}
+        )
+        forged_token = SignedAccessToken.create(
+            image_id=self.image_model.id,
+            image_name="images/other.png",
+            expires=token.expires,
+        )
+        tampered_token = f"{forged_token.token.rsplit(':', 1)[0]}:{token.signature}"
+        with self.assertRaises(InvalidImageAccessToken):
+            self.service_class.get_image_name_from_signed_token(tampered_token)
+
+    def test_get_image_name_from_revoked_signed_token_raises_exception(self):
+        token = self.service_class.create_access_token(
+            image_id=self.image_model.id, data={**self.link_data, "signed": True}
+        )
+        self.service_class.get_image_name_from_signed_token(token.token)
+
+        self.service_class.revoke_signed_token(token.token)
+        with self.assertRaises(InvalidImageAccessToken):
+            self.service_class.get_image_name_from_signed_token(token.token)
+
+    def test_delete_expired_tokens(self):
+        expired_date = timezone.now() - timedelta(seconds=4000)
+        valid_date = timezone.now() + timedelta(seconds=4000)
+        for _ in range(3):
+            ImageAccessToken.objects.create(
+                image=self.image_model, expires=expired_date
+            )
+        valid_token = ImageAccessToken.objects.create(
+            image=self.image_model, expires=valid_date
+        )
+        RevokedAccessToken.objects.create(signature="expired", expires=expired_date)
+
+        result = self.service_class.delete_expired_tokens(batch_size=2)
+        self.assertEqual(result.deleted, 3)
+        self.assertEqual(result.revocations_deleted, 1)
+        self.assertGreaterEqual(result.seconds, 0)
+        self.assertEqual(list(ImageAccessToken.objects.all()), [valid_token])
+
+    def test_sweep_access_tokens_command(self):
+        ImageAccessToken.objects.create(
+            image=self.image_model, expires=timezone.now() - timedelta(seconds=4000)
+        )
+        stdout = io.StringIO()
+        call_command("sweep_access_tokens", stdout=stdout)
+        self.assertIn(
+            "Deleted 1 expired access token(s) and 0 expired revocation(s)",
+            stdout.getvalue(),
+        )
+        self.assertFalse(ImageAccessToken.objects.exists())
+
+
+@override_settings(UPLOAD_SESSIONS_DIR=TEST_MEDIA_ROOT + "uploads/")
+class TestUploadSessionService(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.service_class = UploadSessionService
+
+        cls.user = User.objects.create(username="testuser")
+        cls.user_account = UserAccount.objects.create(user=cls.user)
+
+    def tearDown(self) -> None:
+        shutil.rmtree(TEST_MEDIA_ROOT + "uploads/", ignore_errors=True)
+        return super().tearDown()
+
+    def create_session(self, size: int = 100) -> UploadSession:
+        return self.service_class.create_session(
+            data={"title": "test", "filename": "test.png", "size": size},
+            user_account=self.user_account,
+        )
+
+    def test_merge_ranges(self):
+        self.assertEqual(
+            merge_ranges([[20, 30], [0, 10], [10, 15], [25, 40]]),
+            [[0, 15], [20, 40]],
+        )
+
+    def test_write_chunk_in_any_order(self):
+        session = self.create_session(size=20)
+        session = self.service_class.write_chunk(
+            session=session, start=10, length=10, stream=io.BytesIO(b"b" * 10)
+        )
+        self.assertEqual(session.offset, 0)
+
+        session = self.service_class.write_chunk(
+            session=session, start=0, length=10, stream=io.BytesIO(b"a" * 10)
+        )
+        self.assertTrue(session.is_complete)
+        with open(self.service_class.get_path(session.id), "rb") as file:
+            self.assertEqual(file.read(), b"a" * 10 + b"b" * 10)
+
+    def test_write_chunk_rejects_short_body(self):
+        session = self.create_session(size=20)
+        with self.assertRaises(InvalidUploadChunk):
+            self.service_class.write_chunk(
+                session=session, start=0, length=10, stream=io.BytesIO(b"a" * 5)
+            )
+        session.refresh_from_db()
+        self.assertEqual(session.received_ranges, [])
+
+    def test_delete_expired_sessions(self):
+        expired = self.create_session()
+        UploadSession.objects.filter(id=expired.id).update(
+            expires=timezone.now() - timedelta(seconds=10)
+        )
+        valid = self.create_session()
+
+        result = self.service_class.delete_expired_sessions(batch_size=10)
+        self.assertEqual(result.deleted, 1)
+        self.assertEqual(list(UploadSession.objects.all()), [valid])
+        self.assertFalse(os.path.exists(self.service_class.get_path(expired.id)))
+        self.assertTrue(os.path.exists(self.service_class.get_path(valid.id)))
@@ -0,0 +1,78 @@
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+
+from src.apps.accounts.models import UserAccount
+from src.apps.images.models import Image as ImageModel
+from src.apps.images.similarity import (
+    get_chunk_neighbours,
+    get_similar_images,
+    store_image_hashes,
+)
+from src.apps.memberships.models import MembershipType
+
+User = get_user_model()
+
+
+class TestSimilarity(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        membership = MembershipType.objects.create(name="Basic")
+        cls.user_account = UserAccount.objects.create(
+            user=User.objects.create(username="testuser"), membership_type=membership
+        )
+        cls.other_account = UserAccount.objects.create(
+            user=User.objects.create(username="otheruser"), membership_type=membership
+        )
+
+    def create_image(self, user_account=None) -> ImageModel:
+        return ImageModel.objects.create(
+            title="test",
+            uploaded_by=user_account or self.user_account,
+            image="images/test.png",
+            width=1,
+            height=1,
+        )
+
+    def test_get_chunk_neighbours(self):
+        self.assertEqual(get_chunk_neighbours(0, 0), [0])
+        neighbours = get_chunk_neighbours(0, 2)
+        self.assertEqual(len(neighbours), 1 + 16 + 120)
+        self.assertIn(0b1000000000000001, neighbours)
+
+    def test_get_similar_images_within_distance(self):
+        images = [self.create_image() for _ in range(4)]
+        # bits flipped in every chunk, still 4 bits away in total
+        spread = 1 | 1 << 16 | 1 << 32 | 1 << 48
+        store_image_hashes(
+            {
+                images[0].id: 0,
+                images[1].id: 0b11,
+                images[2].id: spread,
+                images[3].id: 0b11111,
+            }
+        )
+
+        similar = get_similar_images(
+            ImageModel.objects.exclude(id=images[0].id), value=0, max_distance=4
+        )
+        self.assertEqual(
+            [(image.id, distance) for image, distance in similar],
+            [(images[1].id, 2), (images[2].id, 4)],
+        )
+
+    def test_store_image_hashes_flags_near_duplicates(self):
+        original, copy, unrelated = [self.create_image() for _ in range(3)]
+        other_users_copy = self.create_image(self.other_account)
+        store_image_hashes({original.id: 0xFF00, unrelated.id: 0xFF << 40})
+        store_image_hashes(
+            {copy.id: 0xFF01, unrelated.id: 0xFF << 40, other_users_copy.id: 0xFF00}
+        )
+
+        copy, unrelated, other_users_copy = [
+            ImageModel.objects.get(id=image.id)
+            for image in (copy, unrelated, other_users_copy)
+        ]
+        self.assertEqual(copy.dhash, 0xFF01)
+        self.assertEqual(copy.near_duplicate_of, original)
+        self.assertIsNone(unrelated.near_duplicate_of)
+        self.assertIsNone(other_users_copy.near_duplicate_of)
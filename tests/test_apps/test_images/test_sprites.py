@@ -0,0 +1,112 @@
+import os
+import shutil
+from io import BytesIO
+from uuid import uuid4
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.test import override_settings, TestCase
+from PIL import Image
+
+from src.apps.images.models import Thumbnail
+from src.apps.images.sprites import (
+    SpriteSheet,
+    encode_sprite,
+    get_sprite_key,
+    layout_sprite,
+    render_sprite,
+)
+
+TEST_MEDIA_ROOT = "var/www/site/tmp/"
+
+
+@override_settings(MEDIA_ROOT=TEST_MEDIA_ROOT)
+class TestSprites(TestCase):
+    def tearDown(self) -> None:
+        for filename in os.listdir(TEST_MEDIA_ROOT):
+            filepath = os.path.join(TEST_MEDIA_ROOT, filename)
+            try:
+                shutil.rmtree(filepath)
+            except OSError:
+                os.remove(filepath)
+        return super().tearDown()
+
+    def create_thumbnail(self, width: int, color: tuple[int] = (0, 0, 0)) -> Thumbnail:
+        file = BytesIO()
+        Image.new("RGB", (width, 100), color).save(file, "png")
+        name = default_storage.save("thumbnails/test.png", ContentFile(file.getvalue()))
+        return Thumbnail(image_id=uuid4(), thumbnail=name, width=width, height=100)
+
+    def get_sheet(self, thumbnails: list[Thumbnail], max_width: int) -> SpriteSheet:
+        tiles, width, height = layout_sprite(thumbnails, max_width=max_width)
+        return SpriteSheet(
+            key=get_sprite_key(1, 100, tiles),
+            user_id=1,
+            thumbnail_height=100,
+            width=width,
+            height=height,
+            tiles=tuple(tiles),
+        )
+
+    def test_layout_sprite_wraps_rows(self):
+        thumbnails = [
+            Thumbnail(image_id=uuid4(), thumbnail="a.png", width=width, height=100)
+            for width in (150, 100, 200, 50)
+        ]
+        tiles, width, height = layout_sprite(thumbnails, max_width=300)
+        self.assertEqual(
+            [(tile.x, tile.y) for tile in tiles],
+            [(0, 0), (150, 0), (0, 100), (200, 100)],
+        )
+        self.assertEqual((width, height), (250, 200))
+
+    def test_sprite_key_depends_on_thumbnail_rows(self):
+        image_id = uuid4()
+        thumbnails = [
+            Thumbnail(image_id=image_id, thumbnail="a.png", width=1, height=1)
+            for _ in range(2)
+        ]
+        self.assertNotEqual(
+            self.get_sheet(thumbnails[:1], max_width=100).key,
+            self.get_sheet(thumbnails[1:], max_width=100).key,
+        )
+
+    def test_render_sprite(self):
+        red = self.create_thumbnail(150, (255, 0, 0))
+        blue = self.create_thumbnail(100, (0, 0, 255))
+        sheet = self.get_sheet([red, blue], max_width=200)
+
+        sprite = Image.open(BytesIO(render_sprite(sheet)))
+        sprite = sprite.convert("RGBA")
+        self.assertEqual(sprite.size, (150, 200))
+        self.assertEqual(sprite.getpixel((10, 10)), (255, 0, 0, 255))
+        self.assertEqual(sprite.getpixel((10, 110)), (0, 0, 255, 255))
+
+    def test_render_sprite_reuses_tiles_of_previous_sheet(self):
+        red = self.create_thumbnail(100, (255, 0, 0))
+        previous = self.get_sheet([red], max_width=200)
+        previous_content = render_sprite(previous)
+
+        # the red tile can only come from the previous sheet
+        default_storage.delete(red.thumbnail.name)
+        green = self.create_thumbnail(100, (0, 255, 0))
+        sheet = self.get_sheet([green, red], max_width=200)
+        sprite = render_sprite(
+            sheet,
+            previous=previous,
+            previous_file=BytesIO(previous_content),
+        )
+
+        sprite = Image.open(BytesIO(sprite)).convert("RGBA")
+        self.assertEqual(sprite.getpixel((10, 10)), (0, 255, 0, 255))
+        self.assertEqual(sprite.getpixel((110, 10)), (255, 0, 0, 255))
+
+    def test_encode_sprite_is_smaller_than_master(self):
+        noise = self.create_thumbnail(100)
+        with default_storage.open(noise.thumbnail.name, "wb") as file:
+            Image.effect_noise((100, 100), 64).save(file, "png")
+        master = render_sprite(self.get_sheet([noise], max_width=200))
+
+        content = encode_sprite(BytesIO(master), format="WEBP", quality=80)
+        self.assertLess(len(content), len(master) // 2)
+        with Image.open(BytesIO(content)) as sprite:
+            self.assertEqual((sprite.format, sprite.size), ("WEBP", (100, 100)))
@@ -0,0 +1,86 @@
+import hashlib
+from io import BytesIO
+from django import test
+from django.test import override_settings
+from PIL import Image
+
+from src.apps.images.uploadhandlers import (
+    ImageUploadHandler,
+    inspect_image_file,
+    sniff_format,
+)
+from tests.test_apps.test_images.utils import generate_image_file
+
+
+def receive(content: bytes, chunk_size: int = 1024, name: str = "test.png"):
+    handler = ImageUploadHandler()
+    handler.new_file("image", name, "image/png", len(content))
+    for start in range(0, len(content), chunk_size):
+        handler.receive_data_chunk(content[start : start + chunk_size], start)
+    return handler.file_complete(len(content))
+
+
+class TestImageUploadHandler(test.TestCase):
+    def test_sniff_format(self):
+        self.assertEqual(sniff_format(b"\x89PNG\r\n\x1a\n..."), "PNG")
+        self.assertEqual(sniff_format(b"\xff\xd8\xff\xe0..."), "JPEG")
+        self.assertIsNone(sniff_format(b"GIF89a"))
+
+    def test_png_is_hashed_and_measured_while_received(self):
+        content = generate_image_file().getvalue()
+        file = receive(content)
+
+        self.assertIsNone(file.upload_error)
+        self.assertEqual(file.image_format, "PNG")
+        self.assertEqual(file.image_size, (1000, 1000))
+        self.assertEqual(file.sha256, hashlib.sha256(content).hexdigest())
+        self.assertEqual(file.read(), content)
+        file.close()
+
+    def test_jpeg_is_measured_while_received(self):
+        buffer = BytesIO()
+        Image.new("RGB", size=(640, 480)).save(buffer, "jpeg")
+        file = receive(buffer.getvalue(), chunk_size=64, name="test.jpg")
+
+        self.assertEqual(file.image_format, "JPEG")
+        self.assertEqual(file.image_size, (640, 480))
+        file.close()
+
+    def test_unknown_format_is_rejected_without_writing(self):
+        file = receive(b"GIF89a" + b"0" * 5000)
+
+        self.assertEqual(file.upload_error, "Upload a valid PNG or JPEG image.")
+        self.assertIsNone(file.sha256)
+        self.assertEqual(file.read(), b"")
+        file.close()
+
+    @override_settings(IMAGE_UPLOAD_MAX_SIZE=1000)
+    def test_oversize_file_is_rejected(self):
+        file = receive(generate_image_file().getvalue(), chunk_size=256)
+
+        self.assertIn("maximum size", file.upload_error)
+        self.assertEqual(file.read(), b"")
+        file.close()
+
+    @override_settings(IMAGE_UPLOAD_MAX_PIXELS=100 * 100)
+    def test_too_many_pixels_are_rejected_from_header(self):
+        file = receive(generate_image_file().getvalue())
+
+        self.assertEqual(file.upload_error, "Image dimensions are too large.")
+        file.close()
+
+    def test_stored_file_is_inspected_like_received_one(self):
+        file = generate_image_file()
+        inspect_image_file(file, chunk_size=64)
+        self.assertIsNone(file.upload_error)
+        self.assertEqual(file.image_format, "PNG")
+        self.assertEqual(file.image_size, (1000, 1000))
+        self.assertEqual(file.tell(), 0)
+
+        with override_settings(IMAGE_UPLOAD_MAX_PIXELS=100 * 100):
+            inspect_image_file(file)
+        self.assertEqual(file.upload_error, "Image dimensions are too large.")
+
+        file = BytesIO(b"GIF89a" + b"0" * 5000)
+        inspect_image_file(file)
+        self.assertEqual(file.upload_error, "Upload a valid PNG or JPEG image.")
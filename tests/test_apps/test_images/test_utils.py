@@ -1,5 +1,6 @@
 from django import test
 from src.apps.images.utils import (
+    get_accepted_variants,
     get_thumbnail_filename,
     get_thumbnail_dimensions,
     get_format,
@@ -52,3 +53,13 @@ class TestUtils(test.TestCase):
             ),
             (300, 300),
         )
+
+    def test_get_accepted_variants(self):
+        self.assertEqual(
+            get_accepted_variants("image/avif,image/webp,image/*,*/*;q=0.8"),
+            ("avif", "webp"),
+        )
+        self.assertEqual(get_accepted_variants("application/json, */*"), ())
+        self.assertEqual(
+            get_accepted_variants("image/webp;q=0, image/avif;q=0.5"), ("avif",)
+        )
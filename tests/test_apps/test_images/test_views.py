@@ -1,21 +1,40 @@
+import hashlib
+import json
 import os
 import shutil
 from datetime import timedelta
-from django.test import override_settings
+from io import BytesIO, StringIO
+from unittest import mock
+from uuid import uuid4
+from asgiref.sync import sync_to_async
+from django.test import AsyncRequestFactory, override_settings
 from django.urls import reverse
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
 from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.core.files.uploadedfile import SimpleUploadedFile
 from django.utils import timezone
+from PIL import Image as PILImage
 from rest_framework import status
 from rest_framework.test import APITestCase
 
 from src.apps.accounts.models import UserAccount
+from src.apps.images import response_cache
+from src.apps.images.rendering import render_thumbnail_cascade
 from src.apps.images.models import (
     ImageAccessToken,
     Image as ImageModel,
+    Thumbnail,
+    ThumbnailJob,
     ThumbnailSize,
+    UploadSession,
 )
+from src.apps.images.services import ImageService
+from src.apps.images.similarity import store_image_hashes
+from src.apps.images.views import temporary_image_link
 from src.apps.memberships.models import MembershipType
+from src.apps.memberships.profiles import clear_membership_profiles
 from tests.test_apps.test_images.utils import generate_image_file
 
 User = get_user_model()
@@ -63,9 +82,12 @@ class TestImageViewSet(APITestCase):
         cls.post_image_data = {"image": file, "title": "test_tile"}
 
         cls.image_list_url = reverse("images:image-list")
+        cls.image_bulk_url = reverse("images:image-bulk")
         cls.image_detail_url = reverse("images:image-detail", kwargs={"pk": cls.img.pk})
 
     def setUp(self):
+        clear_membership_profiles()
+        cache.clear()
         self.client.force_login(user=self.user)
 
     def tearDown(self) -> None:
@@ -81,9 +103,72 @@ class TestImageViewSet(APITestCase):
         response = self.client.post(
             self.image_list_url, self.post_image_data, format="multipart"
         )
-        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
         response_data = response.data
         self.assertEqual(response_data["title"], self.post_image_data["title"])
+        self.assertEqual(response_data["thumbnails"], [])
+        for job_data in response_data["thumbnail_jobs"]:
+            self.assertEqual(job_data["status"], ThumbnailJob.Status.PENDING)
+
+    def test_uploaded_image_is_inspected_while_received(self):
+        file = generate_image_file()
+        response = self.client.post(
+            self.image_list_url, {"image": file, "title": "test"}, format="multipart"
+        )
+        image = ImageModel.objects.get(id=response.data["id"])
+        self.assertEqual((image.width, image.height), (1000, 1000))
+        self.assertEqual(image.sha256, hashlib.sha256(file.getvalue()).hexdigest())
+
+    @override_settings(IMAGE_UPLOAD_MAX_PIXELS=100 * 100)
+    def test_user_cannot_post_image_with_too_many_pixels(self):
+        response = self.client.post(
+            self.image_list_url, self.post_image_data, format="multipart"
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data["image"], ["Image dimensions are too large."])
+
+    def post_image_named(self, name: str):
+        file = generate_image_file()
+        file.name = name
+        return self.client.post(
+            self.image_list_url, {"image": file, "title": "test"}, format="multipart"
+        )
+
+    def test_user_cannot_post_image_without_extension(self):
+        response = self.post_image_named("photo")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(
+            response.data["image"], ["Please upload a .png, .jpg or .jpeg file"]
+        )
+
+    def test_user_cannot_post_image_with_unsupported_extension(self):
+        response = self.post_image_named("photo.txt")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_user_cannot_post_image_with_extension_of_other_format(self):
+        response = self.post_image_named("photo.jpg")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(
+            response.data["image"], ["File extension does not match the image format."]
+        )
+
+    @override_settings(THUMBNAILS_ASYNC=False)
+    def test_uppercase_extension_is_normalized(self):
+        response = self.post_image_named("photo.PNG")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(response.data["thumbnails"]), 2)
+        image = ImageModel.objects.get(id=response.data["id"])
+        self.assertTrue(image.image.name.endswith(".png"))
+
+    @override_settings(THUMBNAILS_ASYNC=False)
+    def test_user_can_post_image_with_synchronous_thumbnails(self):
+        response = self.client.post(
+            self.image_list_url, self.post_image_data, format="multipart"
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        response_data = response.data
+        self.assertEqual(len(response_data["thumbnails"]), 2)
+        self.assertNotIn("thumbnail_jobs", response_data.keys())
 
     def test_user_without_account_cannot_post_image(self):
         self.client.force_login(user=self.user_no_account)
@@ -98,6 +183,18 @@ class TestImageViewSet(APITestCase):
         response_data = response.data["results"]
         self.assertEqual(len(response_data), 1)
 
+    def test_upload_invalidates_cached_image_list(self):
+        self.client.get(self.image_list_url)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(
+                self.image_list_url,
+                {"image": generate_image_file(), "title": "test"},
+                format="multipart",
+            )
+
+        response = self.client.get(self.image_list_url)
+        self.assertEqual(len(response.data["results"]), 2)
+
     def test_user_without_account_cannot_get_image_list(self):
         self.client.force_login(user=self.user_no_account)
         response = self.client.get(self.image_list_url)
@@ -129,10 +226,10 @@ class TestImageViewSet(APITestCase):
         response = self.client.post(
             self.image_list_url, self.post_image_data, format="multipart"
         )
-        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
         response_data = response.data
         self.assertEqual(response_data["title"], self.post_image_data["title"])
-        self.assertEqual(len(response_data["thumbnails"]), 1)
+        self.assertEqual(len(response_data["thumbnail_jobs"]), 1)
 
     def test_premium_member_can_post_image(self):
         self.user_account.membership_type = self.premium_membership
@@ -141,10 +238,10 @@ class TestImageViewSet(APITestCase):
         response = self.client.post(
             self.image_list_url, self.post_image_data, format="multipart"
         )
-        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
         response_data = response.data
         self.assertEqual(response_data["title"], self.post_image_data["title"])
-        self.assertEqual(len(response_data["thumbnails"]), 2)
+        self.assertEqual(len(response_data["thumbnail_jobs"]), 2)
         self.assertIn("image", response_data.keys())
 
     def test_enterprise_member_can_post_image(self):
@@ -154,15 +251,453 @@ class TestImageViewSet(APITestCase):
         response = self.client.post(
             self.image_list_url, self.post_image_data, format="multipart"
         )
-        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
         response_data = response.data
         self.assertEqual(response_data["title"], self.post_image_data["title"])
-        self.assertEqual(len(response_data["thumbnails"]), 2)
+        self.assertEqual(len(response_data["thumbnail_jobs"]), 2)
         self.assertIn("image", response_data.keys())
         self.assertIn("temporary_link_generator", response_data.keys())
 
+    def test_user_can_bulk_upload_images(self):
+        files = [generate_image_file() for _ in range(3)]
+        response = self.client.post(
+            self.image_bulk_url,
+            {"images": files, "titles": ["first", "second", "third"]},
+            format="multipart",
+        )
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        results = response.data["results"]
+        self.assertEqual(
+            [result["image"]["title"] for result in results],
+            ["first", "second", "third"],
+        )
+        for result in results:
+            self.assertEqual(len(result["thumbnail_jobs"]), 2)
+        self.assertEqual(
+            ImageModel.objects.filter(uploaded_by=self.user_account).count(), 4
+        )
 
-@override_settings(MEDIA_ROOT=TEST_MEDIA_ROOT)
+    @override_settings(THUMBNAILS_ASYNC=False)
+    def test_user_can_bulk_upload_images_with_synchronous_thumbnails(self):
+        files = [generate_image_file() for _ in range(2)]
+        response = self.client.post(
+            self.image_bulk_url, {"images": files}, format="multipart"
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        for result in response.data["results"]:
+            self.assertEqual(result["image"]["title"], "test")
+            self.assertEqual(len(result["image"]["thumbnails"]), 2)
+
+    def test_bulk_upload_reports_errors_per_item(self):
+        invalid_file = SimpleUploadedFile("invalid.png", b"not an image")
+        response = self.client.post(
+            self.image_bulk_url,
+            {"images": [generate_image_file(), invalid_file]},
+            format="multipart",
+        )
+        self.assertEqual(response.status_code, status.HTTP_207_MULTI_STATUS)
+        valid_result, invalid_result = response.data["results"]
+        self.assertEqual(valid_result["status"], status.HTTP_202_ACCEPTED)
+        self.assertEqual(invalid_result["status"], status.HTTP_400_BAD_REQUEST)
+        self.assertIn("image", invalid_result["errors"])
+
+    def test_bulk_upload_requires_title_for_every_image(self):
+        response = self.client.post(
+            self.image_bulk_url,
+            {
+                "images": [generate_image_file(), generate_image_file()],
+                "titles": ["one"],
+            },
+            format="multipart",
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_user_without_account_cannot_bulk_upload_images(self):
+        self.client.force_login(user=self.user_no_account)
+        response = self.client.post(
+            self.image_bulk_url, {"images": [generate_image_file()]}, format="multipart"
+        )
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def get_render_url(self, image: ImageModel) -> str:
+        return reverse("images:image-render", kwargs={"pk": image.pk})
+
+    def upload_image(self) -> ImageModel:
+        file = generate_image_file()
+        image_file = ContentFile(file.getvalue(), name=file.name)
+        return ImageModel.objects.create(
+            title="test", uploaded_by=self.user_account, image=image_file
+        )
+
+    @override_settings(DERIVATIVE_CACHE_DIR=TEST_MEDIA_ROOT + "derivatives/")
+    def test_user_can_render_derivative(self):
+        image = self.upload_image()
+        response = self.client.get(
+            self.get_render_url(image), {"h": 200, "fmt": "webp"}
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response["Content-Type"], "image/webp")
+        content = b"".join(response.streaming_content)
+        self.assertEqual(PILImage.open(BytesIO(content)).size, (200, 200))
+
+    @override_settings(DERIVATIVE_CACHE_DIR=TEST_MEDIA_ROOT + "derivatives/")
+    def test_render_defaults_to_original_format(self):
+        image = self.upload_image()
+        response = self.client.get(self.get_render_url(image), {"h": 400})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response["Content-Type"], "image/png")
+
+    @override_settings(DERIVATIVE_CACHE_DIR=TEST_MEDIA_ROOT + "derivatives/")
+    def test_render_serves_stored_thumbnail_of_same_format(self):
+        image = self.upload_image()
+        [thumbnail] = ImageService.render_thumbnails(image_model=image, heights=[200])
+        response = self.client.get(self.get_render_url(image), {"h": 200, "fmt": "png"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        with thumbnail.thumbnail.open("rb") as file:
+            self.assertEqual(b"".join(response.streaming_content), file.read())
+        self.assertFalse(os.path.exists(TEST_MEDIA_ROOT + "derivatives/"))
+
+    @override_settings(DERIVATIVE_CACHE_DIR=TEST_MEDIA_ROOT + "derivatives/")
+    def test_render_derives_from_stored_thumbnail(self):
+        image = self.upload_image()
+        [thumbnail] = ImageService.render_thumbnails(image_model=image, heights=[200])
+        with mock.patch(
+            "src.apps.images.services.render_thumbnail_cascade",
+            wraps=render_thumbnail_cascade,
+        ) as render:
+            response = self.client.get(
+                self.get_render_url(image), {"h": 200, "fmt": "jpeg"}
+            )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(render.call_args.kwargs["source"], thumbnail.thumbnail.path)
+        content = b"".join(response.streaming_content)
+        self.assertEqual(PILImage.open(BytesIO(content)).size, (200, 200))
+
+    def test_user_cannot_render_height_outside_membership(self):
+        image = self.upload_image()
+        response = self.client.get(self.get_render_url(image), {"h": 300})
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_user_cannot_render_unsupported_format(self):
+        image = self.upload_image()
+        response = self.client.get(self.get_render_url(image), {"h": 200, "fmt": "gif"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    @override_settings(TEMPORARY_LINK_SERVE_MODE="accel")
+    def test_user_can_get_original_through_protected_media(self):
+        image = self.upload_image()
+        response = self.client.get(self.image_detail_url)
+        original_url = reverse("images:image-original", kwargs={"pk": self.img.pk})
+        self.assertTrue(response.data["image"].endswith(original_url))
+
+        response = self.client.get(
+            reverse("images:image-original", kwargs={"pk": image.pk})
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            response["X-Accel-Redirect"], "/protected-media/" + image.image.name
+        )
+
+    def test_user_without_original_link_cannot_get_original(self):
+        image = self.upload_image()
+        self.user_account.membership_type = self.basic_membership
+        self.user_account.save()
+        response = self.client.get(
+            reverse("images:image-original", kwargs={"pk": image.pk})
+        )
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def get_similar_url(self, image: ImageModel) -> str:
+        return reverse("images:image-similar", kwargs={"pk": image.pk})
+
+    def test_user_can_get_similar_images(self):
+        near, far = self.upload_image(), self.upload_image()
+        store_image_hashes({self.img.id: 0})
+        store_image_hashes({near.id: 0b111, far.id: 2**64 - 1})
+
+        response = self.client.get(self.get_similar_url(self.img))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        results = response.data["results"]
+        self.assertEqual([result["id"] for result in results], [str(near.id)])
+        self.assertEqual(results[0]["distance"], 3)
+        self.assertEqual(results[0]["near_duplicate_of"], self.img.id)
+
+        response = self.client.get(self.get_similar_url(self.img), {"distance": 2})
+        self.assertEqual(response.data["results"], [])
+
+    def test_similar_images_of_unhashed_image(self):
+        response = self.client.get(self.get_similar_url(self.img))
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+
+    @override_settings(DERIVATIVE_CACHE_DIR=TEST_MEDIA_ROOT + "derivatives/")
+    def test_user_can_get_sprite_of_image_page(self):
+        images = [self.upload_image(), self.upload_image()]
+        for image in images:
+            ImageService.render_thumbnails(image_model=image, heights=[200])
+
+        response = self.client.get(reverse("images:image-sprite"), {"h": 200})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        # newest first, the image without thumbnails is left out
+        self.assertEqual(
+            [tile["id"] for tile in response.data["tiles"]],
+            [str(image.id) for image in reversed(images)],
+        )
+        self.assertEqual(response.data["tiles"][1]["x"], 200)
+
+        response = self.client.get(response.data["sprite"])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        content = b"".join(response.streaming_content)
+        self.assertEqual(PILImage.open(BytesIO(content)).size, (400, 200))
+
+    def test_user_cannot_get_sprite_outside_membership(self):
+        response = self.client.get(reverse("images:image-sprite"), {"h": 300})
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_unknown_sprite_is_not_found(self):
+        url = reverse("images:image-sprite-file", kwargs={"key": "0" * 32})
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+RESPONSE_CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+        "LOCATION": TEST_MEDIA_ROOT + "response-cache/",
+    }
+}
+
+
+# the response cache needs a cache shared by all processes
+@override_settings(CACHES=RESPONSE_CACHES, IMAGE_RESPONSE_CACHE_STATS=True)
+class TestImageViewSetQueries(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.thumbnail_200px = ThumbnailSize.objects.create(height=200)
+        cls.thumbnail_400px = ThumbnailSize.objects.create(height=400)
+        cls.enterprise_membership = MembershipType.objects.create(
+            name="Enterprise", contains_original_link=True, generates_expiring_link=True
+        )
+        cls.enterprise_membership.thumbnail_sizes.add(
+            cls.thumbnail_200px, cls.thumbnail_400px
+        )
+
+        cls.user = User.objects.create(username="testuser")
+        cls.user_account = UserAccount.objects.create(
+            user=cls.user, membership_type=cls.enterprise_membership
+        )
+        for index in range(10):
+            image = ImageModel.objects.create(
+                title=f"test {index}",
+                uploaded_by=cls.user_account,
+                image=f"images/test-{index}.png",
+                height=1000,
+                width=1000,
+            )
+            for height in (200, 400):
+                Thumbnail.objects.create(
+                    image=image,
+                    thumbnail=f"thumbnails/test-{index}-{height}.png",
+                    height=height,
+                    width=height,
+                    variants={
+                        "avif": {
+                            "name": f"thumbnails/test-{index}-{height}.avif",
+                            "size": 200,
+                        },
+                        "webp": {
+                            "name": f"thumbnails/test-{index}-{height}.webp",
+                            "size": 100,
+                        },
+                    },
+                )
+        cls.image = image
+
+        cls.image_list_url = reverse("images:image-list")
+        cls.image_detail_url = reverse("images:image-detail", kwargs={"pk": image.pk})
+
+    def setUp(self):
+        clear_membership_profiles()
+        cache.clear()
+        self.client.force_login(user=self.user)
+
+    def test_image_list_query_count_does_not_depend_on_page_size(self):
+        self.client.get(self.image_list_url)  # loads the membership profile
+
+        # session, user, validator, images, thumbnails
+        for page_size in (1, 10):
+            with self.assertNumQueries(5):
+                response = self.client.get(
+                    self.image_list_url, {"page_size": page_size}
+                )
+            self.assertEqual(len(response.data["results"]), page_size)
+
+    def test_image_list_cursor_pagination(self):
+        seen = []
+        url = self.image_list_url + "?page_size=4"
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertNotIn("count", response.data)
+            seen += [image["id"] for image in response.data["results"]]
+            url = response.data["next"]
+
+        expected = ImageModel.objects.order_by("-created_at", "-id").values_list(
+            "id", flat=True
+        )
+        self.assertEqual(seen, [str(image_id) for image_id in expected])
+
+    def test_image_detail_query_count(self):
+        self.client.get(self.image_detail_url)  # loads the membership profile
+
+        cache.clear()
+
+        # session, user, validator, image, thumbnails
+        with self.assertNumQueries(5):
+            response = self.client.get(self.image_detail_url)
+        self.assertEqual(len(response.data["thumbnails"]), 2)
+
+    def test_membership_profile_is_loaded_once(self):
+        # session, user, account with membership, thumbnail sizes,
+        # validator, image, thumbnails
+        with self.assertNumQueries(7):
+            self.client.get(self.image_detail_url)
+        cache.clear()
+        with self.assertNumQueries(5):
+            self.client.get(self.image_detail_url)
+
+    def test_image_list_is_served_from_response_cache(self):
+        response = self.client.get(self.image_list_url)
+
+        # session, user, validator
+        with self.assertNumQueries(3):
+            cached = self.client.get(self.image_list_url)
+        self.assertEqual(cached.status_code, status.HTTP_200_OK)
+        self.assertEqual(cached.data, response.data)
+
+        stats = response_cache.get_stats()
+        self.assertEqual((stats["hits"], stats["misses"]), (1, 1))
+
+    def test_response_cache_is_invalidated_by_thumbnail_render(self):
+        self.client.get(self.image_detail_url)
+
+        Thumbnail.objects.filter(image=self.image, height=400).delete()
+        with self.captureOnCommitCallbacks(execute=True):
+            with override_settings(MEDIA_ROOT=TEST_MEDIA_ROOT):
+                ImageService.render_thumbnails(
+                    image_model=self.image,
+                    heights=[400],
+                    source=generate_image_file(),
+                )
+        shutil.rmtree(TEST_MEDIA_ROOT + "thumbnails")
+
+        with self.assertNumQueries(5):
+            response = self.client.get(self.image_detail_url)
+        self.assertEqual(len(response.data["thumbnails"]), 2)
+
+    def test_response_cache_depends_on_membership(self):
+        self.client.get(self.image_detail_url)
+
+        self.enterprise_membership.generates_expiring_link = False
+        self.enterprise_membership.save()
+        response = self.client.get(self.image_detail_url)
+        self.assertNotIn("temporary_link_generator", response.data)
+        self.assertEqual(response_cache.get_stats()["hits"], 0)
+
+    @override_settings(
+        CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+    )
+    def test_response_cache_is_skipped_with_local_memory_cache(self):
+        self.client.get(self.image_list_url)
+        response = self.client.get(self.image_list_url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response_cache.get_stats()["misses"], 0)
+
+    @override_settings(IMAGE_RESPONSE_CACHE_STATS=False)
+    def test_response_cache_counters_can_be_disabled(self):
+        self.client.get(self.image_list_url)
+        self.client.get(self.image_list_url)
+        self.assertEqual(response_cache.get_stats()["hits"], 0)
+
+    def test_response_cache_stats_command(self):
+        self.client.get(self.image_list_url)
+        self.client.get(self.image_list_url)
+
+        out = StringIO()
+        call_command("response_cache_stats", "--reset", stdout=out)
+        self.assertIn("Hits: 1, misses: 1, hit ratio: 50.00%", out.getvalue())
+        self.assertEqual(response_cache.get_stats()["hits"], 0)
+
+    def test_thumbnail_format_is_negotiated_with_accept_header(self):
+        response = self.client.get(self.image_detail_url)
+        thumbnail = response.data["thumbnails"][0]
+        self.assertTrue(thumbnail["thumbnail"].endswith(".png"))
+        self.assertEqual(set(thumbnail["variants"]), {"avif", "webp"})
+        self.assertIn("Accept", response["Vary"])
+
+        response = self.client.get(
+            self.image_detail_url, HTTP_ACCEPT="application/json, image/avif"
+        )
+        self.assertTrue(response.data["thumbnails"][0]["thumbnail"].endswith(".avif"))
+
+        # the smallest accepted variant wins
+        response = self.client.get(
+            self.image_detail_url,
+            HTTP_ACCEPT="application/json, image/avif, image/webp",
+        )
+        self.assertTrue(response.data["thumbnails"][0]["thumbnail"].endswith(".webp"))
+
+    def test_image_list_returns_304_for_matching_etag(self):
+        response = self.client.get(self.image_list_url)
+        self.assertIn("Last-Modified", response)
+
+        # session, user, validator
+        with self.assertNumQueries(3):
+            not_modified = self.client.get(
+                self.image_list_url, HTTP_IF_NONE_MATCH=response["ETag"]
+            )
+        self.assertEqual(not_modified.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(not_modified["ETag"], response["ETag"])
+
+    def test_image_detail_returns_304_for_matching_etag(self):
+        response = self.client.get(self.image_detail_url)
+        not_modified = self.client.get(
+            self.image_detail_url, HTTP_IF_NONE_MATCH=response["ETag"]
+        )
+        self.assertEqual(not_modified.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_image_list_etag_depends_on_pagination(self):
+        first = self.client.get(self.image_list_url)
+        second = self.client.get(self.image_list_url, {"page_size": 1})
+        self.assertNotEqual(first["ETag"], second["ETag"])
+
+    def test_image_list_etag_changes_when_images_change(self):
+        etag = self.client.get(self.image_list_url)["ETag"]
+
+        ImageModel.objects.filter(id=self.image.id).update(updated_at=timezone.now())
+        response = self.client.get(self.image_list_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        etag = response["ETag"]
+
+        self.image.delete()
+        response = self.client.get(self.image_list_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_image_list_etag_changes_with_membership(self):
+        etag = self.client.get(self.image_list_url)["ETag"]
+
+        self.enterprise_membership.thumbnail_sizes.remove(self.thumbnail_400px)
+        response = self.client.get(self.image_list_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_missing_image_has_no_etag(self):
+        url = reverse("images:image-detail", kwargs={"pk": uuid4()})
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertNotIn("ETag", response)
+
+
+# tests of the other serve modes override it
+@override_settings(MEDIA_ROOT=TEST_MEDIA_ROOT, TEMPORARY_LINK_SERVE_MODE="json")
 class TestTemporaryImageLinkViews(APITestCase):
     @classmethod
     def setUpTestData(cls):
@@ -183,7 +718,8 @@ class TestTemporaryImageLinkViews(APITestCase):
         cls.user_no_account = User.objects.create(username="invaliduser")
 
         file = generate_image_file()
-        image_file = ContentFile(file.getvalue(), name=file.name)
+        cls.image_content = file.getvalue()
+        image_file = ContentFile(cls.image_content, name=file.name)
         cls.img = ImageModel.objects.create(
             title="test", uploaded_by=cls.user_account, image=image_file
         )
@@ -208,6 +744,8 @@ class TestTemporaryImageLinkViews(APITestCase):
         )
 
     def setUp(self):
+        clear_membership_profiles()
+        cache.clear()
         self.client.force_login(user=self.user)
 
     def tearDown(self) -> None:
@@ -246,6 +784,22 @@ class TestTemporaryImageLinkViews(APITestCase):
         response = self.client.get(self.temporary_link_url)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
 
+    async def test_async_temporary_link_view(self):
+        request = AsyncRequestFactory().get(self.temporary_link_url)
+        response = await temporary_image_link(request, pk=self.access_token.id)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(
+            json.loads(response.content)["image"].endswith(self.img.image.url)
+        )
+
+    async def test_async_temporary_link_view_errors_match_sync_view(self):
+        for pk in (uuid4(), self.invalid_access_token.id):
+            url = reverse("images:temporary-image", kwargs={"pk": pk})
+            sync_response = await sync_to_async(self.client.get)(url)
+            response = await temporary_image_link(AsyncRequestFactory().get(url), pk=pk)
+            self.assertEqual(response.status_code, sync_response.status_code)
+            self.assertEqual(json.loads(response.content), sync_response.json())
+
     def test_user_with_no_account_can_get_image_by_temporary_link(self):
         self.client.force_login(self.user_no_account)
         response = self.client.get(self.temporary_link_url)
@@ -259,3 +813,276 @@ class TestTemporaryImageLinkViews(APITestCase):
     def test_user_cannot_get_image_by_invalid_temporary_link(self):
         response = self.client.get(self.invalid_temporary_link_url)
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_enterprise_member_can_generate_signed_temporary_link(self):
+        response = self.client.post(
+            self.image_generate_link_url, {**self.post_data, "signed": True}
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertIn("/imgtmp/s/", response.data["img_url"])
+        self.assertFalse(
+            ImageAccessToken.objects.exclude(
+                id__in=[self.access_token.id, self.invalid_access_token.id]
+            ).exists()
+        )
+
+        self.client.logout()
+        self.client.get(response.data["img_url"])  # loads the revocation list
+        with self.assertNumQueries(0):
+            image_response = self.client.get(response.data["img_url"])
+        self.assertEqual(image_response.status_code, status.HTTP_200_OK)
+        self.assertTrue(image_response.json()["image"].endswith(self.img.image.url))
+
+    def test_user_cannot_get_image_by_invalid_signed_temporary_link(self):
+        url = reverse("images:signed-temporary-image", kwargs={"token": "invalid"})
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def restore_image_file(self):
+        # tearDown removes the file saved in setUpTestData
+        path = self.img.image.path
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as file:
+            file.write(self.image_content)
+
+    @override_settings(TEMPORARY_LINK_SERVE_MODE="accel")
+    def test_temporary_link_is_served_by_nginx_in_accel_mode(self):
+        self.restore_image_file()
+        response = self.client.get(self.temporary_link_url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            response["X-Accel-Redirect"], "/protected-media/" + self.img.image.name
+        )
+        self.assertEqual(response.content, b"")
+        self.assertIn("ETag", response)
+        self.assertIn("Last-Modified", response)
+
+    @override_settings(TEMPORARY_LINK_SERVE_MODE="file")
+    def test_temporary_link_streams_file_in_file_mode(self):
+        self.restore_image_file()
+        response = self.client.get(self.temporary_link_url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response["Accept-Ranges"], "bytes")
+        self.assertEqual(b"".join(response.streaming_content), self.image_content)
+
+    @override_settings(TEMPORARY_LINK_SERVE_MODE="file")
+    def test_temporary_link_supports_range_requests(self):
+        self.restore_image_file()
+        size = len(self.image_content)
+
+        response = self.client.get(self.temporary_link_url, HTTP_RANGE="bytes=0-9")
+        self.assertEqual(response.status_code, status.HTTP_206_PARTIAL_CONTENT)
+        self.assertEqual(response["Content-Range"], f"bytes 0-9/{size}")
+        self.assertEqual(b"".join(response.streaming_content), self.image_content[:10])
+
+        response = self.client.get(self.temporary_link_url, HTTP_RANGE="bytes=-5")
+        self.assertEqual(response.status_code, status.HTTP_206_PARTIAL_CONTENT)
+        self.assertEqual(b"".join(response.streaming_content), self.image_content[-5:])
+
+        response = self.client.get(self.temporary_link_url, HTTP_RANGE=f"bytes={size}-")
+        self.assertEqual(
+            response.status_code, status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE
+        )
+        self.assertEqual(response["Content-Range"], f"bytes */{size}")
+
+    @override_settings(TEMPORARY_LINK_SERVE_MODE="file")
+    def test_temporary_link_ignores_range_for_stale_if_range(self):
+        self.restore_image_file()
+        response = self.client.get(
+            self.temporary_link_url, HTTP_RANGE="bytes=0-9", HTTP_IF_RANGE='"stale"'
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    @override_settings(TEMPORARY_LINK_SERVE_MODE="file")
+    def test_temporary_link_supports_conditional_requests(self):
+        self.restore_image_file()
+        response = self.client.get(self.temporary_link_url)
+
+        not_modified = self.client.get(
+            self.temporary_link_url, HTTP_IF_NONE_MATCH=response["ETag"]
+        )
+        self.assertEqual(not_modified.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        not_modified = self.client.get(
+            self.temporary_link_url, HTTP_IF_MODIFIED_SINCE=response["Last-Modified"]
+        )
+        self.assertEqual(not_modified.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    @override_settings(TEMPORARY_LINK_SERVE_MODE="accel")
+    def test_signed_temporary_link_is_served_by_nginx_in_accel_mode(self):
+        self.restore_image_file()
+        response = self.client.post(
+            self.image_generate_link_url, {**self.post_data, "signed": True}
+        )
+        self.client.logout()
+        image_response = self.client.get(response.data["img_url"])
+        self.assertEqual(image_response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            image_response["X-Accel-Redirect"],
+            "/protected-media/" + self.img.image.name,
+        )
+
+    @override_settings(TEMPORARY_LINK_SERVE_MODE="accel")
+    def test_temporary_link_to_missing_file_returns_404(self):
+        self.restore_image_file()
+        os.remove(self.img.image.path)
+        response = self.client.get(self.temporary_link_url)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+@override_settings(
+    MEDIA_ROOT=TEST_MEDIA_ROOT,
+    UPLOAD_SESSIONS_DIR=TEST_MEDIA_ROOT + "uploads/",
+    THUMBNAILS_ASYNC=True,
+)
+class TestUploadSessionViews(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.membership = MembershipType.objects.create(
+            name="Basic", contains_original_link=False, generates_expiring_link=False
+        )
+        cls.membership.thumbnail_sizes.add(ThumbnailSize.objects.create(height=200))
+
+        cls.user = User.objects.create(username="testuser")
+        cls.user_account = UserAccount.objects.create(
+            user=cls.user, membership_type=cls.membership
+        )
+        cls.other_user = User.objects.create(username="otheruser")
+        UserAccount.objects.create(user=cls.other_user, membership_type=cls.membership)
+
+        cls.content = generate_image_file().getvalue()
+        cls.upload_list_url = reverse("images:upload-session-list")
+
+    def setUp(self):
+        clear_membership_profiles()
+        self.client.force_login(user=self.user)
+
+    def tearDown(self) -> None:
+        shutil.rmtree(TEST_MEDIA_ROOT, ignore_errors=True)
+        os.makedirs(TEST_MEDIA_ROOT, exist_ok=True)
+        return super().tearDown()
+
+    def create_session(self, **data):
+        data = {
+            "title": "test",
+            "filename": "test.png",
+            "size": len(self.content),
+            **data,
+        }
+        response = self.client.post(self.upload_list_url, data)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        return response.data["upload_url"]
+
+    def put_chunk(self, url: str, start: int, end: int, **extra):
+        return self.client.put(
+            url,
+            self.content[start : end + 1],
+            content_type="application/octet-stream",
+            HTTP_CONTENT_RANGE=f"bytes {start}-{end}/{len(self.content)}",
+            **extra,
+        )
+
+    def test_user_can_upload_image_in_chunks(self):
+        url = self.create_session()
+        middle = len(self.content) // 2
+
+        response = self.put_chunk(url, middle, len(self.content) - 1)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["offset"], 0)
+
+        response = self.put_chunk(url, 0, middle - 1)
+        self.assertEqual(response.data["offset"], len(self.content))
+        self.assertTrue(response.data["complete"])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(url + "finalize/")
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(response.data["title"], "test")
+        self.assertEqual(len(response.data["thumbnail_jobs"]), 1)
+
+        image = ImageModel.objects.get(id=response.data["id"])
+        with image.image.open("rb") as file:
+            self.assertEqual(file.read(), self.content)
+        self.assertFalse(UploadSession.objects.exists())
+        self.assertEqual(os.listdir(TEST_MEDIA_ROOT + "uploads/"), [])
+
+    def test_user_can_resume_upload_from_offset(self):
+        url = self.create_session()
+        self.put_chunk(url, 0, 99)
+        self.put_chunk(url, 0, 99)  # retried chunk
+
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["offset"], 100)
+        self.assertEqual(response.data["received_ranges"], [[0, 100]])
+        self.assertFalse(response.data["complete"])
+
+    def test_incomplete_upload_cannot_be_finalized(self):
+        url = self.create_session()
+        self.put_chunk(url, 0, 99)
+
+        response = self.client.post(url + "finalize/")
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+
+    def test_chunk_requires_valid_content_range(self):
+        url = self.create_session()
+
+        response = self.client.put(
+            url, self.content[:10], content_type="application/octet-stream"
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        response = self.client.put(
+            url,
+            self.content[:10],
+            content_type="application/octet-stream",
+            HTTP_CONTENT_RANGE=f"bytes 0-19/{len(self.content)}",
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        response = self.client.put(
+            url,
+            b"0" * 10,
+            content_type="application/octet-stream",
+            HTTP_CONTENT_RANGE=f"bytes {len(self.content)}-{len(self.content) + 9}/*",
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_invalid_file_cannot_be_finalized(self):
+        self.content = b"not an image"
+        url = self.create_session()
+        self.put_chunk(url, 0, len(self.content) - 1)
+
+        response = self.client.post(url + "finalize/")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(ImageModel.objects.exists())
+
+    @override_settings(IMAGE_UPLOAD_MAX_PIXELS=100 * 100)
+    def test_image_with_too_many_pixels_cannot_be_finalized(self):
+        url = self.create_session()
+        self.put_chunk(url, 0, len(self.content) - 1)
+
+        response = self.client.post(url + "finalize/")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data["image"], ["Image dimensions are too large."])
+        self.assertFalse(ImageModel.objects.exists())
+
+    def test_session_requires_supported_filename(self):
+        response = self.client.post(
+            self.upload_list_url, {"title": "test", "filename": "test.gif", "size": 10}
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_user_cannot_access_other_users_session(self):
+        url = self.create_session()
+        self.client.force_login(user=self.other_user)
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_user_can_abort_upload(self):
+        url = self.create_session()
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.delete(url)
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertFalse(UploadSession.objects.exists())
+        self.assertEqual(os.listdir(TEST_MEDIA_ROOT + "uploads/"), [])
@@ -0,0 +1,116 @@
+import time
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+
+from src.apps.accounts.models import UserAccount
+from src.apps.images.models import ThumbnailSize
+from src.apps.memberships import profiles
+from src.apps.memberships.models import MembershipType
+from src.apps.memberships.profiles import (
+    NO_ACCOUNT_PROFILE,
+    clear_membership_profiles,
+    get_membership_profile,
+)
+
+User = get_user_model()
+
+
+class TestMembershipProfile(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.thumbnail_200px = ThumbnailSize.objects.create(height=200)
+        cls.thumbnail_400px = ThumbnailSize.objects.create(height=400)
+        cls.basic_membership = MembershipType.objects.create(
+            name="Basic", contains_original_link=False, generates_expiring_link=False
+        )
+        cls.enterprise_membership = MembershipType.objects.create(
+            name="Enterprise", contains_original_link=True, generates_expiring_link=True
+        )
+        cls.basic_membership.thumbnail_sizes.add(cls.thumbnail_200px)
+        cls.enterprise_membership.thumbnail_sizes.add(
+            cls.thumbnail_200px, cls.thumbnail_400px
+        )
+
+        cls.user = User.objects.create(username="testuser")
+        cls.user_account = UserAccount.objects.create(
+            user=cls.user, membership_type=cls.enterprise_membership
+        )
+        cls.user_no_account = User.objects.create(username="invaliduser")
+
+    def setUp(self):
+        clear_membership_profiles()
+
+    def test_profile_reflects_membership(self):
+        profile = get_membership_profile(self.user)
+        self.assertTrue(profile.has_account)
+        self.assertEqual(profile.account_id, self.user_account.id)
+        self.assertTrue(profile.contains_original_link)
+        self.assertTrue(profile.generates_expiring_link)
+        self.assertEqual(profile.thumbnail_heights, (200, 400))
+
+    def test_user_without_account_gets_empty_profile(self):
+        self.assertIs(get_membership_profile(self.user_no_account), NO_ACCOUNT_PROFILE)
+        self.assertFalse(NO_ACCOUNT_PROFILE.has_account)
+
+    def test_profile_is_immutable(self):
+        profile = get_membership_profile(self.user)
+        with self.assertRaises(AttributeError):
+            profile.generates_expiring_link = False
+        with self.assertRaises(AttributeError):
+            profile.extra = True
+
+    def test_profile_is_cached(self):
+        get_membership_profile(self.user)
+        with self.assertNumQueries(0):
+            get_membership_profile(self.user)
+
+    def test_profile_is_invalidated_when_account_changes(self):
+        get_membership_profile(self.user)
+        self.user_account.membership_type = self.basic_membership
+        self.user_account.save()
+
+        profile = get_membership_profile(self.user)
+        self.assertFalse(profile.contains_original_link)
+        self.assertEqual(profile.thumbnail_heights, (200,))
+
+    def test_profile_is_invalidated_when_membership_changes(self):
+        get_membership_profile(self.user)
+        self.enterprise_membership.generates_expiring_link = False
+        self.enterprise_membership.save()
+
+        self.assertFalse(get_membership_profile(self.user).generates_expiring_link)
+
+    def test_profile_is_invalidated_when_thumbnail_sizes_change(self):
+        get_membership_profile(self.user)
+        self.enterprise_membership.thumbnail_sizes.remove(self.thumbnail_400px)
+
+        self.assertEqual(get_membership_profile(self.user).thumbnail_heights, (200,))
+
+    def test_profile_is_invalidated_when_thumbnail_size_changes(self):
+        get_membership_profile(self.user)
+        self.thumbnail_400px.height = 500
+        self.thumbnail_400px.save()
+
+        self.assertEqual(
+            get_membership_profile(self.user).thumbnail_heights, (200, 500)
+        )
+
+    @override_settings(MEMBERSHIP_PROFILE_CACHE_SIZE=1)
+    def test_least_recently_used_profile_is_evicted(self):
+        get_membership_profile(self.user)
+        get_membership_profile(self.user_no_account)
+        self.assertEqual(list(profiles._profiles), [self.user_no_account.pk])
+        with self.assertNumQueries(0):
+            get_membership_profile(self.user_no_account)
+        get_membership_profile(self.user)
+        self.assertEqual(list(profiles._profiles), [self.user.pk])
+
+    def test_expired_profiles_are_evicted(self):
+        get_membership_profile(self.user)
+        later = time.monotonic() + settings.MEMBERSHIP_PROFILE_TTL + 1
+        with mock.patch.object(profiles.time, "monotonic", return_value=later):
+            get_membership_profile(self.user_no_account)
+        self.assertEqual(list(profiles._profiles), [self.user_no_account.pk])
@@ -61,3 +61,40 @@ class TestMembershipTypeViewset(APITestCase):
         response = self.client.get(self.membership_type_detail_url)
 
         self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class TestMembershipTypeViewsetQueries(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username="testuser")
+        cls.user_account = UserAccount.objects.create(user=cls.user)
+        thumbnail_sizes = [
+            ThumbnailSize.objects.create(height=height) for height in (200, 400, 600)
+        ]
+        for index in range(10):
+            membership_type = MembershipType.objects.create(name=f"test {index}")
+            membership_type.thumbnail_sizes.add(*thumbnail_sizes)
+
+        cls.membership_type_list_url = reverse("memberships:membership-list")
+        cls.membership_type_detail_url = reverse(
+            "memberships:membership-detail",
+            kwargs={"pk": membership_type.id},
+        )
+
+    def setUp(self):
+        self.client.force_login(user=self.user)
+
+    def test_membership_type_list_query_count_does_not_depend_on_page_size(self):
+        # session, user, count, membership types, thumbnail sizes
+        for limit in (1, 10):
+            with self.assertNumQueries(5):
+                response = self.client.get(
+                    self.membership_type_list_url, {"limit": limit}
+                )
+            self.assertEqual(len(response.data["results"]), limit)
+
+    def test_membership_type_detail_query_count(self):
+        # session, user, membership type, thumbnail sizes
+        with self.assertNumQueries(4):
+            response = self.client.get(self.membership_type_detail_url)
+        self.assertEqual(len(response.data["thumbnail_sizes"]), 3)